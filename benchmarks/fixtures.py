@@ -0,0 +1,302 @@
+"""Generate synthetic fixtures for the benchmarks.
+
+Every fixture is generated offline from a seeded random number generator, so
+the same size always produces the same data.  Each generator also returns
+what is needed to compute reference results for the script it exercises.
+"""
+import os
+
+import numpy
+from osgeo import gdal
+from osgeo import osr
+
+gdal.UseExceptions()
+
+WGS84_SRS = osr.SpatialReference()
+WGS84_SRS.ImportFromEPSG(4326)
+WGS84_WKT = WGS84_SRS.ExportToWkt()
+del WGS84_SRS
+
+# A UTM projection for fixtures that need linear units.
+UTM_SRS = osr.SpatialReference()
+UTM_SRS.ImportFromEPSG(32638)
+UTM_WKT = UTM_SRS.ExportToWkt()
+del UTM_SRS
+
+
+def write_raster(array, target_path, nodata=None, pixel_size=1.0,
+                 origin=(0.0, 0.0), projection_wkt=WGS84_WKT):
+    """Write an array to a single-band GeoTIFF.
+
+    Args:
+        array (numpy.ndarray): The 2D array to write.
+        target_path (str): The path to write to.
+        nodata (number): The nodata value, or ``None``.
+        pixel_size (float): The width and height of a pixel.
+        origin (tuple): The x and y coordinates of the upper left corner.
+        projection_wkt (str): The projection of the raster.
+
+    Returns:
+        str: ``target_path``.
+    """
+    gdal_type = gdal.GDT_Float32
+    if numpy.issubdtype(array.dtype, numpy.integer):
+        gdal_type = gdal.GDT_Int32
+    raster = gdal.GetDriverByName('GTiff').Create(
+        target_path, array.shape[1], array.shape[0], 1, gdal_type,
+        options=['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256'])
+    raster.SetProjection(projection_wkt)
+    raster.SetGeoTransform(
+        [origin[0], pixel_size, 0, origin[1], 0, -pixel_size])
+    band = raster.GetRasterBand(1)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    band.WriteArray(array)
+    band = None
+    raster = None
+    return target_path
+
+
+def link_dataset(target_dir, n_rows, n_cols, n_sources, seed=0):
+    """Create a fake Link et al (2020) dataset.
+
+    The matrix has one row per target grid cell and one column per source,
+    with most values zero or negative as in the real data.
+
+    Args:
+        target_dir (str): The directory to write the dataset to.
+        n_rows (int): The number of rows of the target grid.
+        n_cols (int): The number of columns of the target grid.
+        n_sources (int): The number of source basins or cells.
+        seed (int): The random seed.
+
+    Returns:
+        dict: The paths of the ``matrix``, ``basin_ids``,
+            ``considered_cells`` and ``sample_raster`` files, and the
+            ``matrix`` array itself as ``matrix_array``.
+    """
+    rng = numpy.random.default_rng(seed)
+    matrix = rng.gamma(0.5, 10, (n_rows * n_cols, n_sources)).astype(
+        numpy.float32)
+    matrix[rng.random(matrix.shape) < 0.8] = 0
+    matrix[rng.random(matrix.shape) < 0.01] = -1
+
+    # Basin IDs are large, arbitrary integers like those in WaterGAP.
+    basin_ids = rng.choice(
+        numpy.arange(1000000, 9999999), n_sources, replace=False)
+    # Considered cells are the (rows, cols) of every source cell.
+    cell_indexes = rng.choice(n_rows * n_cols, n_sources, replace=False)
+    considered_cells = numpy.stack(numpy.divmod(cell_indexes, n_cols))
+
+    paths = {
+        'matrix': os.path.join(target_dir, 'matrix.npy'),
+        'basin_ids': os.path.join(target_dir, 'Basin_IDs.npy'),
+        'considered_cells': os.path.join(target_dir, 'considered_cells.npy'),
+        'sample_raster': os.path.join(target_dir, 'sample.tif'),
+    }
+    numpy.save(paths['matrix'], matrix)
+    numpy.save(paths['basin_ids'], basin_ids)
+    numpy.save(paths['considered_cells'], considered_cells)
+    write_raster(numpy.zeros((n_rows, n_cols), dtype=numpy.float32),
+                 paths['sample_raster'], pixel_size=360 / n_cols,
+                 origin=(-180, 90))
+    paths['matrix_array'] = matrix
+    return paths
+
+
+def landcover_pair(target_dir, size, change_rate, n_classes=10, seed=0):
+    """Create a pair of landcover rasters with a known rate of change.
+
+    Args:
+        target_dir (str): The directory to write the rasters to.
+        size (int): The width and height of the rasters.
+        change_rate (float): The fraction of pixels that change class.
+        n_classes (int): The number of landcover classes.
+        seed (int): The random seed.
+
+    Returns:
+        dict: The ``from`` and ``to`` raster paths and arrays, and their
+            ``nodata`` value.
+    """
+    rng = numpy.random.default_rng(seed)
+    nodata = 255
+    # Blocky classes, as landcover tends to be.
+    coarse = rng.integers(1, n_classes + 1, (size // 8 + 1, size // 8 + 1))
+    from_array = numpy.kron(coarse, numpy.ones((8, 8), dtype=int))[
+        :size, :size].astype(numpy.int32)
+    to_array = from_array.copy()
+    changed = rng.random(from_array.shape) < change_rate
+    to_array[changed] = rng.integers(1, n_classes + 1, changed.sum())
+    # A nodata margin, partly in both rasters and partly in one of them.
+    from_array[:, :size // 32] = nodata
+    to_array[:, :size // 64] = nodata
+
+    from_path = write_raster(
+        from_array, os.path.join(target_dir, 'lulc_from.tif'), nodata,
+        pixel_size=30, origin=(400000, 4500000), projection_wkt=UTM_WKT)
+    to_path = write_raster(
+        to_array, os.path.join(target_dir, 'lulc_to.tif'), nodata,
+        pixel_size=30, origin=(400000, 4500000), projection_wkt=UTM_WKT)
+    return {'from': from_path, 'to': to_path, 'from_array': from_array,
+            'to_array': to_array, 'nodata': nodata}
+
+
+def _write_string_attribute(md_array, name, value):
+    """Write a string attribute to a variable of a multidimensional dataset."""
+    attribute = md_array.CreateAttribute(
+        name, [], gdal.ExtendedDataType.CreateString())
+    attribute.Write(value)
+
+
+def daily_netcdf(target_path, variable, units, n_years, n_rows, n_cols,
+                 first_year=1850, seed=0):
+    """Create a NetCDF of daily values on a ``noleap`` calendar.
+
+    The file is written through GDAL's multidimensional API, with the
+    ``time``, ``lat`` and ``lon`` coordinate variables and attributes of a
+    CF NetCDF, and then read back the way the converter opens it, to check
+    that the time axis, units and values come through.
+
+    Args:
+        target_path (str): The path to write the NetCDF to.
+        variable (str): The name of the variable, such as ``'pre'``.
+        units (str): The units of the variable, such as ``'mm d-1'``.
+        n_years (int): The number of years of daily data.
+        n_rows (int): The number of rows of the grid.
+        n_cols (int): The number of columns of the grid.
+        first_year (int): The first year of data.
+        seed (int): The random seed.
+
+    Returns:
+        numpy.ndarray: The ``(day, y, x)`` array of values written, with
+            rows north-up.
+
+    Raises:
+        RuntimeError: When the NetCDF doesn't read back as written.
+    """
+    rng = numpy.random.default_rng(seed)
+    n_days = 365 * n_years
+    # Mostly dry days, with gamma-distributed rain on the others.
+    values = rng.gamma(0.7, 6, (n_days, n_rows, n_cols)).astype(
+        numpy.float32)
+    values[rng.random(values.shape) < 0.6] = 0
+
+    dataset = gdal.GetDriverByName('netCDF').CreateMultiDimensional(
+        target_path, [], ['FORMAT=NC4'])
+    group = dataset.GetRootGroup()
+    float64 = gdal.ExtendedDataType.Create(gdal.GDT_Float64)
+    dimensions = {}
+    coordinates = {
+        'time': (gdal.DIM_TYPE_TEMPORAL, numpy.arange(n_days) + 0.5, {
+            'units': f'days since {first_year}-1-1',
+            'calendar': 'noleap', 'standard_name': 'time'}),
+        # Rows are north-up, so latitudes decrease.
+        'lat': (gdal.DIM_TYPE_HORIZONTAL_Y,
+                90 - (numpy.arange(n_rows) + 0.5) * 180 / n_rows, {
+                    'units': 'degrees_north', 'standard_name': 'latitude'}),
+        'lon': (gdal.DIM_TYPE_HORIZONTAL_X,
+                -180 + (numpy.arange(n_cols) + 0.5) * 360 / n_cols, {
+                    'units': 'degrees_east', 'standard_name': 'longitude'}),
+    }
+    for name, (dimension_type, coordinate_values, attributes) in (
+            coordinates.items()):
+        dimension = group.CreateDimension(
+            name, dimension_type, None, len(coordinate_values))
+        # A variable named after its dimension is its coordinate variable.
+        coordinate = group.CreateMDArray(name, [dimension], float64)
+        coordinate.WriteArray(coordinate_values)
+        for attribute_name, value in attributes.items():
+            _write_string_attribute(coordinate, attribute_name, value)
+        dimensions[name] = dimension
+    data = group.CreateMDArray(
+        variable, [dimensions['time'], dimensions['lat'], dimensions['lon']],
+        gdal.ExtendedDataType.Create(gdal.GDT_Float32))
+    _write_string_attribute(data, 'units', units)
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(WGS84_WKT)
+    data.SetSpatialRef(srs)
+    data.WriteArray(values)
+    data = None
+    group = None
+    dataset = None
+
+    # Read the file back the way the converter opens it.
+    dataset = gdal.Open(f'NETCDF:"{target_path}"', gdal.GA_ReadOnly)
+    problems = []
+    if dataset.RasterCount != n_days:
+        problems.append(f'{dataset.RasterCount} bands, not {n_days}')
+    if dataset.GetMetadataItem('time#calendar') != 'noleap':
+        problems.append('no noleap calendar')
+    if not dataset.GetMetadataItem('NETCDF_DIM_time_VALUES'):
+        problems.append('no time values')
+    if dataset.GetMetadataItem(f'{variable}#units') != units:
+        problems.append(f'no {variable}#units of {units}')
+    for day_index in (0, n_days - 1):
+        if not numpy.array_equal(
+                dataset.GetRasterBand(day_index + 1).ReadAsArray(),
+                values[day_index]):
+            problems.append(f'the values of day {day_index} differ')
+    dataset = None
+    if problems:
+        raise RuntimeError(
+            f'{target_path} does not read back as written: '
+            f"{'; '.join(problems)}")
+    return values
+
+
+def zones_and_monthly_rasters(target_dir, size, n_zones=8, seed=0):
+    """Create a raster of zones and 12 monthly rasters on the same grid.
+
+    Args:
+        target_dir (str): The directory to write the rasters to.
+        size (int): The width and height of the rasters.
+        n_zones (int): The number of zones.
+        seed (int): The random seed.
+
+    Returns:
+        dict: The ``zones`` raster path and array, the ``zones_nodata``
+            value, and the paths and arrays of the ``monthly`` rasters.
+    """
+    rng = numpy.random.default_rng(seed)
+    zones_nodata = 0
+    coarse = rng.integers(1, n_zones + 1, (size // 16 + 1, size // 16 + 1))
+    zones = numpy.kron(coarse, numpy.ones((16, 16), dtype=int))[
+        :size, :size].astype(numpy.int32)
+    zones[:size // 10] = zones_nodata
+    zones_path = write_raster(
+        zones, os.path.join(target_dir, 'zones.tif'), zones_nodata,
+        pixel_size=0.01)
+
+    monthly_paths = []
+    monthly_arrays = []
+    for month in range(1, 13):
+        array = rng.gamma(2, 3, (size, size)).astype(numpy.float32)
+        monthly_arrays.append(array)
+        monthly_paths.append(write_raster(
+            array, os.path.join(
+                target_dir, f'pr-2000-2000-{month:02d}-rain-events.tif'),
+            pixel_size=0.01))
+    return {'zones': zones_path, 'zones_array': zones,
+            'zones_nodata': zones_nodata, 'monthly': monthly_paths,
+            'monthly_arrays': monthly_arrays}
+
+
+def dem(target_path, size, seed=0):
+    """Create a synthetic DEM of a few valleys with noise.
+
+    Args:
+        target_path (str): The path to write the DEM to.
+        size (int): The width and height of the DEM.
+        seed (int): The random seed.
+
+    Returns:
+        numpy.ndarray: The DEM array.
+    """
+    rng = numpy.random.default_rng(seed)
+    rows, cols = numpy.mgrid[0:size, 0:size] / size
+    dem_array = (
+        500 * rows + 200 * numpy.abs(numpy.sin(3 * numpy.pi * cols)) +
+        rng.uniform(0, 5, (size, size))).astype(numpy.float32)
+    write_raster(dem_array, target_path, -9999, pixel_size=30,
+                 origin=(400000, 4500000), projection_wkt=UTM_WKT)
+    return dem_array
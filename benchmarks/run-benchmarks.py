@@ -0,0 +1,550 @@
+"""Benchmark the processing scripts on synthetic data.
+
+Fixtures are generated offline (see ``fixtures.py``), each script is timed at
+several sizes and its outputs are checked against reference results computed
+directly with numpy.  Results are written to ``results/<commit>.json`` so
+that runs on different commits can be compared.
+
+Usage:
+    python run-benchmarks.py run [--size small] [--benchmark link-run]
+    python run-benchmarks.py compare <commit or json> <commit or json>
+
+See ``python run-benchmarks.py --help`` for more information.
+"""
+import argparse
+import csv
+import datetime
+import importlib
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+from osgeo import gdal
+
+import fixtures
+
+logging.basicConfig(level=logging.WARNING)
+LOGGER = logging.getLogger(os.path.basename(__file__))
+gdal.UseExceptions()
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+# The rapid_es module each benchmark exercises.
+MODULES = {
+    'link': 'link_extract',
+    'lulc': 'lulc_transition',
+    'dem': 'dem_preprocess',
+    'esm': 'esm_convert',
+    'zonal': 'zonal_aggregation',
+}
+
+# Days per month of the noleap calendar the NetCDF fixtures use.
+NOLEAP_DAYS_PER_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def load_module(name):
+    """Import one of the processing modules of the ``rapid_es`` package.
+
+    The package is imported from this checkout, so that the code being
+    benchmarked is the code checked out, even if another version is
+    installed.
+
+    Args:
+        name (str): A key of ``MODULES``.
+
+    Returns:
+        module: The imported module.
+    """
+    src_dir = os.path.join(REPO_DIR, 'src')
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    return importlib.import_module(f'rapid_es.{MODULES[name]}')
+
+
+def _read_raster(path):
+    """Read the first band of a raster and its nodata value."""
+    raster = gdal.OpenEx(path, gdal.OF_RASTER)
+    band = raster.GetRasterBand(1)
+    array = band.ReadAsArray()
+    nodata = band.GetNoDataValue()
+    band = None
+    raster = None
+    return array, nodata
+
+
+def _read_monthly_table(csv_path):
+    """Read a ``cz_id,jan..dec`` table into a dict of zone to 12 values."""
+    with open(csv_path) as table:
+        return {int(float(row[0])): numpy.array(row[1:], dtype=float)
+                for row in list(csv.reader(table))[1:]}
+
+
+def _assert_close(actual, expected, label, rtol=1e-4, atol=1e-4):
+    """Raise an AssertionError if two arrays are not close."""
+    if not numpy.allclose(actual, expected, rtol=rtol, atol=atol):
+        raise AssertionError(
+            f'{label}: max difference '
+            f'{numpy.nanmax(numpy.abs(actual - expected))}')
+
+
+def setup_link_run(fixture_dir, n_rows, n_cols, n_sources, n_ids):
+    """Benchmark ``run`` of the Link et al (2020) script."""
+    link = load_module('link')
+    dataset = fixtures.link_dataset(fixture_dir, n_rows, n_cols, n_sources)
+    ids = sorted(numpy.random.default_rng(1).choice(
+        n_sources, n_ids, replace=False).tolist())
+
+    matrix = dataset['matrix_array'][:, ids]
+    expected = numpy.where(matrix > 0, matrix, 0).sum(axis=1).reshape(
+        n_rows, n_cols)
+    expected[~(matrix > 0).any(axis=1).reshape(n_rows, n_cols)] = (
+        link.TARGET_NODATA)
+
+    def run(workspace):
+        target_path = os.path.join(workspace, 'target.tif')
+        shutil.copyfile(dataset['sample_raster'], target_path)
+        link.run(ids, dataset['matrix'], target_path)
+
+    def check(workspace):
+        actual, _ = _read_raster(os.path.join(workspace, 'target.tif'))
+        _assert_close(actual, expected, 'where-water-lands raster')
+
+    return run, check
+
+
+def setup_link_ids(fixture_dir, n_rows, n_cols, n_sources, n_ids):
+    """Benchmark converting basin and cell IDs to Link et al table IDs."""
+    link = load_module('link')
+    dataset = fixtures.link_dataset(fixture_dir, n_rows, n_cols, n_sources)
+    table_ids = sorted(numpy.random.default_rng(1).choice(
+        n_sources, n_ids, replace=False).tolist())
+    basin_ids = numpy.load(dataset['basin_ids'])[table_ids]
+    rows, cols = numpy.load(dataset['considered_cells'])[:, table_ids]
+    # The script assumes the 240 columns of the Link et al grid.
+    cell_indexes = (rows * 240 + cols).tolist()
+    results = {}
+
+    def run(workspace):
+        results['basins'] = link.convert_vector_basin_ids_to_internal(
+            dataset['basin_ids'], basin_ids)
+        results['cells'] = link.convert_cell_index_to_internal(
+            dataset['considered_cells'], cell_indexes)
+
+    def check(workspace):
+        if results['basins'] != set(table_ids):
+            raise AssertionError('Basin IDs were not converted correctly')
+        if not set(table_ids) <= results['cells']:
+            raise AssertionError('Cell indexes were not converted correctly')
+
+    return run, check
+
+
+def setup_lulc_transition(fixture_dir, size, change_rate):
+    """Benchmark ``lulc_transition_matrix``."""
+    lulc = load_module('lulc')
+    pair = fixtures.landcover_pair(fixture_dir, size, change_rate)
+    pairs, expected_counts = numpy.unique(
+        numpy.stack([pair['from_array'].ravel(), pair['to_array'].ravel()]),
+        axis=1, return_counts=True)
+    expected = {(int(from_value), int(to_value)): int(count)
+                for (from_value, to_value), count in zip(
+                    pairs.T, expected_counts)}
+    both_nodata = ((pair['from_array'] == pair['nodata']) &
+                   (pair['to_array'] == pair['nodata']))
+
+    def run(workspace):
+        lulc.lulc_transition_matrix(
+            pair['from'], pair['to'],
+            os.path.join(workspace, 'transition_raster.tif'),
+            os.path.join(workspace, 'transition_raster_table.csv'),
+            os.path.join(workspace, 'transition_matrix.csv'))
+
+    def check(workspace):
+        with open(os.path.join(workspace, 'transition_matrix.csv')) as table:
+            rows = list(csv.reader(table))
+        to_values = [int(value) for value in rows[0][1:]]
+        for row in rows[1:]:
+            for to_value, count in zip(to_values, row[1:]):
+                key = (int(row[0]), to_value)
+                if int(count) != expected.get(key, 0):
+                    raise AssertionError(
+                        f'Transition {key}: {count} != {expected.get(key)}')
+        transitions, _ = _read_raster(
+            os.path.join(workspace, 'transition_raster.tif'))
+        if not numpy.array_equal(transitions == -1, both_nodata):
+            raise AssertionError('Transition raster nodata is wrong')
+        if not numpy.array_equal(
+                transitions == 0,
+                (pair['from_array'] == pair['to_array']) & ~both_nodata):
+            raise AssertionError('Unchanged pixels are wrong')
+
+    return run, check
+
+
+def _expected_monthly(values, n_years):
+    """Sum each month of noleap daily values into ``(year, month, y, x)``."""
+    month_ends = numpy.cumsum(NOLEAP_DAYS_PER_MONTH)
+    by_year = values.reshape((n_years, 365) + values.shape[1:])
+    return numpy.stack([
+        numpy.stack([
+            by_year[year_index, end - days:end].sum(axis=0)
+            for days, end in zip(NOLEAP_DAYS_PER_MONTH, month_ends)])
+        for year_index in range(n_years)])
+
+
+def setup_esm_convert(fixture_dir, mode, n_years, n_rows, n_cols,
+                      n_workers=1):
+    """Benchmark a mode of the daily ESM NetCDF converter."""
+    esm = load_module('esm')
+    variable, units = {
+        'precip': ('pre', 'mm d-1'), 'pet': ('pet', 'mm d-1')}[mode]
+    netcdf_path = os.path.join(fixture_dir, f'esm_{variable}.nc')
+    values = fixtures.daily_netcdf(
+        netcdf_path, variable, units, n_years, n_rows, n_cols)
+    years = list(range(1850, 1850 + n_years))
+    monthly_sums = _expected_monthly(values, n_years)
+    if mode == 'precip':
+        expected = {None: monthly_sums.sum(axis=0) / n_years,
+                    'rain-events': _expected_monthly(
+                        (values > esm.RAIN_EVENT_THRESHOLD).astype(
+                            numpy.float32), n_years).sum(axis=0) / n_years}
+    else:
+        expected = {None: monthly_sums.sum(axis=0) / (
+            numpy.array(NOLEAP_DAYS_PER_MONTH)[:, None, None] * n_years)}
+
+    def run(workspace):
+        if mode == 'precip':
+            esm.precipitation(netcdf_path, [years], workspace, n_workers)
+        else:
+            esm.potential_evapotranspiration(
+                netcdf_path, [years], workspace, n_workers)
+
+    def check(workspace):
+        for suffix, expected_months in expected.items():
+            for month_index in range(12):
+                actual, _ = _read_raster(esm._get_filepath(
+                    netcdf_path, years, month_index + 1, suffix=suffix,
+                    workspace=workspace))
+                _assert_close(actual, expected_months[month_index],
+                              f'{mode} {suffix or ""} month {month_index+1}')
+
+    return run, check
+
+
+def setup_zonal_aggregation(fixture_dir, size, blockwise=False):
+    """Benchmark the climate zone aggregation of monthly rain events."""
+    zonal = load_module('zonal')
+    data = fixtures.zones_and_monthly_rasters(fixture_dir, size)
+    valid_zones = data['zones_array'] != data['zones_nodata']
+    expected = {
+        int(zone): numpy.array([
+            array[data['zones_array'] == zone].mean()
+            for array in data['monthly_arrays']])
+        for zone in numpy.unique(data['zones_array'][valid_zones])}
+
+    def run(workspace):
+        zonal.aggregate_by_zone(
+            os.path.join(workspace, 'zonal.csv'), data['zones'],
+            data['monthly'], os.path.join(workspace, 'tmp'),
+            blockwise=blockwise,
+            cache_dir=os.path.join(workspace, 'cache'))
+
+    def check(workspace):
+        actual = _read_monthly_table(os.path.join(workspace, 'zonal.csv'))
+        if sorted(actual) != sorted(expected):
+            raise AssertionError(
+                f'Zones {sorted(actual)} != {sorted(expected)}')
+        for zone, means in expected.items():
+            _assert_close(actual[zone], means, f'zone {zone}')
+
+    return run, check
+
+
+def setup_dem_routing(fixture_dir, size, routing_method='d8'):
+    """Benchmark the routing stages of ``preprocess_dem``."""
+    preprocess_dem = load_module('dem')
+    routing = preprocess_dem.pygeoprocessing.routing
+    flow_dir_func, flow_accum_func, extract_streams_func = (
+        preprocess_dem._get_routing_functions(routing_method))
+    dem_path = os.path.join(fixture_dir, 'dem.tif')
+    dem_array = fixtures.dem(dem_path, size)
+    stage_seconds = {}
+
+    def run(workspace):
+        paths = {name: os.path.join(workspace, f'{name}.tif') for name in
+                 ('filled', 'flowdir', 'flowaccum', 'streams')}
+        if routing_method == 'd8':
+            stream_args = [(paths['flowaccum'], 1), 100, paths['streams']]
+        else:
+            stream_args = [(paths['flowaccum'], 1), (paths['flowdir'], 1),
+                           100, paths['streams']]
+        for stage_name, func, args in (
+                ('fill_pits', routing.fill_pits,
+                 [(dem_path, 1), paths['filled']]),
+                ('flow_dir', flow_dir_func,
+                 [(paths['filled'], 1), paths['flowdir']]),
+                ('flow_accum', flow_accum_func,
+                 [(paths['flowdir'], 1), paths['flowaccum']]),
+                ('streams', extract_streams_func, stream_args)):
+            start_time = time.perf_counter()
+            func(*args)
+            stage_seconds[stage_name] = time.perf_counter() - start_time
+        return dict(stage_seconds)
+
+    def check(workspace):
+        filled, _ = _read_raster(os.path.join(workspace, 'filled.tif'))
+        if numpy.any(filled < dem_array - 1e-3):
+            raise AssertionError('Pit filling lowered the DEM')
+        flow_accum, _ = _read_raster(
+            os.path.join(workspace, 'flowaccum.tif'))
+        if flow_accum.min() < 1 or flow_accum.max() > size * size:
+            raise AssertionError(
+                f'Flow accumulation out of range: {flow_accum.min()} to '
+                f'{flow_accum.max()}')
+        streams, _ = _read_raster(os.path.join(workspace, 'streams.tif'))
+        if not numpy.any(streams == 1):
+            raise AssertionError('No streams were extracted')
+
+    return run, check
+
+
+# Each benchmark has a setup function and the keyword arguments of each size.
+# A setup function generates fixtures and returns a ``run`` function to time
+# and a ``check`` function that raises an AssertionError if the outputs of
+# ``run`` don't match the reference results.  Any other exception fails only
+# the benchmark that raised it.
+BENCHMARKS = {
+    'link-run': (setup_link_run, {
+        'small': {'n_rows': 30, 'n_cols': 60, 'n_sources': 200,
+                  'n_ids': 10},
+        'large': {'n_rows': 120, 'n_cols': 240, 'n_sources': 2000,
+                  'n_ids': 100},
+    }),
+    'link-ids': (setup_link_ids, {
+        'small': {'n_rows': 30, 'n_cols': 240, 'n_sources': 2000,
+                  'n_ids': 100},
+        'large': {'n_rows': 120, 'n_cols': 240, 'n_sources': 20000,
+                  'n_ids': 2000},
+    }),
+    'lulc-transition': (setup_lulc_transition, {
+        'small': {'size': 256, 'change_rate': 0.05},
+        'large': {'size': 1024, 'change_rate': 0.3},
+    }),
+    'esm-precip': (setup_esm_convert, {
+        'small': {'mode': 'precip', 'n_years': 2, 'n_rows': 18,
+                  'n_cols': 36},
+        'large': {'mode': 'precip', 'n_years': 10, 'n_rows': 90,
+                  'n_cols': 180},
+    }),
+    'esm-pet': (setup_esm_convert, {
+        'small': {'mode': 'pet', 'n_years': 2, 'n_rows': 18, 'n_cols': 36},
+        'large': {'mode': 'pet', 'n_years': 10, 'n_rows': 90,
+                  'n_cols': 180},
+    }),
+    'zonal-aggregation': (setup_zonal_aggregation, {
+        'small': {'size': 256},
+        'large': {'size': 2048},
+    }),
+    'zonal-aggregation-blockwise': (setup_zonal_aggregation, {
+        'small': {'size': 256, 'blockwise': True},
+        'large': {'size': 2048, 'blockwise': True},
+    }),
+    'dem-routing': (setup_dem_routing, {
+        'small': {'size': 256},
+        'large': {'size': 1024},
+    }),
+}
+
+
+def _get_commit():
+    """Get the short hash of the checked out commit, marked if dirty."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=REPO_DIR, capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if status else commit
+
+
+def run_benchmarks(benchmark_names, size_names, n_repeats, results_path):
+    """Run benchmarks and write their results to a JSON file.
+
+    Args:
+        benchmark_names (list): The keys of ``BENCHMARKS`` to run.
+        size_names (list): The sizes to run each benchmark at.
+        n_repeats (int): How many times to time each benchmark.  The fastest
+            time is reported.
+        results_path (str): The JSON file to write results to.
+
+    Returns:
+        dict: The results.
+    """
+    results = {
+        'commit': _get_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'gdal': gdal.__version__,
+        'numpy': numpy.__version__,
+        'benchmarks': {},
+    }
+    for benchmark_name in benchmark_names:
+        setup_func, sizes = BENCHMARKS[benchmark_name]
+        for size_name in size_names:
+            if size_name not in sizes:
+                continue
+            fixture_dir = tempfile.mkdtemp(prefix=f'{benchmark_name}-')
+            timings = []
+            stages = None
+            error = None
+            try:
+                run, check = setup_func(fixture_dir, **sizes[size_name])
+                for _ in range(n_repeats):
+                    # Every repeat gets a fresh workspace, so no repeat
+                    # benefits from the caches of another.
+                    workspace = tempfile.mkdtemp(dir=fixture_dir)
+                    try:
+                        start_time = time.perf_counter()
+                        run_stages = run(workspace)
+                        timings.append(time.perf_counter() - start_time)
+                        # Stage timings are reported for the fastest repeat.
+                        if timings[-1] == min(timings):
+                            stages = run_stages
+                        check(workspace)
+                    except AssertionError as assertion_error:
+                        error = str(assertion_error)
+                    finally:
+                        shutil.rmtree(workspace, ignore_errors=True)
+            except Exception as exception:
+                # A benchmark that crashes fails on its own, and the rest
+                # still run and are written to the results.
+                LOGGER.exception(f'{benchmark_name} {size_name} failed')
+                error = f'{type(exception).__name__}: {exception}'
+            finally:
+                shutil.rmtree(fixture_dir, ignore_errors=True)
+
+            result = {
+                'seconds': min(timings) if timings else None,
+                'all_seconds': timings,
+                'passed': error is None,
+            }
+            if stages:
+                result['stages'] = stages
+            if error:
+                result['error'] = error
+            results['benchmarks'].setdefault(
+                benchmark_name, {})[size_name] = result
+            seconds = '-' if not timings else f"{result['seconds']:.3f}s"
+            print(f"{benchmark_name:30s} {size_name:6s} {seconds:>11s}  "
+                  f"{'ok' if error is None else 'FAILED: ' + error}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)),
+                exist_ok=True)
+    with open(results_path, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f'Wrote results to {results_path}')
+    return results
+
+
+def _load_results(commit_or_path):
+    """Load results by commit (from ``RESULTS_DIR``) or by path."""
+    if not os.path.exists(commit_or_path):
+        commit_or_path = os.path.join(RESULTS_DIR, f'{commit_or_path}.json')
+    with open(commit_or_path) as results_file:
+        return json.load(results_file)
+
+
+def compare_results(base, head):
+    """Print the timings of two benchmark runs side by side.
+
+    Args:
+        base (str): The commit or JSON path of the baseline results.
+        head (str): The commit or JSON path of the results to compare.
+
+    Returns:
+        None
+    """
+    base_results = _load_results(base)
+    head_results = _load_results(head)
+    print(f"{'benchmark':30s} {'size':6s} {base_results['commit']:>12s} "
+          f"{head_results['commit']:>12s} {'speedup':>8s}")
+    for benchmark_name, sizes in head_results['benchmarks'].items():
+        for size_name, head_result in sizes.items():
+            base_result = base_results['benchmarks'].get(
+                benchmark_name, {}).get(size_name)
+            base_seconds = '-'
+            head_seconds = '-'
+            speedup = '-'
+            # Benchmarks that crashed before a run finished have no time.
+            if base_result and base_result['seconds'] is not None:
+                base_seconds = f"{base_result['seconds']:.3f}"
+            if head_result['seconds'] is not None:
+                head_seconds = f"{head_result['seconds']:.3f}"
+                if base_seconds != '-':
+                    ratio = base_result['seconds'] / head_result['seconds']
+                    speedup = f'{ratio:.2f}x'
+            status = '' if head_result['passed'] else '  FAILED'
+            print(f"{benchmark_name:30s} {size_name:6s} {base_seconds:>12s} "
+                  f"{head_seconds:>12s} {speedup:>8s}{status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        os.path.basename(__file__), description=(
+            "Benchmark the processing scripts on synthetic data."))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help=(
+        "Run benchmarks and write the results to a JSON file."))
+    run_parser.add_argument(
+        '--benchmark', action='append', choices=sorted(BENCHMARKS), help=(
+            "A benchmark to run.  May be given several times.  Defaults to "
+            "all of them."))
+    run_parser.add_argument(
+        '--size', action='append', choices=['small', 'large'], help=(
+            "A size to run.  May be given several times.  Defaults to "
+            "'small'."))
+    run_parser.add_argument('--repeats', type=int, default=3, help=(
+        "How many times to time each benchmark.  Defaults to 3."))
+    run_parser.add_argument('--output', default=None, help=(
+        "The JSON file to write.  Defaults to results/<commit>.json."))
+
+    compare_parser = subparsers.add_parser('compare', help=(
+        "Compare the results of two runs."))
+    compare_parser.add_argument('base', help=(
+        "The commit or JSON file of the baseline run."))
+    compare_parser.add_argument('head', help=(
+        "The commit or JSON file of the run to compare."))
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        compare_results(args.base, args.head)
+        return
+
+    results_path = args.output or os.path.join(
+        RESULTS_DIR, f'{_get_commit()}.json')
+    results = run_benchmarks(
+        args.benchmark or sorted(BENCHMARKS), args.size or ['small'],
+        args.repeats, results_path)
+    if not all(result['passed']
+               for sizes in results['benchmarks'].values()
+               for result in sizes.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
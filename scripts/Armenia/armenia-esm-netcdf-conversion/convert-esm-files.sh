@@ -1,6 +1,13 @@
 #!/usr/bin/env sh
 #
 # To use this script, call with the directory containing the netCDF files as the first argument.
+#
+# The models, scenarios, variables and year ranges to convert are in
+# esm-scenario-matrix.json.  The first model's outputs are aggregated by
+# climate zone.  Any other models are processed alongside it as members of
+# an ensemble.  Independent steps run concurrently with --workers N, and
+# rerunning after a failure skips every step that already completed.  Any
+# arguments after the workspace, like --workers 4, are passed along.
 
 set -e
 
@@ -11,29 +18,12 @@ if [ -z "$DIR" ]; then
     exit 1
 fi
 
-SUFFIXES=("ssp126" "ssp585")
-YEARRANGES=("1961:1990" "2040:2040" "2041:2070" "2071:2100")
 WORKSPACE=${2:-$(pwd)}  # default to CWD if no second argument provided by the user
-
-for suffix in ${SUFFIXES[@]}
-do
-    for yearrange in ${YEARRANGES[@]}
-    do
-        FORMATTED_YEARRANGE=$(echo $yearrange | tr : -)
-        python convert-daily-esm-netcdf-to-monthly-gtiff.py \
-            "$DIR/GFDL-ESM4_hist_plus_${suffix}_pet.nc" "$yearrange" "pet" "$WORKSPACE"
-
-        python convert-daily-esm-netcdf-to-monthly-gtiff.py \
-            "$DIR/GFDL-ESM4_hist_plus_${suffix}_pr.nc" "$yearrange" "precip" "$WORKSPACE"
-        python aggregate-rain-events-by-climate-zone.py \
-            "$WORKSPACE/GFDL-ESM4_hist_plus_${suffix}_pr-monthly-rain-events-by-cz-$FORMATTED_YEARRANGE.csv" \
-            "$DIR/KG_climatezones.tif" \
-            "$WORKSPACE/GFDL-ESM4_hist_plus_${suffix}_pr-$FORMATTED_YEARRANGE-*-rain-events.tif" \
-
-        python convert-daily-esm-netcdf-to-monthly-gtiff.py \
-            "$DIR/GFDL-ESM4_hist_plus_${suffix}_tas.nc" "$yearrange" "tas" "$WORKSPACE"
-    done
-done
-
-
-
+shift
+if [ $# -gt 0 ]; then shift; fi
+
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+REPO_SRC="$(cd "$SCRIPT_DIR/../../../src" && pwd)"
+PYTHONPATH="$REPO_SRC${PYTHONPATH:+:$PYTHONPATH}" python -m rapid_es \
+    scenario-matrix "$SCRIPT_DIR/esm-scenario-matrix.json" \
+    --netcdf-dir "$DIR" --workspace "$WORKSPACE" "$@"
@@ -8,18 +8,12 @@ GDRIVE_LOC=${1:-$GDRIVE_DEFAULT_LOC}
 GTIFF_PATTERN="GFDL-ESM4_hist_plus*.tif"
 CSV_PATTERN="*.csv"
 
-find "$GDRIVE_LOC" -name "$GTIFF_PATTERN" -o -name "$CSV_PATTERN" > files-on-gdrive.txt
-find $(pwd) -name "$GTIFF_PATTERN" -o -name "$CSV_PATTERN" > files-on-local.txt
-
-cat files-on-local.txt | while read file
-do
-    file_basename="$(basename "$file")"
-    target_path=$(grep "$file_basename" files-on-gdrive.txt)
-    if [ -z "$target_path" ]; then
-        new_file_on_gdrive="$GDRIVE_LOC/$file_basename"
-    else
-        new_file_on_gdrive="$target_path"
-    fi
-
-    cp -v "$file" "$new_file_on_gdrive"
-done
+# Copy only the files that changed since the last sync (see
+# src/rapid_es/sync.py).  Any further arguments, like --dry-run, are passed
+# along.  The package is run from this repository, so it doesn't need to be
+# installed.
+REPO_SRC="$(cd "$(dirname "$0")/../../../src" && pwd)"
+if [ $# -gt 0 ]; then shift; fi
+PYTHONPATH="$REPO_SRC${PYTHONPATH:+:$PYTHONPATH}" python -m rapid_es sync \
+    --pattern "$GTIFF_PATTERN" --pattern "$CSV_PATTERN" "$@" \
+    "$(pwd)" "$GDRIVE_LOC"
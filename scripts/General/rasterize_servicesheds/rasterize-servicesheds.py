@@ -0,0 +1,20 @@
+"""Sum the weights of overlapping servicesheds onto the grid of a raster.
+
+A blockwise Python alternative to ``rasterize_servicesheds.R`` that scales to
+thousands of servicesheds.  It is the ``serviceshed-overlay`` command of the
+``rapid_es`` package (``pip install .`` from the root of this repository,
+then ``rapid-es serviceshed-overlay --help``) and takes the same arguments.
+"""
+import os
+import sys
+
+try:
+    from rapid_es import cli
+except ImportError:
+    # Not installed, so use the package from this checkout.
+    sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'src'))
+    from rapid_es import cli
+
+if __name__ == '__main__':
+    sys.exit(cli.main(['serviceshed-overlay'] + sys.argv[1:]))
@@ -0,0 +1,7 @@
+"""Processing tools for rapid ecosystem service assessments.
+
+The processing modules import GDAL, pygeoprocessing and numpy, so import them
+directly (for example ``from rapid_es import esm_convert``) rather than
+through this package.
+"""
+__version__ = '0.1.0'
@@ -0,0 +1,554 @@
+"""The ``rapid-es`` command line interface.
+
+Every processing step is a subcommand:
+
+    rapid-es link-extract         Link et al (2020) values as a GeoTiff.
+    rapid-es lulc-transition      Transition matrix of two landcover rasters.
+    rapid-es dem-preprocess       Warp, fill and route a cached DEM.
+    rapid-es esm-convert          Daily ESM NetCDFs to monthly rasters.
+    rapid-es esm-index            Sidecar chunk indexes of ESM NetCDFs.
+    rapid-es zonal-agg            Monthly rasters aggregated by climate zone.
+    rapid-es scenario-matrix      ESM conversion of a matrix of scenarios.
+    rapid-es serviceshed-overlay  Summed weights of overlapping servicesheds.
+    rapid-es sync                 Copy new and changed outputs to a drive.
+
+This module only uses the standard library.  The module of a subcommand, and
+with it GDAL, pygeoprocessing, numpy and taskgraph, is only imported once the
+arguments are parsed, so ``--help`` and argument errors return immediately.
+
+``--trace PATH`` traces the run to a Chrome trace file; see ``tracing``.
+``--max-memory SIZE`` sizes the blocks and windows of every command to fit
+in about SIZE of memory.
+"""
+import argparse
+import functools
+import glob
+import importlib
+import logging
+import os
+import sys
+
+from . import tracing
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _import(module_name):
+    """Import one of the processing modules of this package."""
+    return importlib.import_module(f'.{module_name}', __package__)
+
+
+# The multipliers of the suffixes --max-memory sizes may have.
+MEMORY_UNITS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def _memory_size(value):
+    """Parse a memory size such as ``'512M'`` or ``'4G'`` into bytes."""
+    number = value.strip().upper().rstrip('B')
+    unit = number[-1:] if number[-1:] in MEMORY_UNITS else ''
+    try:
+        n_bytes = int(float(number[:len(number)-len(unit)]) *
+                      MEMORY_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Could not parse memory size {value!r}.  Use a number of "
+            "bytes with an optional K, M, G or T suffix, like '4G'.")
+    if n_bytes <= 0:
+        raise argparse.ArgumentTypeError(
+            f"The memory size must be positive, not {value!r}")
+    return n_bytes
+
+
+def _add_link_extract_arguments(parser):
+    parser.add_argument(
+        '--dataset', default=os.getcwd(), help=(
+            'The path to where the Link et al (2020) dataset lives on disk.'))
+    parser.add_argument(
+        '--target', default="where-water-lands.tif", help=(
+            "The name of the file to write out, ending in '.tif'"))
+    parser.add_argument(
+        '--mode', default="basin", help=(
+            "One of 'basin', 'grid', 'yearly-YYYY' or 'monthly-YYYY-MM'. "
+            "If 'basin', the IDs provided must be basin IDs. "
+            "Otherwise, the IDs provided must be grid cell IDs. "
+            "If 'yearly-YYYY' or 'monthly-YYYY-MM', replace YYYY with the "
+            "year of interest, and MM with the month of interest.  For "
+            "Example: 'yearly-2014' or 'monthly-2014-05'."))
+    parser.add_argument('ID', nargs='+', help=(
+        "The ID of the basin or grid cell (depending on your mode option) "
+        "of the source area, or an AOI vector."))
+    parser.add_argument('--workers', type=int, default=-1, help=(
+        "The number of taskgraph workers.  Defaults to -1, which extracts "
+        "in this process."))
+
+
+def _link_extract(parser, args):
+    if not (args.mode in ('basin', 'grid') or
+            args.mode.startswith('yearly-') or
+            args.mode.startswith('monthly-')):
+        parser.error(f'Could not recognize mode {args.mode}')
+    if (len(args.ID) == 1 and os.path.exists(args.ID[0]) and
+            args.mode == 'basin'):
+        parser.error(
+            "The basin mode cannot be used with an AOI. "
+            "You must provide a basin ID instead.")
+
+    _import('link_extract').extract(
+        args.dataset, args.target, args.mode, args.ID, args.workers,
+        args.max_memory)
+
+
+def _add_lulc_transition_arguments(parser):
+    parser.add_argument(
+        "-f", "--from", required=True, help=(
+            "Path of landcover raster before transition."))
+    parser.add_argument(
+        "-t", "--to", required=True, help=(
+            "Path of landcover raster after transition."))
+    parser.add_argument(
+        "-o", "--output-directory", required=True, help=(
+            "Path to a directory to save the outputs of this script."))
+    parser.add_argument('--workers', type=int, default=-1, help=(
+        "The number of taskgraph workers.  Defaults to -1, which runs "
+        "every stage in this process."))
+
+
+def _lulc_transition(parser, args):
+    lulc_transition = _import('lulc_transition')
+    LOGGER.info(f"Command line inputs: {vars(args)}")
+    output_directory = args.output_directory
+    lulc_transition.lulc_transition_matrix(
+        getattr(args, 'from'), args.to,
+        os.path.join(output_directory,
+                     lulc_transition.TRANSITION_RASTER_NAME),
+        os.path.join(output_directory,
+                     lulc_transition.TRANSITION_RASTER_TABLE_NAME),
+        os.path.join(output_directory,
+                     lulc_transition.TRANSITION_MATRIX_NAME),
+        n_workers=args.workers, max_memory=args.max_memory)
+    LOGGER.info("Completed.")
+
+
+def _add_dem_preprocess_arguments(parser):
+    parser.add_argument('aoi', help="The path to an AOI vector.")
+    parser.add_argument(
+        '--dem', default="SRTM", help="The name of the DEM to use.")
+    parser.add_argument('--tfa', default=None, help=(
+        'A range of flow accumulation thresholds to run, in the format '
+        'start:stop:step.  For example, "1000:5000:150" would extract '
+        'streams for TFA values 1000, 1150, 1300 ... 5000.  If this '
+        'parameter is not provided, no streams will be extracted.'))
+    parser.add_argument('--workspace', default='preprocess-dem-workspace')
+    parser.add_argument(
+        '--routing_method', default='d8', help="Either D8 or MFD")
+    parser.add_argument(
+        '--resample_method', default='near',
+        help="A valid GDAL resample method string.")
+    parser.add_argument('--target_epsg', default=None, help=(
+        "The target EPSG code. If not provided, the AOI's projection "
+        "will be used."))
+    parser.add_argument('--pixel_size', default=None, help=(
+        "The pixel size of the output raster.  If not provided and the "
+        "target projection is in meters, the output raster will have the "
+        "pixel size of the center latitude of the bounding box.  Example: "
+        "'--pixel_size=30,30'"))
+    parser.add_argument('--plan', action='store_true', help=(
+        "Estimate the target grid size, disk usage, HTTP transfer and "
+        "runtime of each stage without reading remote data or writing to "
+        "the workspace."))
+    parser.add_argument('--outlets', default=None, help=(
+        "The path to a vector of outlet points.  If provided, a watershed "
+        "is delineated for each outlet and its slope, area and relief are "
+        "summarized in a table."))
+    parser.add_argument('--n_threads', default=None, type=int, help=(
+        "The number of threads to use when warping.  Defaults to the number "
+        "of CPUs."))
+    parser.add_argument('--warp_memory', default=None, type=int, help=(
+        "The amount of memory, in MB, that GDAL may use for warping.  "
+        "Defaults to --max-memory if given, otherwise a quarter of "
+        "physical memory, up to 2048 MB."))
+    parser.add_argument('--creation_options', default=None, help=(
+        "Comma-separated GTiff creation options used for every raster "
+        "written.  Defaults to tiled, DEFLATE-compressed BigTIFFs."))
+    parser.add_argument(
+        '--cleanup', default='none', choices=['none', 'intermediates'],
+        help=(
+            "Use 'intermediates' to delete the warped and pit-filled DEMs "
+            "once the tasks reading them have finished.  They (and "
+            "everything downstream) will be recomputed if the workflow is "
+            "run again."))
+
+
+def _dem_preprocess(parser, args):
+    warp_memory = args.warp_memory
+    if warp_memory is None and args.max_memory is not None:
+        warp_memory = max(1, args.max_memory // 2**20)
+    _import('dem_preprocess').preprocess_dem(
+        dem=args.dem, aoi=args.aoi, workspace=args.workspace, tfa=args.tfa,
+        pixel_size=args.pixel_size, routing_method=args.routing_method,
+        resample_method=args.resample_method, target_epsg=args.target_epsg,
+        plan=args.plan, n_threads=args.n_threads,
+        warp_memory=warp_memory,
+        creation_options=args.creation_options, cleanup=args.cleanup,
+        outlets=args.outlets)
+
+
+def _add_esm_convert_arguments(parser):
+    parser.add_argument('netcdf', help=(
+        "The path to the NetCDF file to process."))
+    parser.add_argument('years', help=(
+        "The range of years to process as YYYY:YYYY, or several "
+        "comma-separated ranges."))
+    parser.add_argument(
+        'mode', type=str.lower, choices=['pet', 'precip', 'tas'], help=(
+            "The kind of data in the NetCDF."))
+    parser.add_argument('workspace', nargs='?', default=os.getcwd(), help=(
+        "The directory to write outputs to.  Defaults to the current "
+        "working directory."))
+    parser.add_argument('--workers', type=int, default=1, help=(
+        "The number of worker processes to read the daily data with.  Each "
+        "worker aggregates a contiguous run of years with its own GDAL "
+        "handle.  Defaults to 1 (no worker processes)."))
+    parser.add_argument('--aoi', default=None, help=(
+        "A vector or a 'minx,miny,maxx,maxy' bounding box (in the NetCDF's "
+        "coordinates).  If provided, only the pixels covering the AOI are "
+        "read and written."))
+    parser.add_argument('--aoi-buffer', type=int, default=None, help=(
+        "The number of pixels to pad the AOI with.  Defaults to 2."))
+    parser.add_argument('--extremes', default='', help=(
+        "Comma-separated extreme precipitation indices to compute in "
+        "precip mode.  Any of rx1day, rx5day, cdd, cwd."))
+    parser.add_argument('--percentiles', default='', help=(
+        "Comma-separated percentiles (0-100) of each month's daily values to "
+        "compute in precip mode.  Example: '50,90,99'."))
+    parser.add_argument(
+        '--output-format', type=str.lower, default='gtiff', help=(
+            "How to write the monthly outputs: 'gtiff' writes one GeoTiff "
+            "per month, 'stacked-gtiff' one compressed 12-band GeoTiff per "
+            "period, 'netcdf' one NetCDF per period with a month axis and "
+            "'none' no rasters at all.  Defaults to 'gtiff'."))
+    parser.add_argument('--zones', default=None, help=(
+        "A raster of integer zone IDs, such as climate zones.  It is "
+        "resampled onto the NetCDF grid once and the mean of every output "
+        "in each zone is written to a table."))
+    parser.add_argument(
+        '--ensemble-member', action='append', default=[], help=(
+            "The path to a NetCDF file of another model on the same grid. "
+            "May be given several times.  Every model is processed and the "
+            "ensemble mean, spread and agreement are written as well."))
+    parser.add_argument('--ensemble-name', default=None, help=(
+        "The basename of the ensemble outputs.  Defaults to "
+        "'<mode>-ensemble'."))
+    parser.add_argument('--build-index', action='store_true', help=(
+        "(Re)build the sidecar chunk index of the NetCDF before processing. "
+        "Later runs read the daily data through the index, without opening "
+        "the NetCDF with GDAL.  Requires h5py."))
+
+
+def _parse_percentiles(parser, percentiles):
+    """Parse comma-separated percentiles, which must be from 0 to 100."""
+    percentiles = [float(percentile) for percentile in
+                   percentiles.split(',') if percentile]
+    for percentile in percentiles:
+        if not 0 <= percentile <= 100:
+            parser.error(
+                f"Percentiles must be from 0 to 100, not {percentile}")
+    return percentiles
+
+
+def _esm_convert(parser, args):
+    extremes = [index for index in args.extremes.lower().split(',') if index]
+    percentiles = _parse_percentiles(parser, args.percentiles)
+    if (extremes or percentiles) and args.mode != 'precip':
+        parser.error('--extremes and --percentiles require precip mode')
+
+    periods = []
+    for year_range in args.years.split(','):
+        year_min, year_max = [int(year) for year in year_range.split(':')]
+        periods.append(list(range(year_min, year_max+1)))
+
+    esm_convert = _import('esm_convert')
+    for index in extremes:
+        if index not in esm_convert.EXTREME_INDICES:
+            parser.error(f'Unknown extreme index: {index}')
+    if args.output_format not in esm_convert.OUTPUT_FORMATS:
+        parser.error(
+            f"--output-format must be one of "
+            f"{', '.join(esm_convert.OUTPUT_FORMATS)}")
+    aoi_buffer = args.aoi_buffer
+    if aoi_buffer is None:
+        aoi_buffer = esm_convert.DEFAULT_AOI_BUFFER
+
+    if not os.path.exists(args.workspace):
+        os.makedirs(args.workspace)
+
+    if args.build_index:
+        for netcdf_filepath in [args.netcdf] + args.ensemble_member:
+            esm_convert.build_chunk_index(netcdf_filepath)
+
+    mode_kwargs = {}
+    if args.mode == 'precip':
+        mode_kwargs = {'extremes': extremes, 'percentiles': percentiles}
+    esm_convert.MODES[args.mode](
+        args.netcdf, periods, args.workspace, args.workers, args.aoi,
+        aoi_buffer, output_format=args.output_format,
+        ensemble_members=args.ensemble_member,
+        ensemble_name=args.ensemble_name or f'{args.mode}-ensemble',
+        zones=args.zones, max_memory=args.max_memory, **mode_kwargs)
+
+
+def _add_esm_index_arguments(parser):
+    parser.add_argument('netcdf', nargs='+', help=(
+        "The NetCDF files of daily values to index."))
+
+
+def _esm_index(parser, args):
+    for netcdf_filepath in args.netcdf:
+        if not os.path.isfile(netcdf_filepath):
+            parser.error(f'{netcdf_filepath} is not a file')
+    esm_convert = _import('esm_convert')
+    for netcdf_filepath in args.netcdf:
+        esm_convert.build_chunk_index(netcdf_filepath)
+
+
+def _add_zonal_agg_arguments(parser):
+    parser.add_argument('target_csv', help=(
+        "The path to the CSV to write."))
+    parser.add_argument('climate_zones_raster', help=(
+        "The path to a raster of climate zone IDs, or to a vector of zones "
+        "(with --zone-field)."))
+    parser.add_argument('rain_events_glob', help=(
+        "A glob matching the 12 monthly rain events rasters."))
+    parser.add_argument('workspace', nargs='?', default=None, help=(
+        "A directory for temporary files, which is removed when done.  "
+        "Defaults to a new temporary directory."))
+    parser.add_argument('--blockwise', action='store_true', help=(
+        "Read the rasters one block at a time, so that national-scale "
+        "rasters never need to fit in memory."))
+    parser.add_argument('--zone-field', default=None, help=(
+        "The integer field with zone IDs, when the zones are a vector."))
+    parser.add_argument('--percentiles', default='', help=(
+        "Comma-separated percentiles (0-100) of each zone's monthly values "
+        "to write, one table each.  Example: '50,90'."))
+    parser.add_argument('--histogram-bins', type=int, default=None, help=(
+        "The number of histogram bins percentiles are estimated from.  "
+        "Defaults to 1000."))
+    parser.add_argument('--cache-dir', default=None, help=(
+        "Where to cache aligned rasters and rasterized zone vectors.  "
+        "Defaults to $RAPID_ES_CACHE_DIR, or to "
+        "rapid-es/zonal-aggregation in the user's cache directory "
+        "($XDG_CACHE_HOME or ~/.cache).  It may be deleted at any time."))
+
+
+def _zonal_agg(parser, args):
+    percentiles = _parse_percentiles(parser, args.percentiles)
+    zonal_aggregation = _import('zonal_aggregation')
+    n_bins = args.histogram_bins
+    if n_bins is None:
+        n_bins = zonal_aggregation.DEFAULT_HISTOGRAM_BINS
+    zonal_aggregation.aggregate_by_zone(
+        args.target_csv, args.climate_zones_raster,
+        glob.glob(args.rain_events_glob), args.workspace,
+        blockwise=args.blockwise, zone_field=args.zone_field,
+        percentiles=percentiles, n_bins=n_bins, cache_dir=args.cache_dir,
+        max_memory=args.max_memory)
+
+
+def _add_scenario_matrix_arguments(parser):
+    parser.add_argument('config', help=(
+        "The path to a JSON file describing the matrix of models, "
+        "scenarios, variables and year ranges to convert."))
+    parser.add_argument('--netcdf-dir', default=None, help=(
+        "The directory with the NetCDF files.  Overrides the configuration "
+        "file's 'netcdf_dir'."))
+    parser.add_argument('--workspace', default=None, help=(
+        "The directory to write outputs to.  Overrides the configuration "
+        "file's 'workspace'."))
+    parser.add_argument('--workers', type=int, default=-1, help=(
+        "The number of steps to run at once.  Defaults to -1, which runs "
+        "every step in this process, one after another."))
+    parser.add_argument('--convert-workers', type=int, default=1, help=(
+        "The number of worker processes each conversion step reads the "
+        "daily data with.  Defaults to 1."))
+
+
+def _scenario_matrix(parser, args):
+    scenario_matrix = _import('scenario_matrix')
+    try:
+        config = scenario_matrix.load_config(
+            args.config, args.netcdf_dir, args.workspace)
+    except ValueError as error:
+        parser.error(str(error))
+    scenario_matrix.run_matrix(
+        config, args.workers, args.max_memory, args.convert_workers)
+
+
+def _add_serviceshed_overlay_arguments(parser):
+    parser.add_argument('base_raster', help=(
+        "A raster with the grid to write to, such as an InVEST ES supply "
+        "raster or a DEM."))
+    parser.add_argument('servicesheds', help=(
+        "A vector of (possibly overlapping) serviceshed polygons."))
+    parser.add_argument('target_raster', help=(
+        "The path to the raster of summed weights to write."))
+    parser.add_argument('--weight-field', required=True, help=(
+        "The numeric field to weight each serviceshed by, such as its "
+        "value or number of beneficiaries."))
+    parser.add_argument('--type-field', default=None, help=(
+        "A field with the type of each serviceshed, such as 'Hydropower'.  "
+        "If given, the summed weights of each type are also written to a "
+        "raster named after the target raster and the type."))
+    parser.add_argument('--per-area', action='store_true', help=(
+        "Divide each serviceshed's weight by its area (in the units of its "
+        "projection), as for value per square meter."))
+
+
+def _serviceshed_overlay(parser, args):
+    serviceshed_overlay = _import('serviceshed_overlay')
+    try:
+        target_paths = serviceshed_overlay.overlay_servicesheds(
+            args.base_raster, args.servicesheds, args.weight_field,
+            args.target_raster, type_field=args.type_field,
+            per_area=args.per_area, max_memory=args.max_memory)
+    except ValueError as error:
+        parser.error(str(error))
+    LOGGER.info(f"Wrote {', '.join(target_paths)}")
+
+
+def _add_sync_arguments(parser):
+    parser.add_argument('source_dir', help=(
+        "The directory to search for files to copy, such as a workspace."))
+    parser.add_argument('target_dir', help=(
+        "The directory to copy them to.  Each file is copied over the file "
+        "with the same name anywhere in this directory, or to its top "
+        "level if there isn't one."))
+    parser.add_argument(
+        '--pattern', action='append', default=[], dest='patterns', help=(
+            "A pattern of the names of files to copy, such as '*.tif'.  May "
+            "be given several times.  Defaults to '*.tif' and '*.csv'."))
+    parser.add_argument('--workers', type=int, default=None, help=(
+        "The number of threads to check and copy files with.  Defaults "
+        "to 8."))
+    parser.add_argument('--dry-run', action='store_true', help=(
+        "Only list the files that would be copied."))
+    parser.add_argument('--verify-all', action='store_true', help=(
+        "Compare the checksums of every file, rather than skipping files "
+        "whose size and modification time match the last sync."))
+
+
+def _sync(parser, args):
+    sync = _import('sync')
+    if not os.path.isdir(args.target_dir):
+        parser.error(f'{args.target_dir} is not a directory')
+    sync.sync(
+        args.source_dir, args.target_dir,
+        patterns=args.patterns or sync.DEFAULT_PATTERNS,
+        n_workers=args.workers or sync.DEFAULT_WORKERS,
+        dry_run=args.dry_run, verify_all=args.verify_all)
+
+
+# The name, description, argument builder and runner of every subcommand.
+COMMANDS = (
+    ('link-extract',
+     "Extract a raster of values from Link et al (2020) based on a source "
+     "of water.",
+     _add_link_extract_arguments, _link_extract),
+    ('lulc-transition',
+     "Given two landcover rasters creates a transition matrix table and "
+     "transition raster with accompanying attribute table.",
+     _add_lulc_transition_arguments, _lulc_transition),
+    ('dem-preprocess',
+     "Preprocess a DEM from the data cache: warp it, fill sinks, route flow "
+     "and optionally extract streams and delineate watersheds.",
+     _add_dem_preprocess_arguments, _dem_preprocess),
+    ('esm-convert',
+     "Convert a NetCDF of daily values to monthly GeoTiffs.",
+     _add_esm_convert_arguments, _esm_convert),
+    ('esm-index',
+     "(Re)build the sidecar chunk index of daily ESM NetCDFs, so "
+     "esm-convert reads them without opening them with GDAL.  Requires "
+     "h5py.",
+     _add_esm_index_arguments, _esm_index),
+    ('zonal-agg',
+     "Aggregate monthly rain events rasters by climate zone.",
+     _add_zonal_agg_arguments, _zonal_agg),
+    ('scenario-matrix',
+     "Convert ESM NetCDFs for every scenario, variable and year range of a "
+     "configuration file, and aggregate their rain events by climate zone. "
+     "Completed steps are skipped when run again.",
+     _add_scenario_matrix_arguments, _scenario_matrix),
+    ('serviceshed-overlay',
+     "Sum the weights of overlapping serviceshed polygons onto the grid of "
+     "a raster, one block at a time.",
+     _add_serviceshed_overlay_arguments, _serviceshed_overlay),
+    ('sync',
+     "Copy new and changed output files from one directory to another, "
+     "such as from a workspace to a shared drive.",
+     _add_sync_arguments, _sync),
+)
+
+
+def build_parser():
+    """Build the argument parser of every subcommand.
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser('rapid-es', description=(
+        "Processing tools for rapid ecosystem service assessments."))
+    parser.add_argument('--debug', action='store_true', help=(
+        "Log debugging messages as well."))
+    parser.add_argument('--trace', metavar='PATH', help=(
+        "Write a trace of the run's reads, writes and computation to PATH, "
+        "in the Chrome trace event format."))
+    parser.add_argument('--profile', action='store_true', help=(
+        "With --trace, also profile the run with cProfile and write the "
+        "stats to PATH.prof."))
+    parser.add_argument('--trace-memory', action='store_true', help=(
+        "With --trace, also record the memory allocated by Python at the "
+        "end of every span."))
+    parser.add_argument(
+        '--max-memory', type=_memory_size, metavar='SIZE', help=(
+            "The approximate amount of memory to use, such as '4G' or "
+            "'512M'.  Blocks and windows are sized to fit, and rasters that "
+            "would not fit in memory whole are processed in blocks.  "
+            "Defaults to no limit."))
+    subparsers = parser.add_subparsers(
+        dest='command', metavar='COMMAND', required=True)
+    for name, description, add_arguments, run in COMMANDS:
+        subparser = subparsers.add_parser(
+            name, help=description, description=description)
+        add_arguments(subparser)
+        subparser.set_defaults(run=functools.partial(run, subparser))
+    return parser
+
+
+def main(argv=None):
+    """Run a subcommand.
+
+    Args:
+        argv (list): The command line arguments, not including the program
+            name.  Defaults to ``sys.argv[1:]``.
+
+    Returns:
+        int: The exit status.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if (args.profile or args.trace_memory) and not args.trace:
+        parser.error('--profile and --trace-memory require --trace')
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format=(
+            '%(asctime)s (%(relativeCreated)d) %(levelname)s %(name)s'
+            ' [%(funcName)s:%(lineno)d] %(message)s'),
+        stream=sys.stdout)
+    if args.trace:
+        tracing.start(args.trace, args.profile, args.trace_memory)
+    with tracing.span(args.command, 'command'):
+        args.run(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,816 @@
+"""Preprocess a DEM from the data cache.
+
+This preprocessing script steps through the usual steps needed for processing a
+DEM that's available in the NatCap data cache:
+
+    1. Download the region needed, as defined by a vector AOI
+    2. Warp the downloaded raster to a local projection and pixel size
+        defined by an EPSG code and (optionally) a user-defined pixel size
+    3. Fill hydrological sinks
+    4. Calculate flow direction
+    5. Calculate flow accumulation
+    6. If desired, create a set of stream networks from a range of TFA values
+    7. If an outlets vector is provided, delineate a watershed for each outlet
+        and summarize the slope, area and relief of each watershed
+
+Run it with ``rapid-es dem-preprocess``.  Use ``--plan`` to estimate the size
+of the target grid, the disk space needed for each intermediate and output,
+the bytes to be fetched over HTTP and the runtime of each stage without
+reading any remote data.  Runtimes are extrapolated from a small local
+benchmark of the routing functions, so they are a rough guide rather than a
+promise.
+"""
+
+import csv
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import numpy
+import pygeoprocessing
+import pygeoprocessing.geoprocessing
+import pygeoprocessing.routing
+import taskgraph
+from osgeo import gdal
+from osgeo import osr
+
+from . import tracing
+
+LOGGER = logging.getLogger(__name__)
+URL_BASE = 'https://storage.googleapis.com/natcap-data-cache/global'
+
+# Keys are known aliases, values are the path to the layer relative to URL_BASE
+# above.
+KNOWN_DEMS = {
+    'SRTM': f'{URL_BASE}/nasa-srtm-v3-1s/srtm-v3-1s.tif',
+    'ASTER': f'{URL_BASE}/aster-v3-1s/aster-v3-1s.tif',
+    'NASA_HGT': f'{URL_BASE}/hasa-hgt-v1-1s/hasa-hgt-v1-1s.tif',
+}
+
+# What we know about the layers in KNOWN_DEMS without having to open them.
+# Pixel sizes are in degrees.  Used by --plan, which must not read remote data.
+KNOWN_DEM_PROPERTIES = {
+    'SRTM': {'pixel_size': 1 / 3600, 'datatype': gdal.GDT_Int16},
+    'ASTER': {'pixel_size': 1 / 3600, 'datatype': gdal.GDT_Int16},
+    'NASA_HGT': {'pixel_size': 1 / 3600, 'datatype': gdal.GDT_Int16},
+}
+
+# GTiff creation options used for every raster we write.  Intermediates
+# dominate our disk I/O, so these are compressed and tiled.
+DEFAULT_CREATION_OPTIONS = (
+    'TILED=YES', 'BIGTIFF=YES', 'COMPRESS=DEFLATE', 'BLOCKXSIZE=256',
+    'BLOCKYSIZE=256')
+
+# The number of pixels on a side of the synthetic DEM used to calibrate the
+# runtime estimates in --plan.
+PLAN_BENCHMARK_SIZE = 512
+
+WGS84_SRS = osr.SpatialReference()
+WGS84_SRS.ImportFromEPSG(4326)
+WGS84_SRS_WKT = WGS84_SRS.ExportToWkt()
+
+
+@tracing.traced('write vrt', 'io')
+def _write_vrt(
+        source_raster_url: str,
+        target_vrt_path: str,
+        gdal_kwargs: Dict):
+    """Write a GDAL VRT.
+
+    A separate function here is easier to wrap up as a taskgraph task.  It
+    turns out that ``gdal.BuildVRT`` returns an unpickleable object.
+
+    Args:
+        source_raster_url: The http(s) URL to the target layer.
+        target_vrt_path: The local filepath where the VRT should be written.
+        gdal_kwargs: A dict mapping gdal VRTOptions parameter names to their
+            values.
+
+    Returns:
+        ``None``
+    """
+    gdal.BuildVRT(target_vrt_path, [f'/vsicurl/{source_raster_url}'],
+                  **gdal_kwargs)
+
+
+@tracing.traced('warp dem', 'io')
+def _warp_dem(
+        base_raster_path: str,
+        target_raster_path: str,
+        target_pixel_size: List[float],
+        target_bb: List[float],
+        target_projection_wkt: str,
+        resample_method: str,
+        n_threads: int,
+        warp_memory: int,
+        raster_driver_creation_tuple: Tuple[str, Tuple[str]]):
+    """Warp a raster with multiple threads and a warp memory limit.
+
+    ``pygeoprocessing.warp_raster`` does not allow the warp memory limit to
+    be set, so this calls ``gdal.Warp`` directly.  As in ``warp_raster``, the
+    bounding box is expanded so that it is an even multiple of the pixel
+    size.
+
+    Args:
+        base_raster_path: The path to the raster to warp.
+        target_raster_path: Where the warped raster should be written.
+        target_pixel_size: The x and y pixel size in target units.
+        target_bb: The target bounding box in target units, in the form
+            ``[minx, miny, maxx, maxy]``.
+        target_projection_wkt: The WKT of the target projection.
+        resample_method: A valid GDAL resample method string.
+        n_threads: The number of threads to use for warping.
+        warp_memory: The warp memory limit in MB.
+        raster_driver_creation_tuple: A tuple of the GDAL driver name and a
+            tuple of creation options.
+
+    Returns:
+        ``None``
+    """
+    x_size = abs(target_pixel_size[0])
+    y_size = abs(target_pixel_size[1])
+    n_cols = max(1, math.ceil(
+        round((target_bb[2] - target_bb[0]) / x_size, 6)))
+    n_rows = max(1, math.ceil(
+        round((target_bb[3] - target_bb[1]) / y_size, 6)))
+    output_bounds = [
+        target_bb[0],
+        target_bb[3] - n_rows * y_size,
+        target_bb[0] + n_cols * x_size,
+        target_bb[3],
+    ]
+
+    driver_name, creation_options = raster_driver_creation_tuple
+    gdal.Warp(
+        target_raster_path, base_raster_path,
+        format=driver_name,
+        outputBounds=output_bounds,
+        xRes=x_size,
+        yRes=y_size,
+        dstSRS=target_projection_wkt,
+        resampleAlg=resample_method,
+        multithread=True,
+        warpMemoryLimit=warp_memory,
+        warpOptions=[f'NUM_THREADS={n_threads}'],
+        creationOptions=list(creation_options))
+
+
+def _remove_files(path_list: List[str]):
+    """Remove files, ignoring any that have already been removed.
+
+    Args:
+        path_list: A list of paths to remove.
+
+    Returns:
+        ``None``
+    """
+    for path in path_list:
+        try:
+            os.remove(path)
+            LOGGER.info(f"Removed {path}")
+        except FileNotFoundError:
+            pass
+
+
+@tracing.traced('watershed terrain stats')
+def _watershed_terrain_stats(
+        watersheds_vector_path: str,
+        slope_raster_path: str,
+        dem_raster_path: str,
+        target_csv_path: str):
+    """Summarize the terrain of each watershed in a table.
+
+    Slope and elevation are aggregated together in a single blockwise pass
+    over the rasters by ``pygeoprocessing.zonal_statistics``.
+
+    Args:
+        watersheds_vector_path: The path to the delineated watersheds.
+        slope_raster_path: The path to a percent slope raster.
+        dem_raster_path: The path to the DEM the slope was derived from.
+        target_csv_path: Where to write the table.  The table has one row per
+            watershed with the watershed's attributes, its area in square
+            projected units, its mean slope in percent and its minimum,
+            maximum and relief of elevation.
+
+    Returns:
+        ``None``
+    """
+    slope_stats, dem_stats = pygeoprocessing.zonal_statistics(
+        [(slope_raster_path, 1), (dem_raster_path, 1)],
+        watersheds_vector_path)
+    pixel_x, pixel_y = pygeoprocessing.get_raster_info(
+        dem_raster_path)['pixel_size']
+    pixel_area = abs(pixel_x * pixel_y)
+
+    vector = gdal.OpenEx(watersheds_vector_path, gdal.OF_VECTOR)
+    layer = vector.GetLayer()
+    field_names = [field.GetName() for field in layer.schema]
+    with open(target_csv_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['fid'] + field_names + [
+            'area', 'mean_slope_percent', 'min_elevation', 'max_elevation',
+            'relief'])
+        for feature in layer:
+            fid = feature.GetFID()
+            row = [fid] + [feature.GetField(name) for name in field_names]
+            if slope_stats[fid]['count'] and dem_stats[fid]['count']:
+                row += [
+                    dem_stats[fid]['count'] * pixel_area,
+                    slope_stats[fid]['sum'] / slope_stats[fid]['count'],
+                    dem_stats[fid]['min'],
+                    dem_stats[fid]['max'],
+                    dem_stats[fid]['max'] - dem_stats[fid]['min'],
+                ]
+            else:
+                # The watershed did not cover any valid pixels.
+                row += [0, '', '', '', '']
+            writer.writerow(row)
+    layer = None
+    vector = None
+    LOGGER.info(f"Wrote watershed terrain stats to {target_csv_path}")
+
+
+def _default_warp_memory() -> int:
+    """Choose a warp memory limit from the physical memory available.
+
+    Returns:
+        A quarter of physical memory, capped at 2048, in MB.  If physical
+        memory cannot be determined, 512.
+    """
+    try:
+        physical_memory = (
+            os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'))
+    except (AttributeError, ValueError, OSError):
+        # os.sysconf is not available on Windows.
+        return 512
+    return int(min(physical_memory / 4 / 2**20, 2048))
+
+
+def _default_pixel_size(
+        source_pixel_size: float,
+        wgs84_bbox: List[float]) -> List[float]:
+    """Determine a square pixel size in meters from a source pixel size.
+
+    Args:
+        source_pixel_size: The width of a source pixel in degrees.
+        wgs84_bbox: The WGS84 bounding box of the AOI.
+
+    Returns:
+        A list of 2 floats, the x and y pixel size in meters.
+    """
+    pixel_size_on_a_side = math.sqrt(
+        pygeoprocessing.geoprocessing._m2_area_of_wg84_pixel(
+            source_pixel_size, (wgs84_bbox[1] - wgs84_bbox[0]) / 2))
+    return [pixel_size_on_a_side, -pixel_size_on_a_side]
+
+
+def _get_routing_functions(routing_method: str):
+    """Look up the pygeoprocessing routing functions for a routing method.
+
+    Args:
+        routing_method: Either ``'d8'`` or ``'mfd'`` (case-insensitive).
+
+    Returns:
+        A tuple of the flow direction, flow accumulation and stream
+        extraction functions.
+
+    Raises:
+        ValueError: When the routing method is not recognized.
+    """
+    routing_method = routing_method.lower()
+    if routing_method == 'd8':
+        return (pygeoprocessing.routing.flow_dir_d8,
+                pygeoprocessing.routing.flow_accumulation_d8,
+                pygeoprocessing.routing.extract_streams_d8)
+    elif routing_method == 'mfd':
+        return (pygeoprocessing.routing.flow_dir_mfd,
+                pygeoprocessing.routing.flow_accumulation_mfd,
+                pygeoprocessing.routing.extract_streams_mfd)
+    raise ValueError(
+        f"routing method must be either D8 or MFD, not {routing_method}")
+
+
+def _benchmark_routing(
+        routing_method: str,
+        target_srs_wkt: str,
+        pixel_size: List[float],
+        n_tfa: int) -> Dict[str, float]:
+    """Time each processing stage on a small synthetic DEM.
+
+    The synthetic DEM is a tilted plane with seeded noise, which gives the
+    pit filling and routing algorithms some realistic work to do.  Everything
+    is written to (and removed from) a temporary directory.
+
+    Args:
+        routing_method: Either ``'d8'`` or ``'mfd'``.
+        target_srs_wkt: The WKT of the projection to benchmark in.
+        pixel_size: The target pixel size.
+        n_tfa: The number of stream extractions that will be run.  When 0,
+            stream extraction is not benchmarked.
+
+    Returns:
+        A dict mapping stage names to the measured seconds per pixel.
+    """
+    flow_dir_func, flow_accum_func, extract_streams_func = (
+        _get_routing_functions(routing_method))
+    benchmark_dir = tempfile.mkdtemp(prefix='preprocess-dem-plan-')
+    n_pixels = PLAN_BENCHMARK_SIZE ** 2
+    try:
+        rows, cols = numpy.mgrid[0:PLAN_BENCHMARK_SIZE, 0:PLAN_BENCHMARK_SIZE]
+        dem_array = (rows + cols).astype(numpy.float32)
+        dem_array += numpy.random.default_rng(0).uniform(
+            0, 10, dem_array.shape).astype(numpy.float32)
+        dem_path = os.path.join(benchmark_dir, 'dem.tif')
+        pygeoprocessing.numpy_array_to_raster(
+            dem_array, -9999, pixel_size, (0, 0), target_srs_wkt, dem_path)
+
+        paths = {name: os.path.join(benchmark_dir, f'{name}.tif') for name in
+                 ('warped', 'pitfilled', 'flowdir', 'flowaccum', 'streams')}
+        stages = [
+            ('warp', pygeoprocessing.warp_raster,
+             [dem_path, pixel_size, paths['warped'], 'near']),
+            ('fill_pits', pygeoprocessing.routing.fill_pits,
+             [(paths['warped'], 1), paths['pitfilled']]),
+            ('flow_dir', flow_dir_func,
+             [(paths['pitfilled'], 1), paths['flowdir']]),
+            ('flow_accum', flow_accum_func,
+             [(paths['flowdir'], 1), paths['flowaccum']]),
+        ]
+        if n_tfa:
+            if routing_method == 'd8':
+                stream_args = [(paths['flowaccum'], 1), 100, paths['streams']]
+            else:
+                stream_args = [(paths['flowaccum'], 1), (paths['flowdir'], 1),
+                               100, paths['streams']]
+            stages.append(('streams', extract_streams_func, stream_args))
+
+        seconds_per_pixel = {}
+        for stage_name, func, args in stages:
+            start_time = time.time()
+            func(*args)
+            seconds_per_pixel[stage_name] = (
+                (time.time() - start_time) / n_pixels)
+        return seconds_per_pixel
+    finally:
+        shutil.rmtree(benchmark_dir, ignore_errors=True)
+
+
+def _plan_preprocessing(
+        dem: str,
+        wgs84_bbox: List[float],
+        target_bbox: List[float],
+        target_srs_wkt: str,
+        pixel_size: List[float],
+        routing_method: str,
+        n_tfa: int,
+        workspace: str) -> Dict:
+    """Estimate the sizes and runtimes of a preprocessing run.
+
+    No remote data is read.  The sizes of the rasters are derived from the
+    target grid, and the runtimes are extrapolated linearly from
+    ``_benchmark_routing``.  The routing algorithms scale somewhat worse than
+    linearly on large, flat landscapes, so runtimes should be taken as a lower
+    bound.
+
+    Args:
+        dem: The key of the DEM in ``KNOWN_DEMS``.
+        wgs84_bbox: The AOI bounding box in WGS84 coordinates.
+        target_bbox: The AOI bounding box in the target projection.
+        target_srs_wkt: The WKT of the target projection.
+        pixel_size: The target pixel size.
+        routing_method: Either ``'d8'`` or ``'mfd'``.
+        n_tfa: The number of stream extractions that will be run.
+        workspace: The output workspace directory.
+
+    Returns:
+        A dict describing the planned run.
+    """
+    dem_properties = KNOWN_DEM_PROPERTIES[dem]
+    dem_bytes_per_pixel = gdal.GetDataTypeSize(
+        dem_properties['datatype']) // 8
+
+    source_pixel_size = dem_properties['pixel_size']
+    source_n_cols = math.ceil(
+        (wgs84_bbox[2] - wgs84_bbox[0]) / source_pixel_size)
+    source_n_rows = math.ceil(
+        (wgs84_bbox[3] - wgs84_bbox[1]) / source_pixel_size)
+
+    n_cols = math.ceil((target_bbox[2] - target_bbox[0]) / abs(pixel_size[0]))
+    n_rows = math.ceil((target_bbox[3] - target_bbox[1]) / abs(pixel_size[1]))
+    n_pixels = n_cols * n_rows
+
+    if routing_method == 'd8':
+        flow_dir_bytes_per_pixel = 1  # GDT_Byte
+    else:
+        flow_dir_bytes_per_pixel = 4  # GDT_Int32
+    bytes_per_pixel = {
+        'warp': dem_bytes_per_pixel,
+        'fill_pits': dem_bytes_per_pixel,
+        'flow_dir': flow_dir_bytes_per_pixel,
+        'flow_accum': 8,  # GDT_Float64
+        'streams': n_tfa,  # GDT_Byte, once per TFA value
+    }
+    if not n_tfa:
+        del bytes_per_pixel['streams']
+
+    LOGGER.info(
+        f"Benchmarking {routing_method} routing on a "
+        f"{PLAN_BENCHMARK_SIZE}x{PLAN_BENCHMARK_SIZE} synthetic DEM")
+    seconds_per_pixel = _benchmark_routing(
+        routing_method, target_srs_wkt, pixel_size, n_tfa)
+    if n_tfa:
+        seconds_per_pixel['streams'] *= n_tfa
+
+    stages = {}
+    for stage_name, stage_bytes_per_pixel in bytes_per_pixel.items():
+        stages[stage_name] = {
+            'bytes': stage_bytes_per_pixel * n_pixels,
+            'seconds': seconds_per_pixel[stage_name] * n_pixels,
+        }
+
+    # Find the nearest directory that exists so we can check free space
+    # without creating the workspace.
+    existing_dir = os.path.abspath(workspace)
+    while not os.path.exists(existing_dir):
+        existing_dir = os.path.dirname(existing_dir)
+
+    return {
+        'target_size': (n_cols, n_rows),
+        'n_pixels': n_pixels,
+        'http_bytes': source_n_cols * source_n_rows * dem_bytes_per_pixel,
+        'stages': stages,
+        'total_bytes': sum(stage['bytes'] for stage in stages.values()),
+        'total_seconds': sum(stage['seconds'] for stage in stages.values()),
+        'free_bytes': shutil.disk_usage(existing_dir).free,
+    }
+
+
+def _log_plan(plan: Dict) -> None:
+    """Log the results of ``_plan_preprocessing`` in a readable format.
+
+    Args:
+        plan: The dict returned by ``_plan_preprocessing``.
+
+    Returns:
+        ``None``
+    """
+    gib = 1024 ** 3
+    n_cols, n_rows = plan['target_size']
+    LOGGER.info(f"Target grid: {n_cols} x {n_rows} "
+                f"({plan['n_pixels']:,} pixels)")
+    LOGGER.info(f"Expected HTTP transfer (uncompressed upper bound): "
+                f"{plan['http_bytes'] / gib:.2f} GiB")
+    for stage_name, stage in plan['stages'].items():
+        LOGGER.info(f"  {stage_name:<12} {stage['bytes'] / gib:8.2f} GiB "
+                    f"{stage['seconds'] / 60:10.1f} minutes")
+    LOGGER.info(f"Total: {plan['total_bytes'] / gib:.2f} GiB uncompressed, "
+                f"{plan['total_seconds'] / 60:.1f} minutes of processing")
+    if plan['total_bytes'] > plan['free_bytes']:
+        LOGGER.warning(
+            f"Only {plan['free_bytes'] / gib:.2f} GiB free in the "
+            "workspace's filesystem; outputs will not fit.")
+
+
+def preprocess_dem(
+        dem: str,
+        aoi: str,
+        workspace: str,
+        tfa: str = None,
+        pixel_size: List[float] = None,
+        routing_method: str = 'D8',
+        resample_method: Optional[str] = 'near',
+        target_epsg: Optional[Union[str, int]] = None,
+        plan: bool = False,
+        n_threads: Optional[int] = None,
+        warp_memory: Optional[int] = None,
+        creation_options: Optional[str] = None,
+        cleanup: str = 'none',
+        outlets: Optional[str] = None
+        ) -> None:
+    """Preprocess a DEM.
+
+    Args:
+        dem: The DEM to use.  Currently only supports SRTM.
+        aoi: The path to an AOI vector to use on disk.
+        tfa: The threshold flow accumulation value in the form
+            'start:stop:step'
+        workspace: The output workspace directory.
+        pixel_size: The target pixel size in projected units.  A list of 2
+            floats or a string in the format '30,30'
+        routing_method: Either D8 or MFD
+        resample_method: A valid GDAL resample method string
+        target_epsg: A string or int EPSG code.
+        plan: If ``True``, log the estimated size and runtime of each stage
+            instead of running them.
+        n_threads: The number of threads to use when warping.  If not
+            provided, the number of CPUs is used.
+        warp_memory: The warp memory limit in MB.  If not provided, see
+            ``_default_warp_memory``.
+        creation_options: Comma-separated GTiff creation options for every
+            raster written.  If not provided, ``DEFAULT_CREATION_OPTIONS``
+            are used.
+        cleanup: Either ``'none'`` or ``'intermediates'``.  If
+            ``'intermediates'``, the warped and pit-filled DEMs are removed
+            once the tasks that read them are complete.
+        outlets: The path to a vector of outlet points.  If provided,
+            watersheds are delineated from a D8 flow direction raster and
+            their terrain is summarized in a CSV table.
+
+    Returns:
+        ``None``
+    """
+    workspace = os.path.normcase(os.path.normpath(workspace))
+    vector_info = pygeoprocessing.get_vector_info(aoi)
+
+    target_srs = osr.SpatialReference()
+    if target_epsg is not None:
+        LOGGER.info(f"Output will use user-defined EPSG code {target_epsg}")
+        target_srs.ImportFromEPSG(int(target_epsg))
+        target_srs_wkt = target_srs.ExportToWkt()
+    else:
+        target_srs_wkt = vector_info['projection_wkt']
+        target_srs.ImportFromWkt(target_srs_wkt)
+        target_epsg = target_srs.GetAttrValue('AUTHORITY', 1)
+        LOGGER.info(
+            "Output will use the AOI vector's projection, "
+            f"EPSG: {target_epsg}")
+
+    # Get the target bounding box in WGS84 coordinates for the VRT.
+    LOGGER.info("Transforming the AOI bbox to WGS84")
+    wgs84_bbox = pygeoprocessing.transform_bounding_box(
+        vector_info['bounding_box'], vector_info['projection_wkt'],
+        WGS84_SRS_WKT)
+
+    LOGGER.info("Transforming the WGS84 bbox to the target EPSG")
+    target_bbox = pygeoprocessing.transform_bounding_box(
+        wgs84_bbox, WGS84_SRS_WKT, target_srs_wkt)
+
+    if isinstance(pixel_size, str):
+        pixel_size = [int(s) for s in pixel_size.split(',')]
+
+    if not pixel_size:
+        target_srs_units = target_srs.GetAttrValue('UNIT')
+        if target_srs_units not in ('m', 'meter', 'metre'):
+            raise ValueError(
+                f"Target EPSG units are not in meters ({target_srs_units}), "
+                "so you must define the pixel size at the CLI. "
+                "Example: --pixel_size=30,30")
+
+    if plan:
+        if not pixel_size:
+            pixel_size = _default_pixel_size(
+                KNOWN_DEM_PROPERTIES[dem]['pixel_size'], wgs84_bbox)
+        n_tfa = 0
+        if tfa:
+            tfa_start, tfa_stop, tfa_step = tfa.split(":")
+            n_tfa = len(range(int(tfa_start), int(tfa_stop)+1, int(tfa_step)))
+        _log_plan(_plan_preprocessing(
+            dem, wgs84_bbox, target_bbox, target_srs_wkt, pixel_size,
+            routing_method.lower(), n_tfa, workspace))
+        return
+
+    if n_threads is None:
+        n_threads = multiprocessing.cpu_count()
+    if warp_memory is None:
+        warp_memory = _default_warp_memory()
+    if creation_options is None:
+        creation_options = DEFAULT_CREATION_OPTIONS
+    else:
+        creation_options = tuple(
+            option.strip() for option in creation_options.split(','))
+    raster_driver_creation_tuple = ('GTIFF', tuple(creation_options))
+
+    if not os.path.exists(workspace):
+        os.makedirs(workspace)
+
+    graph = taskgraph.TaskGraph(
+        os.path.join(workspace, '.taskgraph'),
+        n_workers=multiprocessing.cpu_count())
+    LOGGER.info(f"Writing output files to {workspace}")
+
+    # Build a VRT clipped to the AOI so that the warp only has a local file
+    # to deal with and we can read the source pixel size cheaply.
+    LOGGER.info("Building a VRT for the clipped bounds")
+    source_url = KNOWN_DEMS[dem]
+    vrt_path = os.path.join(workspace, f'wgs84-{dem}.vrt')
+    vrt_task = graph.add_task(
+        _write_vrt,
+        kwargs={
+            'source_raster_url': source_url,
+            'target_vrt_path': vrt_path,
+            'gdal_kwargs': {
+                'outputBounds': wgs84_bbox,
+            },
+        },
+        task_name='Build VRT',
+        dependent_task_list=[],
+        target_path_list=[vrt_path],
+    )
+
+    if not pixel_size:
+        source_raster_info = pygeoprocessing.get_raster_info(vrt_path)
+        pixel_size = _default_pixel_size(
+            source_raster_info['pixel_size'][0], wgs84_bbox)
+
+    # Warp to the target projection
+    LOGGER.info(f"Warping {dem} to local projection with "
+                f"{resample_method} using {n_threads} threads and "
+                f"{warp_memory} MB of warp memory")
+    warped_raster = os.path.join(workspace, f'warped-{dem}.tif')
+    warped_task = graph.add_task(
+        _warp_dem,
+        kwargs={
+            'base_raster_path': vrt_path,
+            'target_raster_path': warped_raster,
+            'target_pixel_size': pixel_size,
+            'target_bb': target_bbox,
+            'target_projection_wkt': target_srs_wkt,
+            'resample_method': resample_method,
+            'n_threads': n_threads,
+            'warp_memory': warp_memory,
+            'raster_driver_creation_tuple': raster_driver_creation_tuple,
+        },
+        task_name='Fetch and warp DEM',
+        target_path_list=[warped_raster],
+        dependent_task_list=[vrt_task]
+    )
+
+    LOGGER.info("Filling pits")
+    filled_raster = os.path.join(workspace, f'pitfilled-{dem}.tif')
+    pitfilling_task = graph.add_task(
+        pygeoprocessing.routing.fill_pits,
+        args=[(warped_raster, 1), filled_raster],
+        kwargs={'raster_driver_creation_tuple': raster_driver_creation_tuple},
+        task_name='Fill pits',
+        target_path_list=[filled_raster],
+        dependent_task_list=[warped_task]
+    )
+
+    LOGGER.info(f"Calculating {routing_method} flow direction")
+    routing_method = routing_method.lower()
+    flow_dir_func, flow_accum_func, _ = _get_routing_functions(routing_method)
+
+    LOGGER.info("Calculating flow direction")
+    flow_dir_raster = os.path.join(
+        workspace, f'flowdir-{routing_method}-{dem}.tif')
+    flow_dir_task = graph.add_task(
+        flow_dir_func,
+        args=[(filled_raster, 1), flow_dir_raster],
+        kwargs={'raster_driver_creation_tuple': raster_driver_creation_tuple},
+        task_name='Flow direction',
+        target_path_list=[flow_dir_raster],
+        dependent_task_list=[pitfilling_task]
+    )
+
+    LOGGER.info("Calculating flow accumulation")
+    flow_accum_raster = os.path.join(
+        workspace, f'flowaccum-{routing_method}-{dem}.tif')
+    flow_accum_task = graph.add_task(
+        flow_accum_func,
+        args=[(flow_dir_raster, 1), flow_accum_raster],
+        kwargs={'raster_driver_creation_tuple': raster_driver_creation_tuple},
+        task_name='Flow direction',
+        target_path_list=[flow_accum_raster],
+        dependent_task_list=[flow_dir_task]
+    )
+
+    # Map of intermediate file paths to the tasks that read them.  With
+    # --cleanup=intermediates, each file is removed once all of its readers
+    # are done.
+    intermediate_readers = {
+        warped_raster: [pitfilling_task],
+        filled_raster: [flow_dir_task],
+    }
+
+    if outlets:
+        LOGGER.info("Delineating watersheds from outlets")
+        if routing_method == 'd8':
+            d8_flow_dir_raster = flow_dir_raster
+            d8_flow_dir_task = flow_dir_task
+        else:
+            # Watershed delineation is only available for D8 routing.
+            d8_flow_dir_raster = os.path.join(
+                workspace, f'flowdir-d8-{dem}.tif')
+            d8_flow_dir_task = graph.add_task(
+                pygeoprocessing.routing.flow_dir_d8,
+                args=[(filled_raster, 1), d8_flow_dir_raster],
+                kwargs={'raster_driver_creation_tuple': (
+                    raster_driver_creation_tuple)},
+                task_name='D8 flow direction for watersheds',
+                target_path_list=[d8_flow_dir_raster],
+                dependent_task_list=[pitfilling_task]
+            )
+            intermediate_readers[filled_raster].append(d8_flow_dir_task)
+
+        reprojected_outlets = os.path.join(
+            workspace, f'outlets-{dem}.gpkg')
+        reproject_outlets_task = graph.add_task(
+            pygeoprocessing.reproject_vector,
+            args=[outlets, target_srs_wkt, reprojected_outlets],
+            kwargs={'driver_name': 'GPKG'},
+            task_name='Reproject outlets',
+            target_path_list=[reprojected_outlets],
+            dependent_task_list=[]
+        )
+
+        watersheds_vector = os.path.join(
+            workspace, f'watersheds-{dem}.gpkg')
+        watersheds_task = graph.add_task(
+            pygeoprocessing.routing.delineate_watersheds_d8,
+            args=[(d8_flow_dir_raster, 1), reprojected_outlets,
+                  watersheds_vector],
+            kwargs={'working_dir': workspace},
+            task_name='Delineate watersheds',
+            target_path_list=[watersheds_vector],
+            dependent_task_list=[d8_flow_dir_task, reproject_outlets_task]
+        )
+
+        slope_raster = os.path.join(workspace, f'slope-{dem}.tif')
+        slope_task = graph.add_task(
+            pygeoprocessing.calculate_slope,
+            args=[(warped_raster, 1), slope_raster],
+            kwargs={'raster_driver_creation_tuple': (
+                raster_driver_creation_tuple)},
+            task_name='Slope',
+            target_path_list=[slope_raster],
+            dependent_task_list=[warped_task]
+        )
+
+        watershed_stats_csv = os.path.join(
+            workspace, f'watershed-stats-{dem}.csv')
+        watershed_stats_task = graph.add_task(
+            _watershed_terrain_stats,
+            args=[watersheds_vector, slope_raster, warped_raster,
+                  watershed_stats_csv],
+            task_name='Watershed terrain stats',
+            target_path_list=[watershed_stats_csv],
+            dependent_task_list=[watersheds_task, slope_task]
+        )
+        intermediate_readers[warped_raster].extend(
+            [slope_task, watershed_stats_task])
+
+    if not tfa:
+        LOGGER.info(
+            "No TFA values provided for stream extraction.  If a range of "
+            "TFA-based streams are desired, use --tfa=start:stop:step "
+            "(example: --tfa=100:1000:250)")
+    else:
+        tfa_start, tfa_stop, tfa_step = tfa.split(":")
+        LOGGER.info(
+            f"Starting stream extractions with TFA {tfa_start} to "
+            f"{tfa_stop} at {tfa_step} intervals.")
+
+        # Adding +1 to the end TFA value so that we include the endpoint of
+        # the set.  I think that will be clearer behavior than stopping just
+        # before the end.
+        for tfa in range(int(tfa_start), int(tfa_stop)+1, int(tfa_step)):
+            LOGGER.info(f"Calculating streams with TFA {tfa}")
+            tfa_raster_path = os.path.join(
+                workspace, f'tfa-{dem}-{tfa}.tif')
+            if routing_method == 'd8':
+                _ = graph.add_task(
+                    pygeoprocessing.routing.extract_streams_d8,
+                    args=[(flow_accum_raster, 1), tfa, tfa_raster_path],
+                    kwargs={'raster_driver_creation_tuple': (
+                        raster_driver_creation_tuple)},
+                    task_name='D8 stream extraction',
+                    target_path_list=[tfa_raster_path],
+                    dependent_task_list=[flow_accum_task],
+                )
+            else:
+                _ = graph.add_task(
+                    pygeoprocessing.routing.extract_streams_mfd,
+                    args=[(flow_accum_raster, 1), (flow_dir_raster, 1), tfa,
+                          tfa_raster_path],
+                    kwargs={'raster_driver_creation_tuple': (
+                        raster_driver_creation_tuple)},
+                    task_name='MFD stream extraction',
+                    target_path_list=[tfa_raster_path],
+                    dependent_task_list=[flow_accum_task],
+                )
+
+    if cleanup == 'intermediates':
+        # Removing intermediates means taskgraph will have to recompute them
+        # (and everything downstream) if the workflow is run again.
+        for intermediate_path, reader_tasks in intermediate_readers.items():
+            _ = graph.add_task(
+                _remove_files,
+                args=[[intermediate_path]],
+                task_name=f'Remove {os.path.basename(intermediate_path)}',
+                dependent_task_list=reader_tasks,
+                transient_run=True,
+            )
+
+    graph.close()
+    with tracing.span('run tasks', 'taskgraph', workspace=workspace):
+        graph.join()
+    LOGGER.info("Complete!")
@@ -0,0 +1,1842 @@
+"""Read in a NetCDF file with daily data and sum it up to monthly data.
+
+This script was built by request from Nadine to process monthly climate data
+from NetCDF files that have daily pixel values starting at Jan 1, 1850.
+
+To use this module, call ``rapid-es esm-convert`` with the following
+arguments:
+    Arg 1: The absolute path to the netCDF file to process.  This file must
+        have a "time" variable with units in the format
+        "days since YYYY-MM-DD" (or hours), and one band per day.  The
+        "standard", "gregorian", "proleptic_gregorian", "noleap", "365_day",
+        "all_leap", "366_day" and "360_day" calendars are supported.
+    Arg 2: The range of years to process, in the format "YYYY:YYYY".  Several
+        comma-separated ranges may be given (e.g. "1961:1990,2041:2070"), in
+        which case the file is scanned once and outputs are written for each
+        range.
+    Arg 3: The mode of data processing to use.  This can be one of the
+        following:
+        - "pet": Potential evapotranspiration.  Given the range of years being
+           processed, the mean monthly pixel value is written to a new raster,
+           one per month.
+        - "precip": Precipitation.  One output is created for each month, where
+           the monthly raster represents the monthly precipitation, averaged
+           over the range of years.  A second output is created representing
+           the mean number of monthly rain events.  A third output is created
+           that represents the mean number of rain events per pixel in that
+           month.
+        - "tas": Temperature.  Processing is identical to "pet".
+    Arg 4: (optional) The directory to write outputs to.  Defaults to the
+        current working directory.
+    --workers: (optional) The number of worker processes to read the daily
+        data with.
+    --aoi: (optional) A vector or "minx,miny,maxx,maxy" bounding box.  Only
+        the pixels covering the AOI (plus a small buffer) are read and written.
+    --extremes, --percentiles: (optional, precip only) Extreme precipitation
+        indices and percentiles of daily values to write for each month,
+        computed in the same pass as everything else.
+    --output-format: (optional) "gtiff" (the default) writes one GeoTiff per
+        month.  "stacked-gtiff" writes one compressed 12-band GeoTiff and
+        "netcdf" one NetCDF with a month axis per period and statistic.
+        "none" writes no rasters, for when only tables are needed.
+    --zones: (optional) A raster of zone IDs (e.g. climate zones).  It is
+        resampled onto the NetCDF grid once, with the most common zone in
+        each NetCDF pixel, and the mean of every output in each zone is
+        written to a "{basename}-monthly-{suffix}-by-cz-{years}.csv" table.
+    --ensemble-member: (optional, repeatable) The NetCDF file of another
+        model on the same grid.  Every model's outputs are written, along with
+        the ensemble mean, spread (standard deviation across models) and,
+        for every period after the first, the fraction of models that agree
+        on the sign of the change from the first period.  With --zones, the
+        ensemble outputs get zone tables too.
+    --build-index: (optional) Write a sidecar index of the NetCDF's chunks
+        next to it.  Whenever an up-to-date index exists, the daily data are
+        read straight from the file's bytes rather than through GDAL.  The
+        index can also be built on its own with ``rapid-es esm-index``.
+
+Monthly aggregates (sums and rain event counts) of every year read are cached
+on disk in the workspace, so outputs for any period can be derived without
+reading the daily data again, and an interrupted run resumes from the last
+year cached.  The outputs of every run are recorded in a manifest too, so
+rerunning with the same inputs and parameters writes nothing.
+"""
+import calendar
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import logging
+import math
+import mmap
+import os
+import warnings
+import zlib
+
+import numpy
+from osgeo import gdal
+from osgeo import osr
+
+from . import outputs_manifest
+from . import tracing
+from .utils import array_equals_nodata
+from .utils import pixels_within_memory
+
+LOGGER = logging.getLogger(__name__)
+gdal.UseExceptions()
+
+
+# GDAL by default limits the band count to 32768, but the NetCDF files we're
+# using have WAY more bands than that.
+gdal.SetConfigOption('GDAL_MAX_BAND_COUNT', "100000")
+
+# NetCDFs generally don't provide a spatial reference, so we'll assume WGS84.
+SRS = osr.SpatialReference()
+SRS.ImportFromEPSG(4326)
+SRS_WKT = SRS.ExportToWkt()
+del SRS
+
+# Daily precipitation above this value (mm) counts as a rain event.
+RAIN_EVENT_THRESHOLD = 0.1
+
+# Daily precipitation at or above this value (mm) counts as a wet day when
+# computing dry and wet spells, following the ETCCDI definitions.
+WET_DAY_THRESHOLD = 1.0
+
+# Per-pixel extreme precipitation indices that can be computed monthly:
+#   rx1day: the maximum 1-day precipitation
+#   rx5day: the maximum consecutive 5-day precipitation
+#   cdd: the longest dry spell (consecutive days below WET_DAY_THRESHOLD)
+#   cwd: the longest wet spell (consecutive days at or above WET_DAY_THRESHOLD)
+EXTREME_INDICES = ('rx1day', 'rx5day', 'cdd', 'cwd')
+
+# The number of pixels to pad an AOI window with, so that bilinear resampling
+# of the outputs has the neighbors it needs at the edge of the AOI.
+DEFAULT_AOI_BUFFER = 2
+
+# The number of days in each month of the CF calendars where every year has
+# the same length.
+FIXED_LENGTH_CALENDARS = {
+    'noleap': (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31),
+    '365_day': (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31),
+    'all_leap': (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31),
+    '366_day': (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31),
+    '360_day': (30,) * 12,
+}
+
+# CF calendars that follow the (proleptic) Gregorian calendar.  The
+# "standard" and "gregorian" calendars only differ from it before 1582.
+GREGORIAN_CALENDARS = ('standard', 'gregorian', 'proleptic_gregorian')
+
+# The number of days in each time unit a NetCDF time axis may use.
+TIME_UNITS_IN_DAYS = {
+    'days': 1,
+    'hours': 1 / 24,
+    'minutes': 1 / 1440,
+    'seconds': 1 / 86400,
+}
+
+# A sidecar chunk index of a NetCDF file is written next to it, with this
+# suffix.
+INDEX_SUFFIX = '.index.json'
+INDEX_VERSION = 2
+
+# The HDF5 filters that chunks may be encoded with, by filter code.
+INDEX_FILTERS = {1: 'deflate', 2: 'shuffle', 3: 'fletcher32'}
+
+# The most days read at once: a 31-day month and the 4 days before it that
+# rx5day needs.
+MAX_DAYS_PER_READ = 35
+
+# The directory within the workspace where per-year aggregates are cached.
+CACHE_DIRNAME = 'yearly-aggregates-cache'
+
+# The directory of output manifests, within the cache directory.  Each run
+# has its own small manifest, named by its key, so that runs in the same
+# workspace never rewrite each other's.  A run whose inputs and parameters
+# match a manifest, and whose outputs are unchanged on disk, writes nothing.
+OUTPUTS_MANIFEST_DIRNAME = 'outputs'
+
+# The column headers of monthly zonal tables.
+MONTH_NAMES = [calendar.month_name[i][:3].lower() for i in range(1, 13)]
+
+# How monthly outputs are written:
+#   gtiff: one single-band GeoTIFF per month
+#   stacked-gtiff: one 12-band GeoTIFF per period, one band per month
+#   netcdf: one NetCDF per period with a month axis
+#   none: no rasters, for when only the tables are needed
+OUTPUT_FORMATS = ('gtiff', 'stacked-gtiff', 'netcdf', 'none')
+STACKED_GTIFF_CREATION_OPTIONS = (
+    'TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256', 'COMPRESS=DEFLATE',
+    'PREDICTOR=3', 'INTERLEAVE=BAND', 'BIGTIFF=IF_SAFER')
+NETCDF_CREATION_OPTIONS = (
+    'FORMAT=NC4C', 'COMPRESS=DEFLATE', 'ZLEVEL=4')
+
+
+def read_time_axis(ds):
+    """Read the calendar and the time of every band of a NetCDF dataset.
+
+    Args:
+        ds (gdal.Dataset): The dataset to read from.
+
+    Returns:
+        tuple: The name of the CF calendar, and a numpy array with the number
+            of whole days since the first of January of year 0 of that
+            calendar for every band.
+    """
+    calendar_name = (
+        ds.GetMetadataItem('time#calendar') or 'standard').lower()
+    if (calendar_name not in FIXED_LENGTH_CALENDARS and
+            calendar_name not in GREGORIAN_CALENDARS):
+        raise ValueError(f'Unsupported calendar: {calendar_name}')
+
+    # Units look like "days since 1850-1-1" or "days since 1850-01-01 00:00",
+    # which are not ISO-8601.
+    units, _, reference = ds.GetMetadataItem('time#units').partition(' since ')
+    units = units.strip().lower()
+    if units not in TIME_UNITS_IN_DAYS:
+        raise ValueError(f'Unsupported time units: {units}')
+    year, month, day = [
+        int(float(part)) for part in reference.split()[0].split('-')]
+
+    time_values = ds.GetMetadataItem('NETCDF_DIM_time_VALUES')
+    if time_values:
+        time_values = numpy.array(
+            [float(value) for value in time_values.strip('{}').split(',')])
+        # Time stamps are often at noon, so round down to whole days.
+        day_offsets = numpy.floor(
+            time_values * TIME_UNITS_IN_DAYS[units]).astype(numpy.int64)
+    else:
+        # Without the time values, assume there is a band for every day.
+        day_offsets = numpy.arange(ds.RasterCount, dtype=numpy.int64)
+
+    if calendar_name in FIXED_LENGTH_CALENDARS:
+        days_per_month = FIXED_LENGTH_CALENDARS[calendar_name]
+        reference_day = (
+            year * sum(days_per_month) + sum(days_per_month[:month-1]) +
+            day - 1)
+        return calendar_name, reference_day + day_offsets
+
+    reference_date = numpy.datetime64(f'{year:04d}-{month:02d}-{day:02d}')
+    epoch_day = (reference_date - numpy.datetime64('0000-01-01')).astype(
+        numpy.int64)
+    return calendar_name, epoch_day + day_offsets
+
+
+def get_band_table(ds):
+    """Build a table of the bands covering each month of a NetCDF dataset.
+
+    The time axis is read once and every band is assigned to its month
+    at once, so no band is ever probed individually.
+
+    Args:
+        ds (gdal.Dataset): The dataset to read from.
+
+    Returns:
+        dict: A dict mapping ``(year, month)`` tuples to tuples of the
+            (1-based) index of the month's first band and the number of
+            bands in the month.
+    """
+    calendar_name, days = read_time_axis(ds)
+    if calendar_name in FIXED_LENGTH_CALENDARS:
+        days_per_month = FIXED_LENGTH_CALENDARS[calendar_name]
+        month_starts = numpy.cumsum((0,) + days_per_month[:-1])
+        years, day_of_year = numpy.divmod(days, sum(days_per_month))
+        months = numpy.searchsorted(month_starts, day_of_year, side='right')
+    else:
+        dates = numpy.datetime64('0000-01-01') + days.astype('timedelta64[D]')
+        years = dates.astype('datetime64[Y]').astype(numpy.int64) + 1970
+        months = dates.astype('datetime64[M]').astype(numpy.int64) % 12 + 1
+
+    month_keys = years * 12 + (months - 1)
+    if numpy.any(numpy.diff(month_keys) < 0):
+        raise ValueError('The bands of the dataset are not in time order.')
+    unique_keys, first_band_indexes, band_counts = numpy.unique(
+        month_keys, return_index=True, return_counts=True)
+    # GDAL bands start at 1
+    return {
+        (int(key // 12), int(key % 12) + 1): (int(index) + 1, int(count))
+        for key, index, count in zip(
+            unique_keys, first_band_indexes, band_counts)}
+
+
+def build_chunk_index(netcdf_filepath):
+    """Write a sidecar index of the chunks of a daily NetCDF file.
+
+    The index records the byte offset and size of every chunk of the data
+    variable, how chunks are encoded, the grid and the metadata the converter
+    needs, so that later runs can read any month's bytes directly instead of
+    having GDAL open the file.  Only NetCDF4 (HDF5) files can be indexed.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file to index.
+
+    Returns:
+        str: The path to the index, which is ``netcdf_filepath`` with
+            ``INDEX_SUFFIX`` appended.
+    """
+    # h5py is only needed to build an index, not to read one.
+    import h5py
+
+    def _decode(value):
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        if isinstance(value, numpy.ndarray) and value.size == 1:
+            return value.item()
+        return value
+
+    with h5py.File(netcdf_filepath, 'r') as netcdf:
+        variables = [
+            name for name, item in netcdf.items()
+            if isinstance(item, h5py.Dataset) and item.ndim == 3]
+        if len(variables) != 1:
+            raise ValueError(
+                'Expected exactly one (time, y, x) variable in '
+                f'{netcdf_filepath}, found {variables}')
+        variable_name = variables[0]
+        variable = netcdf[variable_name]
+        dimension_names = []
+        for dimension_index, default_name in enumerate(('time', 'lat', 'lon')):
+            try:
+                dimension_names.append(
+                    variable.dims[dimension_index][0].name.lstrip('/'))
+            except (IndexError, RuntimeError):
+                dimension_names.append(default_name)
+        time_name, y_name, x_name = dimension_names
+
+        filters = []
+        create_plist = variable.id.get_create_plist()
+        for filter_index in range(create_plist.get_nfilters()):
+            filter_code = create_plist.get_filter(filter_index)[0]
+            if filter_code not in INDEX_FILTERS:
+                raise ValueError(
+                    f'Chunks of {variable_name} use HDF5 filter '
+                    f'{filter_code}, which cannot be indexed.')
+            filters.append(INDEX_FILTERS[filter_code])
+
+        chunk_refs = {}
+        if variable.chunks is None:
+            chunk_shape = variable.shape
+            chunk_refs['0.0.0'] = [
+                variable.id.get_offset(), variable.id.get_storage_size(), 0]
+        else:
+            chunk_shape = variable.chunks
+            for chunk_index in range(variable.id.get_num_chunks()):
+                chunk_info = variable.id.get_chunk_info(chunk_index)
+                chunk_key = '.'.join(
+                    str(offset // size) for offset, size in zip(
+                        chunk_info.chunk_offset, chunk_shape))
+                chunk_refs[chunk_key] = [
+                    chunk_info.byte_offset, chunk_info.size,
+                    chunk_info.filter_mask]
+
+        # Like GDAL, treat the variable's _FillValue (or missing_value) as
+        # nodata, or else its default fill value, and present the rows
+        # north-up.
+        attributes = {
+            key: _decode(value) for key, value in variable.attrs.items()
+            if key not in ('DIMENSION_LIST', '_Netcdf4Dimid')}
+        nodata = attributes.get('_FillValue', attributes.get('missing_value'))
+        if nodata is None:
+            nodata = _decode(variable.fillvalue)
+        fill_value = nodata
+        x_coords = netcdf[x_name][:]
+        y_coords = netcdf[y_name][:]
+        x_size = (x_coords[-1] - x_coords[0]) / (len(x_coords) - 1)
+        y_size = abs(y_coords[-1] - y_coords[0]) / (len(y_coords) - 1)
+        geotransform = [
+            float(x_coords[0] - x_size / 2), float(x_size), 0.0,
+            float(y_coords.max() + y_size / 2), 0.0, float(-y_size)]
+
+        metadata = {
+            f'{variable_name}#{key}': str(value)
+            for key, value in attributes.items()}
+        for key, value in netcdf[time_name].attrs.items():
+            if key not in ('DIMENSION_LIST', 'REFERENCE_LIST', 'CLASS',
+                           'NAME', '_Netcdf4Dimid'):
+                metadata[f'time#{key}'] = str(_decode(value))
+        metadata['NETCDF_DIM_time_VALUES'] = '{' + ','.join(
+            repr(float(value)) for value in netcdf[time_name][:]) + '}'
+
+        file_stat = os.stat(netcdf_filepath)
+        index = {
+            'version': INDEX_VERSION,
+            'source_size': file_stat.st_size,
+            'source_mtime_ns': file_stat.st_mtime_ns,
+            'variable': variable_name,
+            'shape': list(variable.shape),
+            'chunks': list(chunk_shape),
+            'dtype': variable.dtype.str,
+            'filters': filters,
+            'fill_value': float(fill_value),
+            'nodata': float(nodata),
+            'flip_y': bool(y_coords[0] < y_coords[-1]),
+            'geotransform': geotransform,
+            'metadata': metadata,
+            'chunk_refs': chunk_refs,
+        }
+
+    index_path = f'{netcdf_filepath}{INDEX_SUFFIX}'
+    with open(f'{index_path}.tmp', 'w') as index_file:
+        json.dump(index, index_file)
+    os.replace(f'{index_path}.tmp', index_path)
+    LOGGER.info(f'Indexed {len(chunk_refs)} chunks of {variable_name} to '
+                f'{index_path}')
+    return index_path
+
+
+class IndexedNetCDF:
+    """Read a daily NetCDF file through its sidecar chunk index.
+
+    This provides the parts of the ``gdal.Dataset`` interface the converter
+    uses, and reads chunks from a memory map of the file, so the file is
+    never opened with GDAL.
+    """
+
+    def __init__(self, netcdf_filepath, index):
+        """Open the NetCDF file for reading.
+
+        Args:
+            netcdf_filepath (str): The path to the NetCDF file.
+            index (dict): The index of the file, from ``build_chunk_index``.
+        """
+        self.index = index
+        self.n_times, self.RasterYSize, self.RasterXSize = index['shape']
+        self.RasterCount = self.n_times
+        self.dtype = numpy.dtype(index['dtype'])
+        self._file = open(netcdf_filepath, 'rb')
+        self._mmap = mmap.mmap(
+            self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def GetMetadataItem(self, key):
+        return self.index['metadata'].get(key)
+
+    def GetGeoTransform(self):
+        return tuple(self.index['geotransform'])
+
+    def GetProjection(self):
+        # NetCDFs generally don't provide a spatial reference.
+        return ''
+
+    def GetRasterBand(self, band_index):
+        return self
+
+    def GetNoDataValue(self):
+        return self.index['nodata']
+
+    def _read_chunk(self, chunk_key):
+        """Decode a single chunk into an array of the full chunk shape."""
+        chunk_shape = self.index['chunks']
+        try:
+            byte_offset, size, filter_mask = self.index['chunk_refs'][
+                chunk_key]
+        except KeyError:
+            # Chunks that were never written hold the fill value.
+            return numpy.full(chunk_shape, self.index['fill_value'],
+                              dtype=self.dtype)
+
+        chunk_bytes = self._mmap[byte_offset:byte_offset+size]
+        # Filters were applied in order when writing, so undo them in
+        # reverse.  A set bit in the mask means that filter was skipped.
+        for filter_index, filter_name in reversed(
+                list(enumerate(self.index['filters']))):
+            if filter_mask & (1 << filter_index):
+                continue
+            if filter_name == 'fletcher32':
+                chunk_bytes = chunk_bytes[:-4]
+            elif filter_name == 'deflate':
+                chunk_bytes = zlib.decompress(chunk_bytes)
+            elif filter_name == 'shuffle':
+                chunk_bytes = numpy.frombuffer(
+                    chunk_bytes, dtype=numpy.uint8).reshape(
+                        self.dtype.itemsize, -1).T.tobytes()
+        return numpy.frombuffer(chunk_bytes, dtype=self.dtype).reshape(
+            chunk_shape)
+
+    def ReadAsArray(self, xoff=0, yoff=0, win_xsize=None, win_ysize=None,
+                    band_list=None):
+        """Read a window of some bands, as ``gdal.Dataset.ReadAsArray``."""
+        if win_xsize is None:
+            win_xsize = self.RasterXSize
+        if win_ysize is None:
+            win_ysize = self.RasterYSize
+        if band_list is None:
+            band_list = range(1, self.n_times+1)
+        time_indexes = numpy.asarray(band_list) - 1
+        time_start = int(time_indexes.min())
+        time_end = int(time_indexes.max()) + 1
+        if self.index['flip_y']:
+            row_start = self.RasterYSize - (yoff + win_ysize)
+        else:
+            row_start = yoff
+        starts = (time_start, row_start, xoff)
+        ends = (time_end, row_start + win_ysize, xoff + win_xsize)
+
+        chunk_shape = self.index['chunks']
+        result = numpy.empty(
+            [end - start for start, end in zip(starts, ends)],
+            dtype=self.dtype.newbyteorder('='))
+        chunk_ranges = [
+            range(start // size, (end - 1) // size + 1)
+            for start, end, size in zip(starts, ends, chunk_shape)]
+        for chunk_position in itertools.product(*chunk_ranges):
+            chunk = self._read_chunk('.'.join(map(str, chunk_position)))
+            chunk_slices = []
+            result_slices = []
+            for position, start, end, size in zip(
+                    chunk_position, starts, ends, chunk_shape):
+                overlap_start = max(start, position * size)
+                overlap_end = min(end, (position + 1) * size)
+                chunk_slices.append(slice(
+                    overlap_start - position * size,
+                    overlap_end - position * size))
+                result_slices.append(slice(
+                    overlap_start - start, overlap_end - start))
+            result[tuple(result_slices)] = chunk[tuple(chunk_slices)]
+
+        if self.index['flip_y']:
+            result = result[:, ::-1]
+        if len(time_indexes) != result.shape[0] or numpy.any(
+                numpy.diff(time_indexes) != 1):
+            result = result[time_indexes - time_start]
+        if result.shape[0] == 1:
+            # GDAL drops the band axis when reading a single band.
+            return result[0]
+        return result
+
+
+def open_netcdf(netcdf_filepath):
+    """Open a daily NetCDF file, through its chunk index if it has one.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file.
+
+    Returns:
+        An ``IndexedNetCDF`` if the file has an up-to-date index from
+        ``build_chunk_index``, otherwise a ``gdal.Dataset``.
+    """
+    index_path = f'{netcdf_filepath}{INDEX_SUFFIX}'
+    if os.path.exists(index_path):
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+        file_stat = os.stat(netcdf_filepath)
+        if (index.get('version') == INDEX_VERSION and
+                index['source_size'] == file_stat.st_size and
+                index['source_mtime_ns'] == file_stat.st_mtime_ns):
+            return IndexedNetCDF(netcdf_filepath, index)
+        LOGGER.warning(f'Ignoring out-of-date index {index_path}')
+    return gdal.Open(f'NETCDF:"{netcdf_filepath}"', gdal.GA_ReadOnly)
+
+
+def write_raster(ds, target_filepath, array, window=None):
+    """Write out a raster to disk.
+
+    Args:
+        ds (gdal.Dataset): A dataset to copy the geotransform and projection
+            from.
+        target_filepath (str): The path to write the raster to.
+        array (numpy.ndarray): The array to write to disk.
+        window (dict): The window of ``ds`` that ``array`` covers, as returned
+            by ``_get_window``.  If ``None``, the array covers all of ``ds``.
+
+    Returns:
+        None
+    """
+    with tracing.span('write raster', 'io', path=target_filepath):
+        driver = gdal.GetDriverByName('GTiff')
+        target_ds = driver.Create(
+            target_filepath, array.shape[1], array.shape[0], 1,
+            gdal.GDT_Float32)
+        source_projection = ds.GetProjection()
+        if not source_projection:
+            source_projection = SRS_WKT
+        target_ds.SetProjection(source_projection)
+        target_ds.SetGeoTransform(_get_window_geotransform(ds, window))
+        target_band = target_ds.GetRasterBand(1)
+        target_band.WriteArray(array)
+        target_band = None
+        target_ds = None
+    tracing.count('bytes_written', array.nbytes)
+    LOGGER.info("Wrote out %s", target_filepath)
+
+
+def write_stacked_raster(ds, target_filepath, arrays, variable_name,
+                         window=None):
+    """Write out one array per month as the bands of a single raster.
+
+    A ``.nc`` target is written as a NetCDF with a ``month`` dimension, and
+    anything else as a compressed, tiled GeoTIFF with one band per month.
+
+    Args:
+        ds (gdal.Dataset): A dataset to copy the geotransform and projection
+            from.
+        target_filepath (str): The path to write the raster to.
+        arrays (list): The 12 arrays to write, January first.
+        variable_name (str): The name of the NetCDF variable to write.  Not
+            used for GeoTIFFs.
+        window (dict): The window of ``ds`` that the arrays cover, as
+            returned by ``_get_window``.  If ``None``, the arrays cover all of
+            ``ds``.
+
+    Returns:
+        None
+    """
+    n_rows, n_cols = arrays[0].shape
+    is_netcdf = target_filepath.lower().endswith('.nc')
+    if is_netcdf:
+        # The netCDF driver has no Create(), so build the dataset in memory
+        # and copy it.
+        target_ds = gdal.GetDriverByName('MEM').Create(
+            '', n_cols, n_rows, len(arrays), gdal.GDT_Float32)
+        target_ds.SetMetadataItem('NETCDF_DIM_EXTRA', '{month}')
+        # 4 is the NetCDF type code for a 32-bit integer.
+        target_ds.SetMetadataItem(
+            'NETCDF_DIM_month_DEF', f'{{{len(arrays)},4}}')
+        target_ds.SetMetadataItem(
+            'NETCDF_DIM_month_VALUES',
+            '{' + ','.join(str(m) for m in range(1, len(arrays)+1)) + '}')
+        target_ds.SetMetadataItem('month#long_name', 'month of year')
+        target_ds.SetMetadataItem('month#axis', 'T')
+    else:
+        target_ds = gdal.GetDriverByName('GTiff').Create(
+            target_filepath, n_cols, n_rows, len(arrays), gdal.GDT_Float32,
+            options=list(STACKED_GTIFF_CREATION_OPTIONS))
+
+    source_projection = ds.GetProjection()
+    if not source_projection:
+        source_projection = SRS_WKT
+    target_ds.SetProjection(source_projection)
+    target_ds.SetGeoTransform(_get_window_geotransform(ds, window))
+    for month_index, array in enumerate(arrays):
+        target_band = target_ds.GetRasterBand(month_index+1)
+        target_band.SetDescription(calendar.month_name[month_index+1])
+        if is_netcdf:
+            target_band.SetMetadataItem('NETCDF_VARNAME', variable_name)
+            target_band.SetMetadataItem('NETCDF_DIM_month', str(month_index+1))
+        target_band.WriteArray(array)
+        target_band = None
+
+    if is_netcdf:
+        gdal.GetDriverByName('netCDF').CreateCopy(
+            target_filepath, target_ds,
+            options=list(NETCDF_CREATION_OPTIONS))
+    target_ds = None
+    LOGGER.info("Wrote out %s", target_filepath)
+
+
+def write_monthly_rasters(ds, netcdf_filepath, years, arrays, suffix=None,
+                          workspace=None, window=None, output_format='gtiff'):
+    """Write out the 12 monthly arrays of a period in an output format.
+
+    Args:
+        ds (gdal.Dataset): A dataset to copy the geotransform and projection
+            from.
+        netcdf_filepath (str): The path to the NetCDF file being processed.
+        years (list): The years of the period.
+        arrays (list): The 12 arrays to write, January first.
+        suffix (str): An optional suffix to add to the filenames.
+        workspace (str): An optional workspace to write the files to.
+        window (dict): The window of ``ds`` that the arrays cover, as
+            returned by ``_get_window``.
+        output_format (str): One of ``OUTPUT_FORMATS``.
+
+    Returns:
+        list: The paths of the files written.
+    """
+    if output_format == 'none':
+        return []
+    if output_format == 'gtiff':
+        target_filenames = []
+        for month_index, array in enumerate(arrays):
+            target_filename = _get_filepath(
+                netcdf_filepath, years, month_index+1, suffix=suffix,
+                workspace=workspace)
+            write_raster(ds, target_filename, array, window)
+            target_filenames.append(target_filename)
+        return target_filenames
+
+    extension = '.nc' if output_format == 'netcdf' else '.tif'
+    target_filename = _get_stacked_filepath(
+        netcdf_filepath, years, suffix=suffix, workspace=workspace,
+        extension=extension)
+    variable_name = suffix.replace('-', '_') if suffix else 'value'
+    with tracing.span('write stacked raster', 'io', path=target_filename):
+        write_stacked_raster(
+            ds, target_filename, arrays, variable_name, window)
+    tracing.count('bytes_written', sum(array.nbytes for array in arrays))
+    return [target_filename]
+
+
+def _get_window(ds, aoi, buffer_pixels):
+    """Translate an AOI into a window of pixels in a dataset.
+
+    Args:
+        ds (gdal.Dataset): The dataset the window is in.
+        aoi (str): Either the path to a vector or a bounding box string in
+            the format ``'minx,miny,maxx,maxy'`` in the dataset's coordinates.
+        buffer_pixels (int): The number of pixels to add on every side of the
+            window, so that later bilinear resampling has the neighbors it
+            needs at the edge of the AOI.
+
+    Returns:
+        dict: A dict with the keys ``xoff``, ``yoff``, ``win_xsize`` and
+            ``win_ysize``.
+    """
+    if os.path.exists(aoi):
+        vector = gdal.OpenEx(aoi, gdal.OF_VECTOR)
+        layer = vector.GetLayer()
+        minx, maxx, miny, maxy = layer.GetExtent()
+        vector_srs = layer.GetSpatialRef()
+        if vector_srs is not None:
+            dataset_srs = osr.SpatialReference()
+            dataset_srs.ImportFromWkt(ds.GetProjection() or SRS_WKT)
+            for srs in (vector_srs, dataset_srs):
+                srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            transform = osr.CoordinateTransformation(vector_srs, dataset_srs)
+            minx, miny, maxx, maxy = transform.TransformBounds(
+                minx, miny, maxx, maxy, 21)
+        layer = None
+        vector = None
+    else:
+        minx, miny, maxx, maxy = [float(coord) for coord in aoi.split(',')]
+
+    x_origin, x_size, _, y_origin, _, y_size = ds.GetGeoTransform()
+
+    # Many ESM grids use longitudes from 0 to 360.
+    if x_origin >= 0 and x_origin + x_size * ds.RasterXSize > 180 and minx < 0:
+        minx += 360
+        maxx += 360
+
+    cols = sorted([(minx - x_origin) / x_size, (maxx - x_origin) / x_size])
+    rows = sorted([(miny - y_origin) / y_size, (maxy - y_origin) / y_size])
+    xoff = max(0, math.floor(cols[0]) - buffer_pixels)
+    yoff = max(0, math.floor(rows[0]) - buffer_pixels)
+    xend = min(ds.RasterXSize, math.ceil(cols[1]) + buffer_pixels)
+    yend = min(ds.RasterYSize, math.ceil(rows[1]) + buffer_pixels)
+    if xend <= xoff or yend <= yoff:
+        raise ValueError(f'The AOI {aoi} does not overlap the dataset.')
+    return {
+        'xoff': xoff,
+        'yoff': yoff,
+        'win_xsize': xend - xoff,
+        'win_ysize': yend - yoff,
+    }
+
+
+def _get_window_geotransform(ds, window):
+    """Get the geotransform of a window of a dataset.
+
+    Args:
+        ds (gdal.Dataset): The dataset the window is in.
+        window (dict): The window, as returned by ``_get_window``, or
+            ``None`` for the whole dataset.
+
+    Returns:
+        tuple: The geotransform of the window.
+    """
+    geotransform = ds.GetGeoTransform()
+    if window is None:
+        return geotransform
+    x_origin, x_size, x_rotation, y_origin, y_rotation, y_size = geotransform
+    return (
+        x_origin + window['xoff'] * x_size + window['yoff'] * x_rotation,
+        x_size,
+        x_rotation,
+        y_origin + window['xoff'] * y_rotation + window['yoff'] * y_size,
+        y_rotation,
+        y_size,
+    )
+
+
+def _get_filepath(netcdf_filepath, years, month, suffix=None, workspace=None):
+    """Generate a filename for the output raster.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file being processed.
+        years (list): A list of years being processed.
+        month (int): The month being processed.
+        suffix (str): An optional suffix to add to the filename.
+        workspace (str): An optional workspace to write the file to.
+            If not provided, the current working directory is implied.
+
+    Returns:
+        str: The filename to write the output raster to.
+    """
+    basename = os.path.basename(os.path.splitext(netcdf_filepath)[0])
+    years_label = f'{min(years)}-{max(years)}'
+    if suffix:
+        suffix = f'-{suffix}'
+    else:
+        suffix = ''
+
+    filename = f'{basename}-{years_label}-{month:02d}{suffix}.tif'
+    if workspace:
+        filename = os.path.join(workspace, filename)
+    return filename
+
+
+def _get_stacked_filepath(netcdf_filepath, years, suffix=None,
+                          workspace=None, extension='.tif'):
+    """Generate a filename for an output holding all 12 months of a period.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file being processed.
+        years (list): A list of years being processed.
+        suffix (str): An optional suffix to add to the filename.
+        workspace (str): An optional workspace to write the file to.
+            If not provided, the current working directory is implied.
+        extension (str): The file extension, including the dot.
+
+    Returns:
+        str: The filename to write the output to.
+    """
+    basename = os.path.basename(os.path.splitext(netcdf_filepath)[0])
+    years_label = f'{min(years)}-{max(years)}'
+    if suffix:
+        suffix = f'-{suffix}'
+    else:
+        suffix = ''
+
+    filename = f'{basename}-{years_label}-monthly{suffix}{extension}'
+    if workspace:
+        filename = os.path.join(workspace, filename)
+    return filename
+
+
+def _get_cache_dir(netcdf_filepath, workspace, window=None):
+    """Get the directory where per-year aggregates of a NetCDF are cached.
+
+    The directory name includes the size and modification time of the
+    NetCDF file and the window being read, so a changed file or a different
+    AOI never reuses stale aggregates.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file being processed.
+        workspace (str): The directory outputs are written to.
+        window (dict): The window being read, as returned by ``_get_window``,
+            or ``None`` for the whole grid.
+
+    Returns:
+        str: The path to the cache directory, which will exist.
+    """
+    basename = os.path.basename(os.path.splitext(netcdf_filepath)[0])
+    file_stat = os.stat(netcdf_filepath)
+    cache_label = f'{basename}-{file_stat.st_size}-{file_stat.st_mtime_ns}'
+    if window is not None:
+        cache_label += (
+            f"-{window['xoff']}-{window['yoff']}-{window['win_xsize']}"
+            f"-{window['win_ysize']}")
+    cache_dir = os.path.join(workspace, CACHE_DIRNAME, cache_label)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+
+def _get_outputs_key(mode, netcdf_filepaths, cache_dirs, periods,
+                     statistics, output_format, ensemble_name, zones):
+    """Identify the outputs of a run by its inputs and parameters.
+
+    Args:
+        mode (str): The name of the processing mode.
+        netcdf_filepaths (list): The paths to the NetCDF files.
+        cache_dirs (list): The cache directory of each file, from
+            ``_get_cache_dir``.  These already identify the version of each
+            file and the window being read.
+        periods (list): A list of periods, where each period is a list of
+            integer years.
+        statistics (list): The names of the statistics computed.
+        output_format (str): One of ``OUTPUT_FORMATS``.
+        ensemble_name (str): The basename of the ensemble outputs.
+        zones (str): The path to the zones raster, or ``None``.
+
+    Returns:
+        str: A hex digest of all of the above.
+    """
+    zones_label = None
+    if zones:
+        zones_stat = os.stat(zones)
+        zones_label = [os.path.abspath(zones), zones_stat.st_size,
+                       zones_stat.st_mtime_ns]
+    return hashlib.sha256(json.dumps([
+        mode, [os.path.abspath(path) for path in netcdf_filepaths],
+        [os.path.abspath(path) for path in cache_dirs], periods,
+        list(statistics), output_format, ensemble_name,
+        zones_label]).encode('utf-8')).hexdigest()
+
+
+def _get_outputs_manifest_dir(workspace):
+    """Get the directory of the outputs manifests of a workspace.
+
+    Args:
+        workspace (str): The directory outputs are written to.
+
+    Returns:
+        str: The directory, for ``outputs_manifest``.
+    """
+    return os.path.join(workspace, CACHE_DIRNAME, OUTPUTS_MANIFEST_DIRNAME)
+
+
+def _get_year_cache_path(cache_dir, year):
+    """Get the path to the cached aggregates of a single year.
+
+    Args:
+        cache_dir (str): The cache directory from ``_get_cache_dir``.
+        year (int): The year.
+
+    Returns:
+        str: The path to the ``.npz`` file for the year.
+    """
+    return os.path.join(cache_dir, f'{year}.npz')
+
+
+def _is_year_cached(cache_dir, year, statistics):
+    """Check whether a year's aggregates are cached for all statistics.
+
+    Args:
+        cache_dir (str): The cache directory from ``_get_cache_dir``.
+        year (int): The year.
+        statistics (iterable): The names of the required statistics.
+
+    Returns:
+        bool: Whether every statistic is cached for the year.
+    """
+    cache_path = _get_year_cache_path(cache_dir, year)
+    if not os.path.exists(cache_path):
+        return False
+    with numpy.load(cache_path) as cached_aggregates:
+        return all(statistic in cached_aggregates.files
+                   for statistic in statistics)
+
+
+def _get_bytes_per_pixel(statistics):
+    """Estimate the memory needed per pixel to aggregate a year.
+
+    Args:
+        statistics (iterable): The names of the statistics to compute.  See
+            ``_compute_window_aggregates``.
+
+    Returns:
+        tuple: The approximate number of bytes per pixel of working memory
+            while reading and reducing a month, and of the year's monthly
+            aggregates.
+    """
+    # Each day read is held as its values, its valid mask and its masked
+    # values.
+    bytes_per_day = 4 + 1 + 4
+    if 'rain_events' in statistics:
+        bytes_per_day += 2
+    if 'rx5day' in statistics:
+        # The days joined with the previous days, and their float64
+        # cumulative sums.
+        bytes_per_day += 4 + 8
+    n_percentiles = len([
+        statistic for statistic in statistics
+        if statistic not in ('sum', 'rain_events') and
+        statistic.startswith('p')])
+    if n_percentiles:
+        # The values with nodata as NaN, and the sorted copy
+        # numpy.nanpercentile makes.
+        bytes_per_day += 8 + 8
+    n_grid_statistics = 1 + n_percentiles + len([
+        statistic for statistic in statistics
+        if statistic == 'rain_events' or statistic in EXTREME_INDICES])
+    return MAX_DAYS_PER_READ * bytes_per_day, 12 * 4 * n_grid_statistics
+
+
+def _compute_year_aggregates(ds, band_table, nodata, year, statistics,
+                             window=None, max_memory=None):
+    """Compute the monthly aggregates of a single year.
+
+    If reading a month of the whole window at once would not fit in
+    ``max_memory``, the window is aggregated in strips of rows that do.
+    Strips re-read any NetCDF chunks that straddle them, so they are only
+    used when they have to be.
+
+    Args:
+        ds (gdal.Dataset): The dataset to read from.
+        band_table (dict): The bands of each month, from ``get_band_table``.
+        nodata (float): The nodata value of the dataset's bands, or ``None``.
+        year (int): The year to aggregate.
+        statistics (iterable): The names of the statistics to compute.  See
+            ``_compute_window_aggregates``.
+        window (dict): The window to read, as returned by ``_get_window``,
+            or ``None`` to read the whole grid.
+        max_memory (int): The approximate memory budget in bytes, or
+            ``None`` to read whole months at once.
+
+    Returns:
+        dict: A dict mapping statistic names to arrays with one entry (or one
+            ``(y, x)`` array) per month.
+    """
+    if window is None:
+        window = {'xoff': 0, 'yoff': 0, 'win_xsize': ds.RasterXSize,
+                  'win_ysize': ds.RasterYSize}
+    n_cols, n_rows = window['win_xsize'], window['win_ysize']
+    working_bytes, aggregate_bytes = _get_bytes_per_pixel(statistics)
+    strip_pixels = None
+    if max_memory is not None:
+        # The aggregates of the whole window are held throughout, and each
+        # strip needs working memory and aggregates of its own.
+        strip_pixels = pixels_within_memory(
+            max(0, max_memory - aggregate_bytes * n_cols * n_rows),
+            working_bytes + aggregate_bytes)
+
+    if strip_pixels is None or strip_pixels >= n_cols * n_rows:
+        aggregates = _compute_window_aggregates(
+            ds, band_table, nodata, year, statistics, window)
+    else:
+        strip_rows = max(1, strip_pixels // n_cols)
+        LOGGER.debug(f'Aggregating {year} in strips of {strip_rows} rows')
+        aggregates = {}
+        for row_offset in range(0, n_rows, strip_rows):
+            strip_window = dict(
+                window, yoff=window['yoff'] + row_offset,
+                win_ysize=min(strip_rows, n_rows - row_offset))
+            strip_aggregates = _compute_window_aggregates(
+                ds, band_table, nodata, year, statistics, strip_window)
+            for statistic, array in strip_aggregates.items():
+                if array.ndim == 3:
+                    if statistic not in aggregates:
+                        aggregates[statistic] = numpy.zeros(
+                            (12, n_rows, n_cols), dtype=array.dtype)
+                    aggregates[statistic][
+                        :, row_offset:row_offset + array.shape[1]] = array
+                elif statistic == 'rain_days_anywhere':
+                    # A day has rain anywhere if it has rain in any strip.
+                    aggregates[statistic] = (
+                        aggregates.get(statistic, False) | array)
+                else:
+                    # The number of days is the same in every strip.
+                    aggregates[statistic] = array
+
+    if 'rain_days_anywhere' in aggregates:
+        aggregates['rain_events_anywhere'] = numpy.count_nonzero(
+            aggregates.pop('rain_days_anywhere'), axis=1).astype(numpy.int32)
+    return aggregates
+
+
+def _compute_window_aggregates(ds, band_table, nodata, year, statistics,
+                               window=None):
+    """Compute the monthly aggregates of a single year in a single pass.
+
+    Args:
+        ds (gdal.Dataset): The dataset to read from.
+        band_table (dict): The bands of each month, from ``get_band_table``.
+        nodata (float): The nodata value of the dataset's bands, or ``None``.
+        year (int): The year to aggregate.
+        statistics (iterable): The names of the statistics to compute.  The
+            number of days and the sum of valid daily values are always
+            computed.  If ``'rain_events'`` is included, the number of rain
+            events per pixel and which days had rain anywhere (as a
+            ``(12, 31)`` boolean array named ``'rain_days_anywhere'``) are
+            also computed.  Any of the ``EXTREME_INDICES`` may be included,
+            as well as percentiles of the month's daily values named like
+            ``'p90'``.
+        window (dict): The window to read, as returned by ``_get_window``,
+            or ``None`` to read the whole grid.
+
+    Returns:
+        dict: A dict mapping statistic names to arrays with one entry (or one
+            ``(y, x)`` array) per month.
+    """
+    if window is None:
+        grid_shape = (12, ds.RasterYSize, ds.RasterXSize)
+    else:
+        grid_shape = (12, window['win_ysize'], window['win_xsize'])
+    aggregates = {
+        'n_days': numpy.zeros(12, dtype=numpy.int32),
+        'sum': numpy.zeros(grid_shape, dtype=numpy.float32),
+    }
+    if 'rain_events' in statistics:
+        aggregates['rain_events'] = numpy.zeros(
+            grid_shape, dtype=numpy.float32)
+        aggregates['rain_days_anywhere'] = numpy.zeros(
+            (12, 31), dtype=bool)
+
+    percentile_statistics = [
+        statistic for statistic in statistics
+        if statistic not in aggregates and statistic.startswith('p')]
+    for statistic in (
+            [index for index in EXTREME_INDICES if index in statistics] +
+            percentile_statistics):
+        aggregates[statistic] = numpy.zeros(grid_shape, dtype=numpy.float32)
+
+    # The extreme indices are computed in the same pass as everything else,
+    # with running state that is the size of a single day rather than
+    # holding on to more days than the current month.
+    if 'rx5day' in statistics:
+        # The last 4 days of the previous year, so that 5-day windows ending
+        # early in January are complete.
+        first_band_index = _get_month_bands(band_table, year, 1)[0]
+        n_previous_days = min(4, first_band_index - 1)
+        if n_previous_days:
+            previous_slab, previous_valid_mask = _read_days(
+                ds, first_band_index - n_previous_days, n_previous_days,
+                nodata, window)
+            previous_days = numpy.where(
+                previous_valid_mask, previous_slab, 0)
+        else:
+            previous_days = numpy.zeros((0,) + grid_shape[1:],
+                                        dtype=numpy.float32)
+    if 'cdd' in statistics or 'cwd' in statistics:
+        # Spells run on across months, but start over at the beginning of
+        # each year so that every year can be computed independently.
+        dry_spell = numpy.zeros(grid_shape[1:], dtype=numpy.int32)
+        wet_spell = numpy.zeros(grid_shape[1:], dtype=numpy.int32)
+
+    for month_index in range(12):
+        slab, valid_mask = _get_monthly_pixel_values_from_netcdf(
+            ds, band_table, year, month_index+1, nodata, window)
+        valid_slab = numpy.where(valid_mask, slab, 0)
+        aggregates['n_days'][month_index] = slab.shape[0]
+        aggregates['sum'][month_index] = valid_slab.sum(
+            axis=0, dtype=numpy.float32)
+
+        if 'rx1day' in statistics:
+            aggregates['rx1day'][month_index] = valid_slab.max(axis=0)
+
+        if 'rx5day' in statistics:
+            # 5-day sums ending on each day of the month, from a cumulative
+            # sum that starts with a row of zeros.
+            days = numpy.concatenate([previous_days, valid_slab])
+            cumulative_sum = numpy.concatenate([
+                numpy.zeros((1,) + grid_shape[1:]),
+                numpy.cumsum(days, axis=0, dtype=numpy.float64)])
+            window_ends = numpy.arange(previous_days.shape[0], days.shape[0])
+            window_starts = numpy.maximum(0, window_ends - 4)
+            aggregates['rx5day'][month_index] = (
+                cumulative_sum[window_ends + 1] -
+                cumulative_sum[window_starts]).max(axis=0)
+            previous_days = days[-4:]
+
+        if 'cdd' in statistics or 'cwd' in statistics:
+            longest_dry_spell = numpy.zeros(grid_shape[1:], dtype=numpy.int32)
+            longest_wet_spell = numpy.zeros(grid_shape[1:], dtype=numpy.int32)
+            for daily_array, daily_mask in zip(slab, valid_mask):
+                wet_day = daily_mask & (daily_array >= WET_DAY_THRESHOLD)
+                dry_day = daily_mask & ~wet_day
+                dry_spell = numpy.where(dry_day, dry_spell + 1, 0)
+                wet_spell = numpy.where(wet_day, wet_spell + 1, 0)
+                numpy.maximum(longest_dry_spell, dry_spell,
+                              out=longest_dry_spell)
+                numpy.maximum(longest_wet_spell, wet_spell,
+                              out=longest_wet_spell)
+            if 'cdd' in statistics:
+                aggregates['cdd'][month_index] = longest_dry_spell
+            if 'cwd' in statistics:
+                aggregates['cwd'][month_index] = longest_wet_spell
+
+        if percentile_statistics:
+            with warnings.catch_warnings():
+                # Pixels that are nodata on every day are all-NaN slices.
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                percentiles = numpy.nanpercentile(
+                    numpy.where(valid_mask, slab, numpy.nan),
+                    [float(statistic[1:])
+                     for statistic in percentile_statistics], axis=0)
+            for statistic, percentile_array in zip(
+                    percentile_statistics, percentiles):
+                aggregates[statistic][month_index] = numpy.nan_to_num(
+                    percentile_array)
+
+        if 'rain_events' in statistics:
+            # Count up the rain events: the number of days with rain on any
+            # valid pixel, and the number of days with rain on each pixel.
+            rain_events_mask = slab > RAIN_EVENT_THRESHOLD
+            aggregates['rain_days_anywhere'][month_index, :slab.shape[0]] = (
+                (rain_events_mask & valid_mask).any(axis=(1, 2)))
+            aggregates['rain_events'][month_index] = rain_events_mask.sum(
+                axis=0, dtype=numpy.float32)
+    return aggregates
+
+
+def _cache_year_aggregates(netcdf_filepath, years, statistics, cache_dir,
+                           window=None, max_memory=None):
+    """Compute and cache the monthly aggregates of several years.
+
+    The NetCDF is opened here rather than passed in so that this function can
+    run in a worker process with its own GDAL handle.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file to read.
+        years (list): The integer years to aggregate and cache.
+        statistics (iterable): The names of the statistics to compute.  See
+            ``_compute_window_aggregates``.
+        cache_dir (str): The cache directory from ``_get_cache_dir``.
+        window (dict): The window to read, as returned by ``_get_window``,
+            or ``None`` to read the whole grid.
+        max_memory (int): The approximate memory budget in bytes, or
+            ``None`` for no budget.
+
+    Returns:
+        None
+    """
+    ds = open_netcdf(netcdf_filepath)
+    band_table = get_band_table(ds)
+    nodata = ds.GetRasterBand(1).GetNoDataValue()
+
+    for year in years:
+        LOGGER.info(f'Aggregating {year}')
+        with tracing.span('aggregate year', year=year):
+            aggregates = _compute_year_aggregates(
+                ds, band_table, nodata, year, statistics, window, max_memory)
+
+        # Write to a temporary file first so that an interrupted run never
+        # leaves a partial cache entry behind.
+        cache_path = _get_year_cache_path(cache_dir, year)
+        with open(f'{cache_path}.tmp', 'wb') as cache_file:
+            numpy.savez(cache_file, **aggregates)
+        os.replace(f'{cache_path}.tmp', cache_path)
+
+
+def _aggregate_years(netcdf_filepaths, years, statistics, cache_dirs,
+                     n_workers=1, window=None, max_memory=None):
+    """Cache the monthly aggregates of every year that isn't yet cached.
+
+    This is the only place daily data is read.  Each year of each file is
+    read once, no matter how many periods it belongs to, and later runs reuse
+    the cache.
+
+    When more than one worker is requested, the uncached years of all of the
+    files are split into contiguous runs that are shared among the worker
+    processes, so the members of an ensemble are read concurrently.  Each
+    year's aggregates are computed identically no matter which process
+    computes them, so the outputs are the same as with a single worker.
+
+    Args:
+        netcdf_filepaths (list): The paths to the NetCDF files to read.
+        years (iterable): The integer years that will be needed.
+        statistics (iterable): The names of the statistics to compute.  See
+            ``_compute_window_aggregates``.
+        cache_dirs (list): The cache directory of each file, from
+            ``_get_cache_dir``.
+        n_workers (int): The number of worker processes to use.  If 1, years
+            are aggregated in this process.
+        window (dict): The window to read, as returned by ``_get_window``,
+            or ``None`` to read the whole grid.
+        max_memory (int): The approximate memory budget in bytes, shared
+            among the worker processes, or ``None`` for no budget.
+
+    Returns:
+        None
+    """
+    jobs = []
+    for netcdf_filepath, cache_dir in zip(netcdf_filepaths, cache_dirs):
+        uncached_years = []
+        for year in sorted(set(years)):
+            if _is_year_cached(cache_dir, year, statistics):
+                LOGGER.info(
+                    f'Using cached aggregates for {year} of {netcdf_filepath}')
+            else:
+                uncached_years.append(year)
+        if uncached_years:
+            jobs.append((netcdf_filepath, cache_dir, uncached_years))
+    n_uncached_years = sum(len(job[2]) for job in jobs)
+    if not n_uncached_years:
+        return
+
+    n_workers = max(1, min(n_workers, n_uncached_years))
+    if n_workers == 1:
+        for netcdf_filepath, cache_dir, uncached_years in jobs:
+            _cache_year_aggregates(
+                netcdf_filepath, uncached_years, statistics, cache_dir,
+                window, max_memory)
+        return
+
+    LOGGER.info(f'Aggregating {n_uncached_years} years with {n_workers} '
+                'worker processes')
+    years_per_worker = math.ceil(n_uncached_years / n_workers)
+    worker_max_memory = None
+    if max_memory is not None:
+        worker_max_memory = max_memory // n_workers
+    with concurrent.futures.ProcessPoolExecutor(n_workers) as executor:
+        futures = [
+            executor.submit(
+                _cache_year_aggregates, netcdf_filepath,
+                uncached_years[index:index+years_per_worker], statistics,
+                cache_dir, window, worker_max_memory)
+            for netcdf_filepath, cache_dir, uncached_years in jobs
+            for index in range(0, len(uncached_years), years_per_worker)]
+        for future in concurrent.futures.as_completed(futures):
+            # Raise any exception from the worker.
+            future.result()
+
+
+def _sum_year_aggregates(cache_dir, years):
+    """Sum the cached monthly aggregates over a period of years.
+
+    Args:
+        cache_dir (str): The cache directory from ``_get_cache_dir``.
+        years (list): The integer years in the period.  All of them must
+            already be cached.
+
+    Returns:
+        dict: A dict mapping statistic names to the sum of that statistic
+            over all of the years.
+    """
+    totals = {}
+    for year in years:
+        with numpy.load(_get_year_cache_path(cache_dir, year)) as aggregates:
+            for statistic in aggregates.files:
+                if statistic in totals:
+                    totals[statistic] += aggregates[statistic]
+                else:
+                    totals[statistic] = aggregates[statistic].copy()
+    return totals
+
+
+def _open_ensemble(netcdf_filepaths):
+    """Open the NetCDF files of an ensemble and check they share a grid.
+
+    Args:
+        netcdf_filepaths (list): The paths to the NetCDF files, one per
+            model.
+
+    Returns:
+        list: The open dataset of each file, from ``open_netcdf``.
+    """
+    datasets = [open_netcdf(path) for path in netcdf_filepaths]
+    for netcdf_filepath, ds in zip(netcdf_filepaths[1:], datasets[1:]):
+        if ((ds.RasterXSize, ds.RasterYSize) !=
+                (datasets[0].RasterXSize, datasets[0].RasterYSize) or
+                not numpy.allclose(ds.GetGeoTransform(),
+                                   datasets[0].GetGeoTransform())):
+            raise ValueError(
+                f'{netcdf_filepath} is not on the same grid as '
+                f'{netcdf_filepaths[0]}')
+    return datasets
+
+
+def _get_zones_on_grid(zones_raster_path, ds, window, cache_dir):
+    """Resample a raster of zones onto the grid of a NetCDF, once.
+
+    The zones are resampled with the most common zone in each NetCDF pixel,
+    and cached so that later runs on the same grid reuse them.
+
+    Args:
+        zones_raster_path (str): The path to a raster of integer zone IDs.
+        ds (gdal.Dataset): The NetCDF dataset.
+        window (dict): The window of ``ds`` being read, as returned by
+            ``_get_window``, or ``None`` for the whole grid.
+        cache_dir (str): The directory to cache the resampled zones in.
+
+    Returns:
+        tuple: The array of zone IDs on the grid of the window and the zones'
+            nodata value, or ``None``.
+    """
+    if window is None:
+        n_cols, n_rows = ds.RasterXSize, ds.RasterYSize
+    else:
+        n_cols, n_rows = window['win_xsize'], window['win_ysize']
+    x_origin, x_size, _, y_origin, _, y_size = _get_window_geotransform(
+        ds, window)
+    bounds = [x_origin, y_origin + y_size * n_rows, x_origin + x_size * n_cols,
+              y_origin]
+
+    zones_basename = os.path.basename(os.path.splitext(zones_raster_path)[0])
+    zones_stat = os.stat(zones_raster_path)
+    target_path = os.path.join(
+        cache_dir,
+        f'{zones_basename}-{zones_stat.st_size}-{zones_stat.st_mtime_ns}.tif')
+    if not os.path.exists(target_path):
+        LOGGER.info(f'Resampling {zones_raster_path} onto the NetCDF grid')
+        target_srs = ds.GetProjection() or SRS_WKT
+        if bounds[2] > 180:
+            # Many ESM grids use longitudes from 0 to 360.
+            target_srs = '+proj=longlat +datum=WGS84 +lon_wrap=180 +over'
+        gdal.Warp(
+            f'{target_path}.tmp.tif', zones_raster_path, format='GTiff',
+            outputBounds=bounds, width=n_cols, height=n_rows,
+            dstSRS=target_srs, resampleAlg='mode')
+        os.replace(f'{target_path}.tmp.tif', target_path)
+
+    zones_ds = gdal.OpenEx(target_path, gdal.OF_RASTER)
+    zones_band = zones_ds.GetRasterBand(1)
+    zones = (zones_band.ReadAsArray(), zones_band.GetNoDataValue())
+    zones_band = None
+    zones_ds = None
+    return zones
+
+
+def _get_zone_table_path(workspace, basename, suffix, years):
+    """Get the path of the zone table of one output.
+
+    Args:
+        workspace (str): The directory the table is written to.
+        basename (str): The basename of the output.
+        suffix (str): The suffix of the output, or ``None`` for the main
+            output.
+        years (list): The years of the output's period.
+
+    Returns:
+        str: The path to the CSV.
+    """
+    table_label = f'-{suffix}' if suffix else ''
+    return os.path.join(
+        workspace,
+        f'{basename}-monthly{table_label}-by-cz-{min(years)}-{max(years)}.csv')
+
+
+def _write_zone_table(target_csv, zones, monthly_arrays):
+    """Write the mean of each month's values in each zone to a CSV.
+
+    Args:
+        target_csv (str): The path to the CSV to write.
+        zones (tuple): The array of zone IDs and its nodata value, as
+            returned by ``_get_zones_on_grid``.
+        monthly_arrays (list): The 12 monthly arrays, on the same grid as
+            the zones.
+
+    Returns:
+        None
+    """
+    zones_array, zones_nodata = zones
+    valid_mask = numpy.ones(zones_array.shape, dtype=bool)
+    if zones_nodata is not None:
+        valid_mask = zones_array != zones_nodata
+    zone_ids, zone_index = numpy.unique(
+        zones_array[valid_mask], return_inverse=True)
+    zone_counts = numpy.bincount(zone_index, minlength=len(zone_ids))
+    zone_means = [
+        numpy.bincount(zone_index, weights=array[valid_mask],
+                       minlength=len(zone_ids)) / zone_counts
+        for array in monthly_arrays]
+
+    LOGGER.info(f"Writing zonal table to {target_csv}")
+    with tracing.span('write zone table', 'io', path=target_csv), \
+            open(target_csv, 'w') as target_file:
+        target_file.write(f'cz_id,{",".join(MONTH_NAMES)}\n')
+        for zone_index, zone_id in enumerate(zone_ids):
+            row_data = [str(zone_id)] + [
+                str(means[zone_index]) for means in zone_means]
+            target_file.write(f'{",".join(row_data)}\n')
+
+
+def _update_ensemble_statistics(state, values, change=None):
+    """Add one model's values to the running statistics of an ensemble.
+
+    The mean and variance are updated with Welford's online algorithm, so
+    only one model's values are ever held at once.
+
+    Args:
+        state (dict): The running statistics, updated in place.  Pass an
+            empty dict for the first model.
+        values (numpy.ndarray): The model's values.
+        change (numpy.ndarray): The model's change in values from a baseline
+            period, if there is one.
+
+    Returns:
+        None
+    """
+    if not state:
+        state['n_models'] = 0
+        state['mean'] = numpy.zeros(values.shape, dtype=numpy.float64)
+        state['m2'] = numpy.zeros(values.shape, dtype=numpy.float64)
+        state['increases'] = numpy.zeros(values.shape, dtype=numpy.int32)
+        state['decreases'] = numpy.zeros(values.shape, dtype=numpy.int32)
+    state['n_models'] += 1
+    delta = values - state['mean']
+    state['mean'] += delta / state['n_models']
+    state['m2'] += delta * (values - state['mean'])
+    if change is not None:
+        state['increases'] += change > 0
+        state['decreases'] += change < 0
+
+
+def _write_outputs(ds, netcdf_filepaths, cache_dirs, periods, get_outputs,
+                   workspace, window=None, output_format='gtiff',
+                   ensemble_name='ensemble', zones=None):
+    """Write the monthly outputs of every period for every file.
+
+    With several files (the models of an ensemble), three more outputs are
+    written for every output of the models: the ensemble mean, the spread
+    (the standard deviation across models) and, for every period after the
+    first, the agreement on the sign of the change from the first period
+    (the fraction of models that agree with the majority).  These are
+    accumulated one model at a time as each model's outputs are written.
+
+    If zones are given, the mean of every output in each zone, the ensemble
+    outputs included, is also written to a table named like
+    ``{basename}-monthly-{suffix}-by-cz-{years}.csv``.
+
+    Args:
+        ds (gdal.Dataset): A dataset to copy the geotransform and projection
+            from.
+        netcdf_filepaths (list): The paths to the NetCDF files.
+        cache_dirs (list): The cache directory of each file, from
+            ``_get_cache_dir``.
+        periods (list): A list of periods, where each period is a list of
+            integer years.
+        get_outputs (callable): A function that takes the aggregates of a
+            period from ``_sum_year_aggregates`` and the period's years, and
+            returns a dict mapping output suffixes (``None`` for the main
+            output) to lists of the 12 monthly arrays.
+        workspace (str): The directory to write the output rasters to.
+        window (dict): The window of ``ds`` that was read, as returned by
+            ``_get_window``.
+        output_format (str): One of ``OUTPUT_FORMATS``.
+        ensemble_name (str): The basename of the ensemble outputs.
+        zones (tuple): The zones on the grid of the window, as returned by
+            ``_get_zones_on_grid``, or ``None``.
+
+    Returns:
+        list: The paths of the files written.
+    """
+    output_paths = []
+    # The first period's outputs of each model, kept for the agreement on
+    # the sign of the change in every later period.
+    baselines = {}
+    for period_index, years in enumerate(periods):
+        ensemble = {}
+        for netcdf_filepath, cache_dir in zip(netcdf_filepaths, cache_dirs):
+            outputs = get_outputs(_sum_year_aggregates(cache_dir, years),
+                                  years)
+            basename = os.path.basename(os.path.splitext(netcdf_filepath)[0])
+            for suffix, monthly_arrays in outputs.items():
+                output_paths += write_monthly_rasters(
+                    ds, netcdf_filepath, years, monthly_arrays,
+                    suffix=suffix, workspace=workspace, window=window,
+                    output_format=output_format)
+                if zones is not None:
+                    table_path = _get_zone_table_path(
+                        workspace, basename, suffix, years)
+                    _write_zone_table(table_path, zones, monthly_arrays)
+                    output_paths.append(table_path)
+            if len(netcdf_filepaths) == 1:
+                continue
+
+            for suffix, monthly_arrays in outputs.items():
+                values = numpy.stack(monthly_arrays)
+                change = None
+                if period_index == 0:
+                    baselines[(netcdf_filepath, suffix)] = values
+                else:
+                    change = values - baselines[(netcdf_filepath, suffix)]
+                _update_ensemble_statistics(
+                    ensemble.setdefault(suffix, {}), values, change)
+
+        for suffix, state in ensemble.items():
+            ensemble_outputs = {
+                'mean': state['mean'],
+                'spread': numpy.sqrt(state['m2'] / state['n_models']),
+            }
+            if period_index > 0:
+                ensemble_outputs['agreement'] = numpy.maximum(
+                    state['increases'], state['decreases']) / state['n_models']
+            for statistic, values in ensemble_outputs.items():
+                statistic_suffix = (
+                    f'{suffix}-{statistic}' if suffix else statistic)
+                output_paths += write_monthly_rasters(
+                    ds, ensemble_name, years, list(values),
+                    suffix=statistic_suffix, workspace=workspace,
+                    window=window, output_format=output_format)
+                if zones is not None:
+                    table_path = _get_zone_table_path(
+                        workspace, ensemble_name, statistic_suffix, years)
+                    _write_zone_table(table_path, zones, list(values))
+                    output_paths.append(table_path)
+    return output_paths
+
+
+def potential_evapotranspiration(netcdf_filepath, periods, workspace,
+                                 n_workers=1, aoi=None,
+                                 aoi_buffer=DEFAULT_AOI_BUFFER,
+                                 output_format='gtiff', ensemble_members=(),
+                                 ensemble_name='ensemble', zones=None,
+                                 max_memory=None):
+    """Write out mean monthly potential evapotranspiration.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file to process.
+            Pixel values represent evapotranspiration per day.
+        periods (list): A list of periods to process, where each period is a
+            list of integer years.
+        workspace (str): The directory to write the output rasters to.
+        n_workers (int): The number of worker processes to use when reading
+            the daily data.
+        aoi (str): An optional vector path or ``'minx,miny,maxx,maxy'``
+            bounding box.  If provided, only the pixels covering the AOI are
+            read and written.
+        aoi_buffer (int): The number of pixels to pad the AOI window with.
+        output_format (str): One of ``OUTPUT_FORMATS``.
+        ensemble_members (iterable): The paths to NetCDF files of other
+            models on the same grid.  If provided, every model's outputs are
+            written along with the ensemble statistics.
+        ensemble_name (str): The basename of the ensemble outputs.
+        zones (str): The path to an optional raster of zone IDs.  If
+            provided, it is resampled onto the NetCDF grid and the mean of
+            every output in each zone is written to a table.
+        max_memory (int): The approximate memory budget in bytes for reading
+            the daily data.  If a month of the window doesn't fit, it is
+            read in strips of rows.  If ``None``, whole months are read.
+
+    Returns:
+        None
+    """
+    netcdf_filepaths = [netcdf_filepath] + list(ensemble_members)
+    ds = _open_ensemble(netcdf_filepaths)[0]
+    window = None
+    if aoi:
+        window = _get_window(ds, aoi, aoi_buffer)
+    cache_dirs = [_get_cache_dir(path, workspace, window)
+                  for path in netcdf_filepaths]
+    outputs_key = _get_outputs_key(
+        'pet', netcdf_filepaths, cache_dirs, periods, ('sum',),
+        output_format, ensemble_name, zones)
+    if outputs_manifest.outputs_are_current(
+            _get_outputs_manifest_dir(workspace), outputs_key):
+        LOGGER.info('Outputs are up to date, skipping')
+        return
+    _aggregate_years(
+        netcdf_filepaths, [year for years in periods for year in years],
+        ('sum',), cache_dirs, n_workers, window, max_memory)
+
+    def _get_outputs(totals, years):
+        # PET values should be the mean daily value for the month, averaged
+        # across all of the years.
+        return {None: [
+            totals['sum'][month_index] / totals['n_days'][month_index]
+            for month_index in range(12)]}
+
+    if zones:
+        zones = _get_zones_on_grid(zones, ds, window, cache_dirs[0])
+    output_paths = _write_outputs(
+        ds, netcdf_filepaths, cache_dirs, periods, _get_outputs, workspace,
+        window, output_format, ensemble_name, zones)
+    outputs_manifest.record_outputs(
+        _get_outputs_manifest_dir(workspace), outputs_key, output_paths)
+
+
+def temperature(netcdf_filepath, periods, workspace, n_workers=1, aoi=None,
+                aoi_buffer=DEFAULT_AOI_BUFFER, output_format='gtiff',
+                ensemble_members=(), ensemble_name='ensemble', zones=None,
+                max_memory=None):
+    """Write out mean monthly temperature.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file to process.
+        periods (list): A list of periods to process, where each period is a
+            list of integer years.
+        workspace (str): The directory to write the output rasters to.
+        n_workers (int): The number of worker processes to use when reading
+            the daily data.
+        aoi (str): An optional vector path or ``'minx,miny,maxx,maxy'``
+            bounding box.  If provided, only the pixels covering the AOI are
+            read and written.
+        aoi_buffer (int): The number of pixels to pad the AOI window with.
+        output_format (str): One of ``OUTPUT_FORMATS``.
+        ensemble_members (iterable): The paths to NetCDF files of other
+            models on the same grid.  If provided, every model's outputs are
+            written along with the ensemble statistics.
+        ensemble_name (str): The basename of the ensemble outputs.
+        zones (str): The path to an optional raster of zone IDs.  If
+            provided, it is resampled onto the NetCDF grid and the mean of
+            every output in each zone is written to a table.
+        max_memory (int): The approximate memory budget in bytes for reading
+            the daily data.  If a month of the window doesn't fit, it is
+            read in strips of rows.  If ``None``, whole months are read.
+
+    Returns:
+        None
+    """
+    # The actual calculations for temp are the same as for PET, so just use
+    # that.  The netcdf file is named differently, so the outputs should be
+    # distinct files.
+    potential_evapotranspiration(
+        netcdf_filepath, periods, workspace, n_workers, aoi, aoi_buffer,
+        output_format, ensemble_members, ensemble_name, zones, max_memory)
+
+
+def precipitation(netcdf_filepath, periods, workspace, n_workers=1, aoi=None,
+                  aoi_buffer=DEFAULT_AOI_BUFFER, extremes=(), percentiles=(),
+                  output_format='gtiff', ensemble_members=(),
+                  ensemble_name='ensemble', zones=None, max_memory=None):
+    """Write out mean monthly precipitation and rain events.
+
+    Optionally, monthly extreme precipitation indices and percentiles of
+    daily precipitation are also written, each averaged over the years of the
+    period.
+
+    Args:
+        netcdf_filepath (str): The path to the NetCDF file to process.
+        periods (list): A list of periods to process, where each period is a
+            list of integer years.
+        workspace (str): The directory to write the output rasters to.
+        n_workers (int): The number of worker processes to use when reading
+            the daily data.
+        aoi (str): An optional vector path or ``'minx,miny,maxx,maxy'``
+            bounding box.  If provided, only the pixels covering the AOI are
+            read and written.
+        aoi_buffer (int): The number of pixels to pad the AOI window with.
+        extremes (iterable): Any of the ``EXTREME_INDICES`` to compute.
+        percentiles (iterable): Numeric percentiles (0-100) of each month's
+            daily values to compute.
+        output_format (str): One of ``OUTPUT_FORMATS``.
+        ensemble_members (iterable): The paths to NetCDF files of other
+            models on the same grid.  If provided, every model's outputs are
+            written along with the ensemble statistics.
+        ensemble_name (str): The basename of the ensemble outputs.
+        zones (str): The path to an optional raster of zone IDs.  If
+            provided, it is resampled onto the NetCDF grid and the mean of
+            every output in each zone is written to a table.
+        max_memory (int): The approximate memory budget in bytes for reading
+            the daily data.  If a month of the window doesn't fit, it is
+            read in strips of rows.  If ``None``, whole months are read.
+
+    Returns:
+        None
+    """
+    netcdf_filepaths = [netcdf_filepath] + list(ensemble_members)
+    datasets = _open_ensemble(netcdf_filepaths)
+    ds = datasets[0]
+
+    # Units are required to be in mm/day, so assert that.
+    for member_ds in datasets:
+        precip_units = member_ds.GetMetadataItem('pre#units')
+        assert precip_units == 'mm d-1', (
+            f'Unexpected precipitation units: {precip_units}. "mm d-1" '
+            'required.')
+
+    window = None
+    if aoi:
+        window = _get_window(ds, aoi, aoi_buffer)
+    cache_dirs = [_get_cache_dir(path, workspace, window)
+                  for path in netcdf_filepaths]
+    extra_statistics = list(extremes) + [
+        f'p{float(percentile):g}' for percentile in percentiles]
+    outputs_key = _get_outputs_key(
+        'precip', netcdf_filepaths, cache_dirs, periods,
+        ['sum', 'rain_events'] + extra_statistics, output_format,
+        ensemble_name, zones)
+    if outputs_manifest.outputs_are_current(
+            _get_outputs_manifest_dir(workspace), outputs_key):
+        LOGGER.info('Outputs are up to date, skipping')
+        return
+    _aggregate_years(
+        netcdf_filepaths, [year for years in periods for year in years],
+        ['sum', 'rain_events'] + extra_statistics, cache_dirs, n_workers,
+        window, max_memory)
+
+    def _get_outputs(totals, years):
+        # Precip values should be the sum of daily values for the month,
+        # averaged across all of the years.  Rain events and the other
+        # statistics are likewise averaged over the range of years.
+        return {
+            suffix: [totals[statistic][month_index] / len(years)
+                     for month_index in range(12)]
+            for suffix, statistic in (
+                [(None, 'sum'), ('rain-events', 'rain_events')] +
+                [(statistic, statistic) for statistic in extra_statistics])}
+
+    if zones:
+        zones = _get_zones_on_grid(zones, ds, window, cache_dirs[0])
+    output_paths = _write_outputs(
+        ds, netcdf_filepaths, cache_dirs, periods, _get_outputs, workspace,
+        window, output_format, ensemble_name, zones)
+
+    for netcdf_filepath, cache_dir in zip(netcdf_filepaths, cache_dirs):
+        basename = os.path.basename(os.path.splitext(netcdf_filepath)[0])
+        for years in periods:
+            totals = _sum_year_aggregates(cache_dir, years)
+            n_years = len(years)
+            years_label = f'{min(years)}-{max(years)}'
+            rain_events_filepath = os.path.join(
+                workspace,
+                f'{basename}-monthly-rain-events-{years_label}.csv')
+            LOGGER.info(
+                f"Writing rain events table to {rain_events_filepath}")
+            with open(rain_events_filepath, 'w') as rain_events:
+                rain_events.write('month,events\n')
+                for month_index in range(12):
+                    mean_rain_events = (
+                        totals['rain_events_anywhere'][month_index] /
+                        n_years)
+                    rain_events.write(
+                        f'{month_index+1},{mean_rain_events}\n')
+            output_paths.append(rain_events_filepath)
+    outputs_manifest.record_outputs(
+        _get_outputs_manifest_dir(workspace), outputs_key, output_paths)
+
+
+def _get_monthly_pixel_values_from_netcdf(ds, band_table, year, month,
+                                          nodata, window=None):
+    """Read every day of a month from a NetCDF file as a single slab.
+
+    The days of a month are consecutive bands, so they are read together in
+    one multi-band read rather than one band at a time.  This follows the
+    time-major chunk layout of the NetCDF files we use.
+
+    Args:
+        ds (gdal.Dataset): The dataset to read from.
+        band_table (dict): The bands of each month, from ``get_band_table``.
+        year (int): The year to read from.
+        month (int): The month to read from.
+        nodata (float): The nodata value of the dataset's bands, or ``None``.
+        window (dict): The window to read, as returned by ``_get_window``,
+            or ``None`` to read the whole grid.
+
+    Returns:
+        tuple: A tuple containing a ``(day, y, x)`` array of daily pixel values
+            and a mask of valid pixels with the same shape.
+    """
+    first_band_index, n_days = _get_month_bands(band_table, year, month)
+    return _read_days(ds, first_band_index, n_days, nodata, window)
+
+
+def _get_month_bands(band_table, year, month):
+    """Look up the bands covering a month.
+
+    Args:
+        band_table (dict): The bands of each month, from ``get_band_table``.
+        year (int): The year of the month.
+        month (int): The month.
+
+    Returns:
+        tuple: The (1-based) index of the month's first band and the number
+            of bands in the month.
+    """
+    try:
+        return band_table[(year, month)]
+    except KeyError:
+        raise ValueError(
+            f'The dataset has no data for {year}-{month:02d}.')
+
+
+def _read_days(ds, first_band_index, n_days, nodata, window=None):
+    """Read consecutive days from a NetCDF file as a single slab.
+
+    Args:
+        ds (gdal.Dataset): The dataset to read from.
+        first_band_index (int): The (1-based) band index of the first day.
+        n_days (int): The number of days to read.
+        nodata (float): The nodata value of the dataset's bands, or ``None``.
+        window (dict): The window to read, as returned by ``_get_window``,
+            or ``None`` to read the whole grid.
+
+    Returns:
+        tuple: A tuple containing a ``(day, y, x)`` array of daily pixel values
+            and a mask of valid pixels with the same shape.
+    """
+    if window is None:
+        window = {'xoff': 0, 'yoff': 0, 'win_xsize': ds.RasterXSize,
+                  'win_ysize': ds.RasterYSize}
+    with tracing.span('read days', 'io', first_band=first_band_index,
+                      n_days=n_days):
+        slab = ds.ReadAsArray(
+            window['xoff'], window['yoff'], window['win_xsize'],
+            window['win_ysize'],
+            band_list=list(
+                range(first_band_index, first_band_index + n_days)))
+    tracing.count('bytes_read', slab.nbytes)
+    tracing.count('pixels', slab.size)
+    if slab.ndim == 2:
+        # GDAL drops the band axis when reading a single band.
+        slab = slab[numpy.newaxis]
+    return slab, ~array_equals_nodata(slab, nodata)
+
+
+# The processing function of each mode.
+MODES = {
+    'pet': potential_evapotranspiration,
+    'precip': precipitation,
+    'tas': temperature,
+}
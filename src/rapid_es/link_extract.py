@@ -0,0 +1,352 @@
+"""Convert Link et al (2020) data to GeoTiffs.
+
+The data from Link et al (2020) uses custom .npy files to associate source grid
+cells' evapotranspiration with precipitation elsewhere on the globe.  This
+results in a dense data distribution format, but requires conversion to some
+other format in order to use.  This script takes in the custom basin or grid
+cell format used by the datasets and writes out a geotiff.
+
+Usage example:
+
+    rapid-es link-extract --dataset=./data --target=central-australia.tif --mode=grid 16653
+
+See rapid-es link-extract --help for more information about parameters.
+
+Paper is available at: https://essd.copernicus.org/articles/12/1897/2020/essd-12-1897-2020.pdf
+
+The full dataset (69GB in size) can be downloaded from:
+    https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Dataset.zip
+
+Annual datasets (about 20.1 GB each) can be downloaded from:
+    2018: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2018.zip
+    2017: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2017.zip
+    2016: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2016.zip
+    2015: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2015.zip
+    2014: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2014.zip
+    2013: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2013.zip
+    2012: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2012.zip
+    2011: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2011.zip
+    2010: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2010.zip
+    2009: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2009.zip
+    2008: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2008.zip
+    2007: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2007.zip
+    2006: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2006.zip
+    2005: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2005.zip
+    2004: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2004.zip
+    2003: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2003.zip
+    2002: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2002.zip
+    2001: https://hs.pangaea.de/model/WAM-2layers/Link-etal_2019/Inter-annual/2001.zip
+
+This tool expects that the dataset is arranged like so:
+    Dataset/      <---- This is the directory you provide as --dataset
+        2014/     <---- A year we want to extract data from
+        Matrices/
+        etc.
+"""
+import calendar
+import logging
+import os
+
+import numpy
+import pygeoprocessing
+import taskgraph
+from osgeo import gdal
+from osgeo import osr
+
+from . import tracing
+
+gdal.DontUseExceptions()
+
+LOGGER = logging.getLogger(__name__)
+TARGET_NODATA = float(numpy.finfo(numpy.float32).min)
+
+
+def run(ids, et0_array_path, target_raster_path, max_memory=None):
+    """Write pixel values of evapotranspiration for the given basins or cells.
+
+    For each ID provided, this function reads the et0 array and writes
+    the et0 values to the appropriate pixels, adding to any existing values.
+
+    Note:
+        If ``ids`` represents basins, these must be internal basins and the
+        ``et0_array_path`` should be the array file called
+        "Basin_to_Grid_2001_2018_yr(Era_Int).npy".
+
+        If ``ids`` represents gridcells, these must be the IDs of the
+        individual grid cells, and the ``et0_array_path`` should be the array
+        file called "Era_Int_2001_2018_matrix_yr.npy".
+
+
+    Args:
+        ids (iterable): An iterable of internal basin IDs or gridcell IDs.
+        et0_array_path (str): The location of the et0 array file.
+        target_raster_path (str): The path to a raster that already exists on
+            disk.
+        max_memory (int): The approximate memory budget in bytes.  If the
+            et0 array and the target raster don't both fit, the et0 array is
+            memory-mapped rather than loaded.  If ``None``, it is loaded.
+
+    Returns:
+        None.
+    """
+    raster = gdal.Open(target_raster_path, gdal.GA_Update)
+    band = raster.GetRasterBand(1)
+    target_array = numpy.full((raster.RasterYSize, raster.RasterXSize),
+                              TARGET_NODATA, dtype=numpy.float32)
+    _, n_cols = target_array.shape
+    mmap_mode = None
+    if (max_memory is not None and
+            target_array.nbytes + os.path.getsize(et0_array_path) >
+            max_memory):
+        LOGGER.info(f'{et0_array_path} does not fit in the memory budget, '
+                    'memory-mapping it')
+        mmap_mode = 'r'
+    with tracing.span('load et0 array', 'io', path=et0_array_path):
+        source_evaporation_data = numpy.load(
+            et0_array_path, mmap_mode=mmap_mode)
+    tracing.count('bytes_read', source_evaporation_data.nbytes)
+    with tracing.span('accumulate sources'):
+        for source_id in ids:
+            for target_pixel_id in range(source_evaporation_data.shape[0]):
+                water_vol = source_evaporation_data[
+                    target_pixel_id][source_id]
+                if water_vol <= 0:
+                    continue
+                target_row = target_pixel_id // n_cols
+                target_col = target_pixel_id % n_cols
+                existing_value = target_array[target_row][target_col]
+                if numpy.isclose(existing_value, TARGET_NODATA):
+                    existing_value = 0
+                target_array[target_row][target_col] = (
+                    existing_value + water_vol)
+    tracing.count('pixels', target_array.size)
+    with tracing.span('write raster', 'io', path=target_raster_path):
+        band.WriteArray(target_array)
+    tracing.count('bytes_written', target_array.nbytes)
+    band = None
+    raster = None
+
+
+def convert_vector_basin_ids_to_internal(array_location, basin_ids):
+    """Convert basin IDs to table IDs
+
+    Args:
+        array_location (str): The location to where the vector ID array is
+            located.  This should be called "Basin IDs.npy".
+        basin_ids (iterable): An iterable of string or int basin IDs, as they
+            are presented in the WaterGAP vector in the "ID_final" attribute.
+
+    Returns:
+        An iterable of int internal basin IDs.
+    """
+    basin_ids_array = numpy.load(array_location)
+    basin_ids = set(int(basin_id) for basin_id in basin_ids)
+    out_set = set()
+    for n, array_value in enumerate(basin_ids_array):
+        array_value = int(array_value)
+        if array_value in basin_ids:
+            out_set.add(n)
+    return out_set
+
+
+def convert_cell_index_to_internal(array_location, cell_indexes):
+    """Convert cell indices to table IDs.
+
+    Args:
+        array_location (str): The location to where the index ID array is
+            located.  This should be called "considered_cells.npy".
+        basin_ids (iterable): An iterable of string or int basin IDs, as they
+            are presented in the WaterGAP vector in the "ID_final" attribute.
+
+    Returns:
+        An iterable of int internal basin IDs.
+    """
+    valid_gridcells_array = numpy.load(array_location)
+    cell_indexes = set(cell_indexes)
+    converted_indexes = set()
+    for index, (row, col) in enumerate(zip(*valid_gridcells_array)):
+        current_index = row*240 + col
+        if current_index in cell_indexes:
+            converted_indexes.add(index)
+    return converted_indexes
+
+
+def _convert_aoi_to_cell_index(aoi_path, sample_raster_path):
+    """Convert an AOI to cell indices.
+
+    Args:
+        aoi_path (str): The path to an AOI vector.  The 1st layer of this
+            vector will be rasterized and used to determine whether a pixel
+            intersects the aoi.
+        sample_raster_path (str): The path to the sample raster, distributed
+            with the Link et al dataset.
+
+    Returns:
+        A set of flat cell indices.
+    """
+    source_raster_info = pygeoprocessing.get_raster_info(sample_raster_path)
+    cols, rows = source_raster_info['raster_size']
+
+    # Our sample raster is small, so OK to do everything in memory here.
+    driver = gdal.GetDriverByName('MEM')
+    new_raster = driver.Create('', cols, rows, 1, gdal.GDT_Byte)
+    new_raster.SetProjection(source_raster_info['projection_wkt'])
+    new_raster.SetGeoTransform(source_raster_info['geotransform'])
+
+    aoi_vector = gdal.OpenEx(aoi_path)
+    aoi_layer = aoi_vector.GetLayer()
+    gdal.RasterizeLayer(new_raster, [1], aoi_layer, burn_values=[1])
+
+    new_band = new_raster.GetRasterBand(1)
+    raster_array = new_band.ReadAsArray()
+    ids = set()
+    for col in range(cols):
+        for row in range(rows):
+            if raster_array[row, col] == 1:
+                flat_index = (row * cols) + col
+                ids.add(flat_index)
+
+    aoi_layer = None
+    aoi_vector = None
+    new_band = None
+    new_raster = None
+    return ids
+
+
+def _write_extracted_raster(sample_raster_path, source_ids, et0_array_path,
+                            target_raster_path, max_memory=None):
+    """Create the target raster and write the values of the source IDs to it.
+
+    Args:
+        sample_raster_path (str): The path to the sample raster distributed
+            with the Link et al dataset, which has the target grid.
+        source_ids (list): The internal basin IDs or gridcell IDs.
+        et0_array_path (str): The location of the et0 array file.
+        target_raster_path (str): The path to the raster to write.
+        max_memory (int): The approximate memory budget in bytes.  See
+            ``run``.
+
+    Returns:
+        None.
+    """
+    # Create the target raster and set the SRS to WGS84.  The ASCII sample
+    # raster doesn't have a spatial reference.
+    pygeoprocessing.new_raster_from_base(
+        sample_raster_path, target_raster_path, gdal.GDT_Float32,
+        [TARGET_NODATA])
+    wgs84_srs = osr.SpatialReference()
+    wgs84_srs.ImportFromEPSG(4326)
+    raster = gdal.Open(target_raster_path, gdal.GA_Update)
+    raster.SetProjection(wgs84_srs.ExportToWkt())
+    raster = None
+    run(source_ids, et0_array_path, target_raster_path, max_memory)
+
+
+def extract(dataset, target, mode, ids, n_workers=-1, max_memory=None):
+    """Extract a raster of values from Link et al (2020) for a water source.
+
+    Writing the raster is a taskgraph task, cached in a ``.taskgraph``
+    directory next to ``target`` and keyed on the source IDs, the size and
+    modification time of the et0 array, the target path and the memory
+    budget.  A rerun that asks for the same raster again skips reading the
+    (very large) array.
+
+    Args:
+        dataset (str): The path to where the Link et al (2020) dataset lives
+            on disk.
+        target (str): The path to the GeoTiff to write.
+        mode (str): One of ``'basin'``, ``'grid'``, ``'yearly-YYYY'`` or
+            ``'monthly-YYYY-MM'``.
+        ids (list): The basin or grid cell IDs (depending on ``mode``) of the
+            source area, a single ``'basin:ID,ID'`` string, or the path to an
+            AOI vector.
+        n_workers (int): The number of taskgraph workers.  -1 writes the
+            raster in this process.
+        max_memory (int): The approximate memory budget in bytes.  See
+            ``run``.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: When the mode is not recognized, or an AOI is used with
+            the basin mode.
+    """
+    # TODO: function to translate AOI to grid/basin IDs
+    # TODO: should I keep the basin AND the grid IDs?
+    if not (mode in ('basin', 'grid') or mode.startswith('yearly-') or
+            mode.startswith('monthly-')):
+        raise ValueError(f'Could not recognize mode {mode}')
+
+    sample_raster_path = os.path.join(
+        dataset, 'Further Data', 'grid_info_for_arcmap.asc')
+
+    # TODO: provide as "basin:2257950" or "grid:<num>"
+    considered_cells_array_path = os.path.join(
+        dataset, 'Further Data', 'considered_cells.npy')
+    basin_ids_array_path = os.path.join(
+        dataset, 'Further Data', 'Basin_IDs.npy')
+    if len(ids) == 1:
+        if os.path.exists(ids[0]):
+            if mode == 'basin':
+                raise ValueError(
+                    "The basin mode cannot be used with an AOI. "
+                    "You must provide a basin ID instead.")
+            raw_ids = _convert_aoi_to_cell_index(ids[0], sample_raster_path)
+        else:
+            if ids[0].startswith('basin:'):
+                basin_ids = ids[0].replace('basin:', '').split(',')
+                raw_ids = convert_vector_basin_ids_to_internal(
+                    basin_ids_array_path, basin_ids)
+                print(raw_ids)
+            else:
+                raw_ids = [int(ids[0])]
+    else:
+        raw_ids = [int(i) for i in ids]
+
+    if mode == 'basin':
+        source_ids = convert_vector_basin_ids_to_internal(
+            basin_ids_array_path, raw_ids)
+        et0_array_path = os.path.join(
+            dataset, 'Matrices',
+            'Basin_to_grid(Era_Int_2001_2018)',
+            'Basin_to_Grid_2001_2018_yr(Era_Int).npy')
+    elif mode == 'grid':
+        source_ids = convert_cell_index_to_internal(
+            considered_cells_array_path, raw_ids)
+        et0_array_path = os.path.join(
+            dataset, 'Matrices',
+            'Land_cell_to_grid(Era_Int_2001_2018)',
+            'Era_Int_2001_2018_matrix_yr.npy')
+    elif mode.startswith('yearly'):
+        year = mode.replace('yearly-', '')
+        source_ids = convert_cell_index_to_internal(
+            considered_cells_array_path, raw_ids)
+        et0_array_path = os.path.join(
+            dataset, year, f'Era_Int_{year}_matrix_yr.npy')
+    else:
+        source_ids = convert_cell_index_to_internal(
+            considered_cells_array_path, raw_ids)
+        year_month = mode.replace('monthly-', '')
+        year, month = year_month.split('-')
+        month_name = calendar.month_name[int(month)][0:3]
+        et0_array_path = os.path.join(
+            dataset, year, f'Era_Int_{year}_matrix_{month_name}.npy')
+
+    LOGGER.info(f"Extracting values from {mode}(s) "
+                f"{', '.join(str(id_) for id_ in source_ids)} "
+                f"to {target}")
+    LOGGER.debug(f"Using et0 array {et0_array_path}")
+    graph = taskgraph.TaskGraph(
+        os.path.join(os.path.dirname(os.path.abspath(target)), '.taskgraph'),
+        n_workers=n_workers)
+    _ = graph.add_task(
+        _write_extracted_raster,
+        args=[sample_raster_path, sorted(source_ids), et0_array_path,
+              target, max_memory],
+        hash_algorithm='md5',
+        task_name=f'Extract {os.path.basename(target)}',
+        target_path_list=[target])
+    graph.close()
+    graph.join()
+    LOGGER.info(f"Complete!  Output written to {target}")
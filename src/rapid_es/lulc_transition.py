@@ -0,0 +1,292 @@
+"""Create a transition matrix and transition raster of two landcover rasters.
+
+See ``rapid-es lulc-transition --help`` and the landcover-transition README
+for more information.
+"""
+import csv
+import logging
+import os
+import time
+
+import numpy
+import pygeoprocessing
+import taskgraph
+from osgeo import gdal
+
+from . import tracing
+from .utils import array_equals_nodata
+from .utils import iterblocks_aligned
+from .utils import pixels_within_memory
+
+LOGGER = logging.getLogger(__name__)
+
+
+_TARGET_NODATA_INT = -1
+
+# The names of the outputs written to the output directory.
+TRANSITION_MATRIX_NAME = 'transition_matrix_csv.csv'
+TRANSITION_RASTER_NAME = 'transition_raster.tif'
+TRANSITION_RASTER_TABLE_NAME = 'transition_raster_table.csv'
+
+
+def lulc_transition_matrix(
+        from_raster_path, to_raster_path, transition_raster_path,
+        raster_csv_path, out_csv_path, n_workers=-1, max_memory=None):
+    """Create a tabular transition matrix, transition raster and raster table.
+
+    This function creates the following three outputs:
+        Transition matrix (CSV) - a matrix with "From/To" rows and columns
+            where the row keys represent the "from" raster classes, the column
+            keys represent the "to" raster classes, and the values are the
+            counts for how many times the transition occurs. NoData values are
+            included in the row, column keys.
+
+        Transition raster (tif) - a raster of new integer values that
+            represent transitions.
+
+            The transition raster has the following special cases:
+            # nodata -> nodata - should output nodata
+            # x -> x - unchanged values should output the same new class
+            # x -> nodata  - should output a new class value
+            # nodata -> y - should output a new class value
+
+        Transition raster table (CSV) - an accompanying table to the transition
+            raster that has two columns, "Transition Class" and "Transition".
+            "Transition Class" indicates the new class given the unique
+            transition which is described in the "Transition" column.
+
+    Args:
+        from_raster_path (string) - path on disk to the raster to transition
+            from.
+        to_raster_path (string) -  path on disk to the raster transitioned
+            to.
+        transition_raster_path (string) - path on disk to write the new
+            transition raster.
+        raster_csv_path (string) - path on disk to write the raster table that
+            maps the transition path.
+        out_csv_path (string) - path on disk to write the transition matrix.
+        n_workers (int) - the number of taskgraph workers.  -1 runs every
+            stage in this process.
+        max_memory (int) - the approximate memory budget in bytes.  Blocks
+            are as large as the budget allows.  If ``None``, the default
+            block size of ``pygeoprocessing.iterblocks`` is used.
+
+    The alignment and the transitions are taskgraph tasks, cached in a
+    ``.taskgraph`` directory next to ``out_csv_path`` and keyed on the
+    contents of the input rasters and on the output paths, so a rerun with
+    the same inputs skips whatever already completed.
+
+    Return:
+        None
+
+    """
+    from_raster_info = pygeoprocessing.get_raster_info(from_raster_path)
+    to_raster_info = pygeoprocessing.get_raster_info(to_raster_path)
+
+    # Align rasters
+    from_raster_aligned_name = f'{os.path.splitext(os.path.basename(from_raster_path))[0]}_aligned.tif'
+    to_raster_aligned_name = f'{os.path.splitext(os.path.basename(to_raster_path))[0]}_aligned.tif'
+    aligned_from_raster_path = os.path.join(
+            os.path.dirname(from_raster_path), from_raster_aligned_name)
+    aligned_to_raster_path = os.path.join(
+            os.path.dirname(to_raster_path), to_raster_aligned_name)
+
+    graph = taskgraph.TaskGraph(
+        os.path.join(os.path.dirname(os.path.abspath(out_csv_path)),
+                     '.taskgraph'),
+        n_workers=n_workers)
+    align_task = graph.add_task(
+        pygeoprocessing.align_and_resize_raster_stack,
+        args=[[from_raster_path, to_raster_path],
+              [aligned_from_raster_path, aligned_to_raster_path],
+              ['near', 'near'], from_raster_info['pixel_size'],
+              'intersection'],
+        hash_algorithm='md5',
+        task_name='Align landcover rasters',
+        target_path_list=[aligned_from_raster_path, aligned_to_raster_path])
+    _ = graph.add_task(
+        _write_transitions,
+        args=[aligned_from_raster_path, aligned_to_raster_path,
+              from_raster_info['nodata'][0], to_raster_info['nodata'][0],
+              transition_raster_path, raster_csv_path, out_csv_path,
+              max_memory],
+        hash_algorithm='md5',
+        task_name='Count transitions',
+        target_path_list=[
+            transition_raster_path, raster_csv_path, out_csv_path],
+        dependent_task_list=[align_task])
+    graph.close()
+    graph.join()
+
+
+@tracing.traced('write transitions')
+def _write_transitions(
+        aligned_from_raster_path, aligned_to_raster_path, from_nodata,
+        to_nodata, transition_raster_path, raster_csv_path, out_csv_path,
+        max_memory=None):
+    """Write the transition raster and tables of two aligned rasters.
+
+    Args:
+        aligned_from_raster_path (string) - path on disk to the raster to
+            transition from, aligned with ``aligned_to_raster_path``.
+        aligned_to_raster_path (string) - path on disk to the raster
+            transitioned to.
+        from_nodata (number) - the nodata value of the "from" raster.
+        to_nodata (number) - the nodata value of the "to" raster.
+        transition_raster_path (string) - path on disk to write the new
+            transition raster.
+        raster_csv_path (string) - path on disk to write the raster table that
+            maps the transition path.
+        out_csv_path (string) - path on disk to write the transition matrix.
+        max_memory (int) - the approximate memory budget in bytes, or
+            ``None`` for the default block size.
+
+    Return:
+        None
+
+    """
+    # Each block needs the from and to blocks, a sorted copy of each to find
+    # the unique values, the Int32 transition block and the nodata masks.
+    bytes_per_pixel = 2 * sum(
+        numpy.dtype(pygeoprocessing.get_raster_info(path)['numpy_type'])
+        .itemsize
+        for path in (aligned_from_raster_path, aligned_to_raster_path)) + 7
+    largest_block = pixels_within_memory(max_memory, bytes_per_pixel)
+
+    # Create output transition raster
+    pygeoprocessing.new_raster_from_base(
+        aligned_from_raster_path, transition_raster_path, gdal.GDT_Int32,
+        [_TARGET_NODATA_INT])
+
+    # Open the transition raster to write each block to
+    transition_raster = gdal.OpenEx(transition_raster_path, gdal.OF_RASTER | gdal.GA_Update)
+    transition_raster_band = transition_raster.GetRasterBand(1)
+
+    # Set up for tracking transition csv matrix
+    transition_map = {}
+    from_raster_unique_values = set()
+    to_raster_unique_values = set()
+    # Set up for tracking transition raster information
+    transition_str_dict = {}
+    transition_index = 1
+    unchanged_value = 0
+    transition_class_key = {0: {"description": "unchanged", "from": "", "to": ""}}
+
+    # Info needed for logging progress
+    n_cols, n_rows = pygeoprocessing.get_raster_info(
+        aligned_from_raster_path)['raster_size']
+    last_log_time = time.time()
+    n_pixels_processed = 0
+    n_pixels_to_process = n_cols * n_rows
+
+    for block_info, from_raster_matrix, (to_raster_matrix,) in (
+            iterblocks_aligned((aligned_from_raster_path, 1),
+                               [aligned_to_raster_path], largest_block)):
+
+        # Get unique values and add to transition count if not present
+        from_raster_unique = numpy.unique(from_raster_matrix)
+        to_raster_unique = numpy.unique(to_raster_matrix)
+        from_raster_unique_values.update(from_raster_unique)
+        to_raster_unique_values.update(to_raster_unique)
+
+        # Mask nodata if both from_raster and to_raster are nodata
+        nodata_mask = (
+                array_equals_nodata( from_raster_matrix, from_nodata) &
+                array_equals_nodata( to_raster_matrix, to_nodata))
+
+        # Ensure that the transition map stays up to date with all the possible
+        # transitions
+        for from_value in from_raster_unique_values:
+            if from_value not in transition_map:
+                transition_map[from_value] = {lulc_next: 0 for lulc_next in to_raster_unique_values}
+            else:
+                for to_value in to_raster_unique:
+                    if to_value not in transition_map[from_value]:
+                        transition_map[from_value][to_value] = 0
+
+        # Need to iterate over each pixel to know the transition
+        #TODO: A lot of pixel values remain the same, so getting a mask of
+        # only the changed values and iterating over those could provide
+        # significant runtime improvement
+        win_xsize = block_info['win_xsize']
+        win_ysize = block_info['win_ysize']
+
+        transition_array = numpy.empty(
+            (win_ysize, win_xsize), dtype=numpy.int32)
+        transition_array[:] = 0.0
+
+        for row_index in range(win_ysize):
+            for col_index in range(win_xsize):
+                # Transition CSV lookup
+                # TODO: Make sure to check NoData cases
+                from_raster_value = from_raster_matrix[row_index, col_index]
+                to_raster_value = to_raster_matrix[row_index, col_index]
+                # We took care of adding the transition possibilities above,
+                # so we can just increment by 1 here
+                transition_map[from_raster_value][to_raster_value] += 1
+
+                # Transition raster and table
+
+                # If transition does not change, use "same" code
+                code_to_use = unchanged_value
+                transition_str_key = f'{from_raster_value} to {to_raster_value}'
+                if from_raster_value != to_raster_value:
+                    code_to_use = transition_index
+                    if transition_str_key not in transition_str_dict:
+                        transition_str_dict[transition_str_key] = code_to_use
+                        transition_index += 1
+                    else:
+                        code_to_use = transition_str_dict[transition_str_key]
+
+                if code_to_use not in transition_class_key:
+                    transition_class_key[code_to_use] = {
+                        "description": transition_str_key,
+                        "from": from_raster_value, "to": to_raster_value}
+                transition_array[row_index, col_index] = code_to_use
+
+        transition_array[nodata_mask] = _TARGET_NODATA_INT
+        with tracing.span('write block', 'io', **block_info):
+            transition_raster_band.WriteArray(
+                transition_array, block_info['xoff'], block_info['yoff'])
+        tracing.count('bytes_written', transition_array.nbytes)
+
+        n_pixels_processed += win_xsize * win_ysize
+        if time.time() - last_log_time >= 5.0:
+            percent_complete = round(
+                n_pixels_processed / n_pixels_to_process, 4)*100
+            LOGGER.info(f'Transitions {percent_complete:.2f}% complete')
+            last_log_time = time.time()
+
+    LOGGER.info('100.0% complete')
+
+
+    transition_raster_band = None
+    transition_raster = None
+
+    # Write out transitions to CSV
+    with open(out_csv_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        sorted_from_values = sorted(from_raster_unique_values)
+        sorted_to_values = sorted(to_raster_unique_values)
+        print(sorted_to_values)
+        header = ["From/To"] + sorted_to_values
+        writer.writerow(header)
+        for row_key in sorted_from_values:
+            row_to_write = [row_key]
+            for col_key in sorted_to_values:
+                row_to_write += [transition_map[row_key][col_key]]
+            writer.writerow(row_to_write)
+
+    # Write out raster table transitions to CSV
+    with open(raster_csv_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        header = ["transition class", "transition", "from", "to"]
+        writer.writerow(header)
+        nodata_row = ["-1 (nodata)", "nodata to nodata", from_nodata, to_nodata]
+        writer.writerow(nodata_row)
+        for class_key, transition_info in transition_class_key.items():
+            row_to_write = [
+                class_key, transition_info['description'],
+                transition_info['from'], transition_info['to']]
+
+            writer.writerow(row_to_write)
@@ -0,0 +1,89 @@
+"""Manifests of the files a run wrote, to skip rerunning it.
+
+Each run has its own small JSON manifest, named by a key that the caller
+derives from the run's inputs and parameters, so that runs sharing a
+manifest directory never rewrite each other's.  A manifest maps the path of
+every file the run wrote to the size and modification time it was written
+with, and a run is current while every one of those files is unchanged.
+
+This module only uses the standard library.
+"""
+import json
+import logging
+import os
+import tempfile
+
+LOGGER = logging.getLogger(__name__)
+
+
+def get_manifest_path(manifest_dir, key):
+    """Get the path to the manifest of a run.
+
+    Args:
+        manifest_dir (str): The directory of manifests.
+        key (str): The key of the run.
+
+    Returns:
+        str: The path to the run's ``.json`` manifest.
+    """
+    return os.path.join(manifest_dir, f'{key}.json')
+
+
+def outputs_are_current(manifest_dir, key):
+    """Check whether a run's outputs were written and are unchanged since.
+
+    Args:
+        manifest_dir (str): The directory of manifests.
+        key (str): The key of the run.
+
+    Returns:
+        bool: Whether every output recorded for the key still has the size
+            and modification time it was written with.
+    """
+    manifest_path = get_manifest_path(manifest_dir, key)
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as manifest_file:
+        outputs = json.load(manifest_file)
+    for path, (size, mtime_ns) in outputs.items():
+        try:
+            file_stat = os.stat(path)
+        except FileNotFoundError:
+            LOGGER.debug(f'{path} is missing')
+            return False
+        if (file_stat.st_size, file_stat.st_mtime_ns) != (size, mtime_ns):
+            LOGGER.debug(f'{path} changed since it was written')
+            return False
+    return True
+
+
+def record_outputs(manifest_dir, key, output_paths):
+    """Record the outputs of a run in its own manifest.
+
+    The manifest is written to a uniquely named temporary file and then
+    moved into place, so concurrent runs sharing the manifest directory,
+    such as the cells of a scenario matrix, never see a partial manifest.
+
+    Args:
+        manifest_dir (str): The directory of manifests.  It is created if
+            it doesn't exist.
+        key (str): The key of the run.
+        output_paths (list): The paths of every file the run wrote.
+
+    Returns:
+        None
+    """
+    outputs = {}
+    for path in output_paths:
+        file_stat = os.stat(path)
+        outputs[path] = [file_stat.st_size, file_stat.st_mtime_ns]
+    os.makedirs(manifest_dir, exist_ok=True)
+    fd, temporary_path = tempfile.mkstemp(
+        suffix='.tmp', prefix=f'{key}-', dir=manifest_dir)
+    try:
+        with os.fdopen(fd, 'w') as manifest_file:
+            json.dump(outputs, manifest_file, indent=1)
+        os.replace(temporary_path, get_manifest_path(manifest_dir, key))
+    except BaseException:
+        os.remove(temporary_path)
+        raise
@@ -0,0 +1,229 @@
+"""Run the ESM conversion over a matrix of scenarios, years and variables.
+
+The matrix is described by a JSON configuration file, such as::
+
+    {
+        "netcdf_dir": "/data/esm",
+        "workspace": "esm-workspace",
+        "models": ["GFDL-ESM4"],
+        "scenarios": ["ssp126", "ssp585"],
+        "variables": ["pet", "pr", "tas"],
+        "year_ranges": ["1961:1990", "2041:2070", "2071:2100"],
+        "climate_zones": "KG_climatezones.tif"
+    }
+
+Every scenario and variable is converted once for all of the year ranges,
+with the first model's NetCDF as the primary file and the others as members
+of an ensemble.  When ``climate_zones`` is given, the rain events of every
+scenario and year range are then aggregated by climate zone, once the
+scenario's precipitation has been converted.
+
+Each of these steps is a taskgraph task, so steps that don't depend on each
+other run concurrently, and steps that completed (and whose outputs are
+still there) are skipped when the matrix is run again, such as after a
+failure.  The converter's own caches mean that even a step that failed
+partway resumes from the last year it aggregated.  Concurrent steps share
+those caches and the cache of aligned climate zones, which are written
+through unique temporary files so that they never clobber each other.
+"""
+import json
+import logging
+import os
+
+import taskgraph
+
+from . import esm_convert
+from . import zonal_aggregation
+
+LOGGER = logging.getLogger(__name__)
+
+# The converter mode of each variable, as named in the NetCDF filenames.
+VARIABLE_MODES = {
+    'pet': 'pet',
+    'pr': 'precip',
+    'tas': 'tas',
+}
+
+DEFAULT_NETCDF_PATTERN = '{model}_hist_plus_{scenario}_{variable}.nc'
+REQUIRED_KEYS = ('models', 'scenarios', 'variables', 'year_ranges')
+
+
+def load_config(config_path, netcdf_dir=None, workspace=None):
+    """Load and check a scenario matrix configuration file.
+
+    Relative ``netcdf_dir`` and ``workspace`` paths in the file are relative
+    to the directory of the file, and a relative ``climate_zones`` path is
+    relative to ``netcdf_dir``.
+
+    Args:
+        config_path (str): The path to the JSON configuration file.
+        netcdf_dir (str): A directory of NetCDF files to use instead of the
+            file's ``netcdf_dir``.
+        workspace (str): A workspace to use instead of the file's
+            ``workspace``.
+
+    Returns:
+        dict: The configuration, with defaults filled in and absolute paths.
+
+    Raises:
+        ValueError: When a required key is missing or a variable is unknown.
+    """
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+    missing_keys = [key for key in REQUIRED_KEYS if not config.get(key)]
+    if missing_keys:
+        raise ValueError(
+            f"{config_path} is missing {', '.join(missing_keys)}")
+    for variable in config['variables']:
+        if variable not in VARIABLE_MODES:
+            raise ValueError(
+                f"Unknown variable {variable}.  Use one of "
+                f"{', '.join(VARIABLE_MODES)}.")
+
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+    if netcdf_dir is None:
+        netcdf_dir = os.path.join(config_dir, config.get('netcdf_dir', ''))
+    if workspace is None:
+        workspace = os.path.join(config_dir, config.get('workspace', ''))
+    config['netcdf_dir'] = os.path.abspath(netcdf_dir)
+    config['workspace'] = os.path.abspath(workspace)
+    if config.get('climate_zones'):
+        config['climate_zones'] = os.path.join(
+            config['netcdf_dir'], config['climate_zones'])
+    config.setdefault('netcdf_pattern', DEFAULT_NETCDF_PATTERN)
+    return config
+
+
+def _parse_year_range(year_range):
+    """Parse a ``'YYYY:YYYY'`` year range into a list of years."""
+    year_min, year_max = [int(year) for year in year_range.split(':')]
+    return list(range(year_min, year_max+1))
+
+
+def _get_convert_targets(mode, netcdf_filepaths, periods, workspace,
+                         ensemble_name):
+    """Get the paths of every file a conversion step writes.
+
+    Args:
+        mode (str): The converter mode, one of ``esm_convert.MODES``.
+        netcdf_filepaths (list): The paths to the NetCDF files, the primary
+            file first.
+        periods (list): A list of periods, where each period is a list of
+            integer years.
+        workspace (str): The directory outputs are written to.
+        ensemble_name (str): The basename of the ensemble outputs.
+
+    Returns:
+        list: The paths of the monthly rasters of every file, of the
+            ensemble statistics if there are several files, and of the
+            rain events tables of precipitation.
+    """
+    suffixes = [None]
+    if mode == 'precip':
+        suffixes.append('rain-events')
+    target_paths = []
+    for period_index, years in enumerate(periods):
+        for netcdf_filepath in netcdf_filepaths:
+            for suffix in suffixes:
+                target_paths += [
+                    esm_convert._get_filepath(
+                        netcdf_filepath, years, month, suffix, workspace)
+                    for month in range(1, 13)]
+            if mode == 'precip':
+                basename = os.path.splitext(
+                    os.path.basename(netcdf_filepath))[0]
+                target_paths.append(os.path.join(
+                    workspace, f'{basename}-monthly-rain-events-'
+                    f'{min(years)}-{max(years)}.csv'))
+        if len(netcdf_filepaths) == 1:
+            continue
+        statistics = ['mean', 'spread']
+        if period_index > 0:
+            statistics.append('agreement')
+        for suffix in suffixes:
+            for statistic in statistics:
+                target_paths += [
+                    esm_convert._get_filepath(
+                        ensemble_name, years, month,
+                        f'{suffix}-{statistic}' if suffix else statistic,
+                        workspace)
+                    for month in range(1, 13)]
+    return target_paths
+
+
+def run_matrix(config, n_workers=-1, max_memory=None, convert_workers=1):
+    """Convert and aggregate every cell of a scenario matrix.
+
+    Args:
+        config (dict): The configuration, from ``load_config``.
+        n_workers (int): The number of taskgraph workers.  -1 runs every
+            step in this process, one after another.
+        max_memory (int): The approximate memory budget in bytes, shared
+            evenly among the workers, or ``None`` for no budget.
+        convert_workers (int): The number of worker processes each
+            conversion step reads the daily data with.  Each step's share of
+            ``max_memory`` is split among them.
+
+    Returns:
+        None
+    """
+    workspace = config['workspace']
+    if not os.path.exists(workspace):
+        os.makedirs(workspace)
+    periods = [_parse_year_range(year_range)
+               for year_range in config['year_ranges']]
+    step_max_memory = None
+    if max_memory is not None:
+        step_max_memory = max_memory // max(1, n_workers)
+
+    graph = taskgraph.TaskGraph(
+        os.path.join(workspace, '.taskgraph'), n_workers=n_workers)
+    for scenario in config['scenarios']:
+        for variable in config['variables']:
+            mode = VARIABLE_MODES[variable]
+            netcdf_filepaths = [
+                os.path.join(config['netcdf_dir'], config[
+                    'netcdf_pattern'].format(
+                        model=model, scenario=scenario, variable=variable))
+                for model in config['models']]
+            ensemble_name = f'ENSEMBLE_hist_plus_{scenario}_{variable}'
+            convert_task = graph.add_task(
+                esm_convert.MODES[mode],
+                args=[netcdf_filepaths[0], periods, workspace],
+                kwargs={
+                    'n_workers': convert_workers,
+                    'ensemble_members': netcdf_filepaths[1:],
+                    'ensemble_name': ensemble_name,
+                    'max_memory': step_max_memory,
+                },
+                target_path_list=_get_convert_targets(
+                    mode, netcdf_filepaths, periods, workspace,
+                    ensemble_name),
+                task_name=f'Convert {scenario} {variable}')
+
+            if mode != 'precip' or not config.get('climate_zones'):
+                continue
+            basename = os.path.splitext(
+                os.path.basename(netcdf_filepaths[0]))[0]
+            for years in periods:
+                years_label = f'{min(years)}-{max(years)}'
+                target_csv = os.path.join(
+                    workspace,
+                    f'{basename}-monthly-rain-events-by-cz-{years_label}.csv')
+                rain_events_rasters = [
+                    esm_convert._get_filepath(
+                        netcdf_filepaths[0], years, month, 'rain-events',
+                        workspace)
+                    for month in range(1, 13)]
+                graph.add_task(
+                    zonal_aggregation.aggregate_by_zone,
+                    args=[target_csv, config['climate_zones'],
+                          rain_events_rasters],
+                    kwargs={'max_memory': step_max_memory},
+                    target_path_list=[target_csv],
+                    dependent_task_list=[convert_task],
+                    task_name=(
+                        f'Aggregate {scenario} rain events {years_label}'))
+    graph.close()
+    graph.join()
+    LOGGER.info(f'Scenario matrix complete, outputs are in {workspace}')
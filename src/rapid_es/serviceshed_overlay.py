@@ -0,0 +1,389 @@
+"""Sum the weights of overlapping servicesheds onto the grid of a raster.
+
+This does what ``rasterize_servicesheds.R`` and the rasterized approach of
+``Beneficiary_analysis_Ararat_RBMP.R`` do, without a raster per
+serviceshed.  Each block of the output is rasterized once per type of
+serviceshed, with every serviceshed that touches it burned in with
+``MERGE_ALG=ADD`` so that overlapping weights are summed.  The servicesheds
+are bucketed by the blocks their envelopes touch once, up front, so each
+block is rasterized with only its own servicesheds, and blocks that no
+serviceshed touches are skipped without any rasterization at all.
+
+See ``rapid-es serviceshed-overlay --help`` for more information.
+"""
+import logging
+import os
+import re
+
+import numpy
+import pygeoprocessing
+from osgeo import gdal
+from osgeo import ogr
+from osgeo import osr
+
+from . import tracing
+from .utils import pixels_within_memory
+
+LOGGER = logging.getLogger(__name__)
+gdal.UseExceptions()
+
+TARGET_NODATA = float(numpy.finfo(numpy.float32).min)
+
+
+def _get_type_raster_path(target_raster_path, serviceshed_type):
+    """Get the path of the output raster of one type of serviceshed.
+
+    Args:
+        target_raster_path (str): The path of the total output raster.
+        serviceshed_type (str): The type of serviceshed.
+
+    Returns:
+        str: The path, like ``total-fish-farm.tif`` for a type of
+            ``'Fish Farm'`` and a total of ``total.tif``.
+    """
+    base, extension = os.path.splitext(target_raster_path)
+    slug = re.sub(r'[^\w.]+', '-', serviceshed_type.lower()).strip('-')
+    return f'{base}-{slug}{extension}'
+
+
+@tracing.traced('load servicesheds', 'io')
+def _load_servicesheds(vector_path, weight_field, target_srs, type_field=None,
+                       per_area=False):
+    """Load servicesheds into memory, on the target grid's SRS.
+
+    Args:
+        vector_path (str): The path to the vector of servicesheds.
+        weight_field (str): The numeric field with each serviceshed's weight.
+        target_srs (osr.SpatialReference): The SRS of the target grid.
+        type_field (str): The field with each serviceshed's type, if any.
+        per_area (bool): Whether to divide each weight by the serviceshed's
+            area, in the square units of the vector's SRS (or of the target
+            SRS if the vector's isn't projected).
+
+    Returns:
+        dict: Maps each type (or ``None`` without a ``type_field``) to a
+            tuple of a list of its servicesheds' geometries, an array of
+            their weights and a ``(n, 4)`` array of their
+            ``(minx, maxx, miny, maxy)`` envelopes.
+
+    Raises:
+        ValueError: When ``per_area`` is set but neither SRS is projected.
+    """
+    vector = gdal.OpenEx(vector_path, gdal.OF_VECTOR)
+    layer = vector.GetLayer()
+    source_srs = layer.GetSpatialRef()
+    transform = None
+    if source_srs is not None and not source_srs.IsSame(target_srs):
+        source_srs = source_srs.Clone()
+        source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        transform = osr.CoordinateTransformation(source_srs, target_srs)
+    area_in_target_srs = False
+    if per_area:
+        if source_srs is None or not source_srs.IsProjected():
+            if not target_srs.IsProjected():
+                raise ValueError(
+                    'Weighting by area needs the servicesheds or the raster '
+                    'to be in a projected coordinate system')
+            area_in_target_srs = True
+
+    geometries = {}
+    weights = {}
+    envelopes = {}
+    n_skipped = 0
+    n_without_area = 0
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        weight = feature.GetField(weight_field)
+        if geometry is None or geometry.IsEmpty() or weight is None:
+            n_skipped += 1
+            continue
+        weight = float(weight)
+        geometry = geometry.Clone()
+        area = None
+        if per_area and not area_in_target_srs:
+            area = geometry.GetArea()
+        if transform is not None:
+            geometry.Transform(transform)
+        if per_area and area_in_target_srs:
+            area = geometry.GetArea()
+        if area is not None:
+            # Degenerate polygons, lines and points have no area to divide
+            # their weight by.
+            if not area > 0:
+                n_without_area += 1
+                continue
+            weight /= area
+
+        serviceshed_type = None
+        if type_field:
+            serviceshed_type = str(feature.GetField(type_field))
+        geometries.setdefault(serviceshed_type, []).append(geometry)
+        weights.setdefault(serviceshed_type, []).append(weight)
+        envelopes.setdefault(serviceshed_type, []).append(
+            geometry.GetEnvelope())
+    layer = None
+    vector = None
+
+    if n_skipped:
+        LOGGER.warning(
+            f'Skipped {n_skipped} servicesheds without a geometry or a '
+            f'{weight_field}')
+    if n_without_area:
+        LOGGER.warning(
+            f'Skipped {n_without_area} servicesheds without any area to '
+            'weight by')
+    n_servicesheds = sum(
+        len(type_geometries) for type_geometries in geometries.values())
+    LOGGER.info(f'Loaded {n_servicesheds} servicesheds of '
+                f'{len(geometries)} type(s)')
+    return {
+        serviceshed_type: (
+            geometries[serviceshed_type],
+            numpy.array(weights[serviceshed_type], dtype=numpy.float64),
+            numpy.array(envelopes[serviceshed_type], dtype=numpy.float64))
+        for serviceshed_type in geometries}
+
+
+def _bucket_by_block(envelopes, geotransform, raster_size, blocks):
+    """Find the servicesheds whose envelopes touch each block.
+
+    The blocks must tile the raster in a grid, as those of
+    ``pygeoprocessing.iterblocks`` do.  Each serviceshed is bucketed by the
+    range of block rows and columns its envelope covers, so the work is
+    proportional to the number of (serviceshed, block) pairs that touch
+    rather than to the number of servicesheds times the number of blocks.
+
+    Args:
+        envelopes (numpy.ndarray): The ``(n, 4)`` array of
+            ``(minx, maxx, miny, maxy)`` envelopes, as returned by
+            ``_load_servicesheds``.
+        geotransform (list): The geotransform of the raster.
+        raster_size (tuple): The ``(n_cols, n_rows)`` of the raster.
+        blocks (list): The offsets dicts of the raster's blocks.
+
+    Returns:
+        dict: Maps the ``(yoff, xoff)`` of each block that any envelope
+            touches to the array of the indices of those servicesheds.
+    """
+    x_origin, x_size, _, y_origin, _, y_size = geotransform
+    n_cols, n_rows = raster_size
+    block_xoffs = numpy.unique([offsets['xoff'] for offsets in blocks])
+    block_yoffs = numpy.unique([offsets['yoff'] for offsets in blocks])
+
+    # The pixel columns and rows each envelope covers, inclusive.  Envelopes
+    # that end exactly on an edge also get the pixel past it, which only
+    # makes a block a candidate that rasterizes nothing.
+    cols = numpy.floor(
+        (envelopes[:, :2] - x_origin) / x_size).astype(numpy.int64)
+    rows = numpy.floor(
+        (envelopes[:, 2:] - y_origin) / y_size).astype(numpy.int64)
+    col_min, col_max = cols.min(axis=1), cols.max(axis=1)
+    row_min, row_max = rows.min(axis=1), rows.max(axis=1)
+    on_grid = ((col_max >= 0) & (col_min < n_cols) &
+               (row_max >= 0) & (row_min < n_rows))
+
+    block_cols = [
+        numpy.searchsorted(
+            block_xoffs, numpy.clip(col, 0, n_cols - 1), side='right') - 1
+        for col in (col_min, col_max)]
+    block_rows = [
+        numpy.searchsorted(
+            block_yoffs, numpy.clip(row, 0, n_rows - 1), side='right') - 1
+        for row in (row_min, row_max)]
+
+    buckets = {}
+    for index in numpy.flatnonzero(on_grid):
+        for block_row in range(block_rows[0][index], block_rows[1][index]+1):
+            for block_col in range(
+                    block_cols[0][index], block_cols[1][index]+1):
+                buckets.setdefault(
+                    (int(block_yoffs[block_row]),
+                     int(block_xoffs[block_col])), []).append(index)
+    return {
+        block: numpy.array(indices, dtype=numpy.int64)
+        for block, indices in buckets.items()}
+
+
+def _rasterize_block(geometries, weights, block_geotransform,
+                     projection_wkt, win_xsize, win_ysize):
+    """Sum the weights of the servicesheds covering each pixel of a block.
+
+    ``RasterizeLayer`` burns the same attribute into every band, so the
+    number of servicesheds covering each pixel would need a burn of its
+    own.  When every weight is nonzero and of the same sign, a pixel is
+    covered exactly where its summed weight isn't zero, so the block is
+    rasterized once.  Otherwise the count is burned into a second band.
+
+    Args:
+        geometries (list): The geometries of the servicesheds that touch
+            the block.
+        weights (numpy.ndarray): The weight of each of those servicesheds.
+        block_geotransform (tuple): The geotransform of the block.
+        projection_wkt (str): The WKT of the grid's SRS.
+        win_xsize (int): The width of the block.
+        win_ysize (int): The height of the block.
+
+    Returns:
+        tuple: The ``(win_ysize, win_xsize)`` float64 arrays of the summed
+            weights and of the number of servicesheds covering each pixel
+            (or of 1 wherever any does).
+    """
+    covered_where_nonzero = bool(
+        numpy.all(weights > 0) or numpy.all(weights < 0))
+
+    vector = ogr.GetDriverByName('Memory').CreateDataSource('')
+    layer = vector.CreateLayer('servicesheds', None, ogr.wkbUnknown)
+    layer.CreateField(ogr.FieldDefn('weight', ogr.OFTReal))
+    for geometry, weight in zip(geometries, weights):
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(geometry)
+        feature.SetField('weight', float(weight))
+        layer.CreateFeature(feature)
+
+    block_raster = gdal.GetDriverByName('MEM').Create(
+        '', win_xsize, win_ysize, 1 if covered_where_nonzero else 2,
+        gdal.GDT_Float64)
+    block_raster.SetGeoTransform(block_geotransform)
+    block_raster.SetProjection(projection_wkt)
+    gdal.RasterizeLayer(
+        block_raster, [1], layer,
+        options=['ATTRIBUTE=weight', 'MERGE_ALG=ADD'])
+    block_weights = block_raster.GetRasterBand(1).ReadAsArray()
+    if covered_where_nonzero:
+        coverage = (block_weights != 0).astype(numpy.float64)
+    else:
+        gdal.RasterizeLayer(
+            block_raster, [2], layer, burn_values=[1],
+            options=['MERGE_ALG=ADD'])
+        coverage = block_raster.GetRasterBand(2).ReadAsArray()
+    block_raster = None
+    layer = None
+    vector = None
+    return block_weights, coverage
+
+
+def _write_block(band, weights, coverage, offsets):
+    """Write the summed weights of a block, with nodata where uncovered."""
+    block = numpy.where(coverage > 0, weights, TARGET_NODATA).astype(
+        numpy.float32)
+    with tracing.span('write block', 'io', **offsets):
+        band.WriteArray(block, offsets['xoff'], offsets['yoff'])
+    tracing.count('bytes_written', block.nbytes)
+
+
+def overlay_servicesheds(base_raster_path, servicesheds_vector_path,
+                         weight_field, target_raster_path, type_field=None,
+                         per_area=False, max_memory=None):
+    """Write the sum of the weights of the servicesheds covering each pixel.
+
+    Pixels that no serviceshed covers are nodata.  With a ``type_field``,
+    the sum of each type of serviceshed is also written to its own raster
+    next to ``target_raster_path`` (see ``_get_type_raster_path``), and the
+    target raster is the sum over every type.
+
+    Args:
+        base_raster_path (str): The path to a raster whose grid (extent,
+            pixel size and SRS) the outputs share, such as an ES supply
+            raster or a DEM.
+        servicesheds_vector_path (str): The path to a vector of serviceshed
+            polygons.  They may overlap and be in any SRS.
+        weight_field (str): The numeric field with each serviceshed's weight,
+            such as the value or the number of beneficiaries.
+        target_raster_path (str): The path to the raster of summed weights to
+            write.
+        type_field (str): The field with the type of each serviceshed, such
+            as ``'Hydropower'``.  If given, each type also gets an output.
+        per_area (bool): Whether to weight each serviceshed by its weight per
+            unit of area (such as value per square meter), rather than its
+            weight.
+        max_memory (int): The approximate memory budget in bytes, which
+            blocks are sized to fit.  If ``None``, blocks follow the default
+            of ``pygeoprocessing.iterblocks``.
+
+    Returns:
+        list: The paths of the rasters written, the total first.
+    """
+    base_info = pygeoprocessing.get_raster_info(base_raster_path)
+    target_srs = osr.SpatialReference()
+    target_srs.ImportFromWkt(base_info['projection_wkt'])
+    target_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    servicesheds = _load_servicesheds(
+        servicesheds_vector_path, weight_field, target_srs, type_field,
+        per_area)
+
+    target_paths = {None: target_raster_path}
+    if type_field:
+        target_paths.update({
+            serviceshed_type: _get_type_raster_path(
+                target_raster_path, serviceshed_type)
+            for serviceshed_type in sorted(servicesheds)})
+    for path in target_paths.values():
+        pygeoprocessing.new_raster_from_base(
+            base_raster_path, path, gdal.GDT_Float32, [TARGET_NODATA],
+            fill_value_list=[TARGET_NODATA])
+    target_rasters = {
+        serviceshed_type: gdal.OpenEx(path, gdal.OF_RASTER | gdal.GA_Update)
+        for serviceshed_type, path in target_paths.items()}
+    target_bands = {
+        serviceshed_type: raster.GetRasterBand(1)
+        for serviceshed_type, raster in target_rasters.items()}
+
+    # Each type needs a 2-band float64 block to rasterize into, and the
+    # total and each output are written as float32.
+    largest_block = pixels_within_memory(
+        max_memory, 16 * len(servicesheds) + 20 + 4 * len(target_paths))
+    iterblocks_kwargs = {}
+    if largest_block is not None:
+        iterblocks_kwargs['largest_block'] = largest_block
+
+    blocks = list(pygeoprocessing.iterblocks(
+        (target_raster_path, 1), offset_only=True, **iterblocks_kwargs))
+    with tracing.span('bucket servicesheds by block'):
+        buckets = {
+            serviceshed_type: _bucket_by_block(
+                envelopes, base_info['geotransform'],
+                base_info['raster_size'], blocks)
+            for serviceshed_type, (_, _, envelopes) in servicesheds.items()}
+
+    x_origin, x_size, _, y_origin, _, y_size = base_info['geotransform']
+    n_skipped_blocks = 0
+    for offsets in blocks:
+        block_geotransform = (
+            x_origin + offsets['xoff'] * x_size, x_size, 0,
+            y_origin + offsets['yoff'] * y_size, 0, y_size)
+
+        total_weights = None
+        total_coverage = None
+        for serviceshed_type, (type_geometries, type_weights, _) in (
+                servicesheds.items()):
+            indices = buckets[serviceshed_type].get(
+                (offsets['yoff'], offsets['xoff']))
+            if indices is None:
+                continue
+            with tracing.span('rasterize block', **offsets):
+                weights, coverage = _rasterize_block(
+                    [type_geometries[index] for index in indices],
+                    type_weights[indices], block_geotransform,
+                    base_info['projection_wkt'], offsets['win_xsize'],
+                    offsets['win_ysize'])
+            tracing.count('pixels', weights.size)
+            if total_weights is None:
+                total_weights = weights.copy()
+                total_coverage = coverage.copy()
+            else:
+                total_weights += weights
+                total_coverage += coverage
+            if type_field:
+                _write_block(target_bands[serviceshed_type], weights,
+                             coverage, offsets)
+        if total_weights is None:
+            n_skipped_blocks += 1
+            continue
+        _write_block(target_bands[None], total_weights, total_coverage,
+                     offsets)
+
+    target_bands = None
+    target_rasters = None
+    LOGGER.info(f'Rasterized {len(blocks) - n_skipped_blocks} of '
+                f'{len(blocks)} blocks; the rest have no servicesheds')
+    return list(target_paths.values())
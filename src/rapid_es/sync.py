@@ -0,0 +1,325 @@
+"""Copy new and changed outputs from a workspace to a shared directory.
+
+This replaces copying every output every time.  Each file found in the
+source directory is copied to the file with the same name anywhere in the
+target directory (or to the top of the target directory if there isn't one),
+but only if it has changed since it was last synced.
+
+A manifest of every synced file (``MANIFEST_NAME``, in the target directory)
+records the size, modification time and SHA-256 checksum of both copies.  A
+source file whose size and modification time match the manifest, and whose
+target copy is unchanged, is skipped without being read.  A file that was
+rewritten with the same contents is checksummed but not copied.  Copies are
+written to a temporary file, checksummed and only then moved into place, and
+run in a pool of threads since they are bound by disk and network rather
+than CPU.  The temporary files an interrupted sync leaves behind are removed
+by the next one.
+
+Unlike the shell script this replaces, which copied each file found in turn
+so that the last of several files with the same name won, a sync with
+several source files of the same name fails before copying anything.
+
+This module only uses the standard library, so it can run anywhere both
+directories are mounted.
+"""
+import concurrent.futures
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from . import tracing
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.rapid-es-sync.json'
+MANIFEST_VERSION = 1
+
+# The ESM conversion's rasters and tables.
+DEFAULT_PATTERNS = ('*.tif', '*.csv')
+
+# Copies are written next to their target with this suffix, and only moved
+# into place once their checksum is verified.
+TEMPORARY_SUFFIX = '.sync-tmp'
+
+# Copies are bound by I/O, so more threads than CPUs is fine.
+DEFAULT_WORKERS = 8
+
+# The cache directories of the processing steps, which hold intermediate
+# copies of rasters rather than outputs, and are never synced.
+EXCLUDED_DIRNAMES = frozenset([
+    '.taskgraph', 'yearly-aggregates-cache', 'zonal-aggregation-cache'])
+
+
+def _find_files(directory, patterns, exclude_directory=None):
+    """Find the files in a directory tree whose names match any pattern.
+
+    Directories named in ``EXCLUDED_DIRNAMES`` are never searched.
+
+    Args:
+        directory (str): The directory to search.
+        patterns (iterable): ``fnmatch`` patterns of file names.
+        exclude_directory (str): A directory not to search within, such as
+            a target directory inside the source directory.
+
+    Returns:
+        list: The sorted paths of the matching files.
+    """
+    matches = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [dirname for dirname in dirnames
+                       if dirname not in EXCLUDED_DIRNAMES]
+        if exclude_directory is not None:
+            dirnames[:] = [
+                dirname for dirname in dirnames
+                if os.path.realpath(os.path.join(dirpath, dirname)) !=
+                exclude_directory]
+        for filename in filenames:
+            if (filename == MANIFEST_NAME or
+                    filename.endswith(TEMPORARY_SUFFIX)):
+                continue
+            if any(fnmatch.fnmatch(filename, pattern)
+                   for pattern in patterns):
+                matches.append(os.path.join(dirpath, filename))
+    return sorted(matches)
+
+
+def _remove_temporary_copies(directory):
+    """Remove the unfinished copies left behind by an interrupted sync.
+
+    Args:
+        directory (str): The target directory to clean up.
+
+    Returns:
+        list: The paths of the files removed.
+    """
+    removed_paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [dirname for dirname in dirnames
+                       if dirname not in EXCLUDED_DIRNAMES]
+        for filename in filenames:
+            if filename.endswith(TEMPORARY_SUFFIX):
+                removed_paths.append(os.path.join(dirpath, filename))
+                os.remove(removed_paths[-1])
+    return removed_paths
+
+
+def _checksum(path):
+    """Get the hex SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as checksum_file:
+        for chunk in iter(lambda: checksum_file.read(2**20), b''):
+            digest.update(chunk)
+    tracing.count('bytes_read', os.path.getsize(path))
+    return digest.hexdigest()
+
+
+def _load_manifest(target_dir):
+    """Load the sync manifest of a target directory, or an empty one."""
+    manifest_path = os.path.join(target_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('version') != MANIFEST_VERSION:
+        LOGGER.warning(
+            f'Ignoring {manifest_path}, which has an unknown version')
+        return {}
+    return manifest['files']
+
+
+def _save_manifest(target_dir, records):
+    """Write the sync manifest of a target directory.
+
+    Args:
+        target_dir (str): The target directory.
+        records (dict): Maps the paths of synced files, relative to
+            ``target_dir``, to their records from ``_sync_file``.
+
+    Returns:
+        None
+    """
+    manifest_path = os.path.join(target_dir, MANIFEST_NAME)
+    with open(f'{manifest_path}.tmp', 'w') as manifest_file:
+        json.dump({'version': MANIFEST_VERSION, 'files': records},
+                  manifest_file, indent=1, sort_keys=True)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+
+
+def _stat_matches(file_stat, size, mtime_ns):
+    """Whether a file still has a recorded size and modification time."""
+    return (file_stat is not None and
+            (file_stat.st_size, file_stat.st_mtime_ns) == (size, mtime_ns))
+
+
+def _sync_file(source_path, target_path, record, dry_run=False,
+               verify_all=False):
+    """Copy a file to its target if it changed since it was last synced.
+
+    Args:
+        source_path (str): The file to copy.
+        target_path (str): Where to copy it to.
+        record (dict): The manifest record of the last sync of
+            ``target_path``, or ``None``.
+        dry_run (bool): Whether to only check whether the file needs to be
+            copied.
+        verify_all (bool): Whether to compare checksums even when the sizes
+            and modification times of both copies match the manifest.
+
+    Returns:
+        tuple: What was done (``'copied'``, ``'unchanged'`` or
+            ``'would copy'``) and the file's new manifest record (``None``
+            on a dry run that would copy).
+
+    Raises:
+        OSError: When the copy's checksum doesn't match the source's.
+    """
+    source_stat = os.stat(source_path)
+    try:
+        target_stat = os.stat(target_path)
+    except FileNotFoundError:
+        target_stat = None
+
+    def _record(checksum, target_stat):
+        return {
+            'source': source_path,
+            'source_size': source_stat.st_size,
+            'source_mtime_ns': source_stat.st_mtime_ns,
+            'size': target_stat.st_size,
+            'mtime_ns': target_stat.st_mtime_ns,
+            'sha256': checksum,
+        }
+
+    target_unchanged = record is not None and _stat_matches(
+        target_stat, record['size'], record['mtime_ns'])
+    if (target_unchanged and not verify_all and _stat_matches(
+            source_stat, record['source_size'],
+            record['source_mtime_ns'])):
+        return 'unchanged', record
+
+    source_checksum = _checksum(source_path)
+    if target_stat is not None and target_stat.st_size == source_stat.st_size:
+        if target_unchanged and not verify_all:
+            # The target is as it was synced, so its recorded checksum holds.
+            target_checksum = record['sha256']
+        else:
+            target_checksum = _checksum(target_path)
+        if target_checksum == source_checksum:
+            return 'unchanged', _record(source_checksum, target_stat)
+
+    if dry_run:
+        return 'would copy', None
+
+    temporary_path = f'{target_path}{TEMPORARY_SUFFIX}'
+    try:
+        with tracing.span('copy', 'io', path=target_path):
+            shutil.copy2(source_path, temporary_path)
+        tracing.count('bytes_written', source_stat.st_size)
+        copy_checksum = _checksum(temporary_path)
+        if copy_checksum != source_checksum:
+            raise OSError(
+                f'The copy of {source_path} to {target_path} has checksum '
+                f'{copy_checksum}, not {source_checksum}')
+        os.replace(temporary_path, target_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return 'copied', _record(source_checksum, os.stat(target_path))
+
+
+def sync(source_dir, target_dir, patterns=DEFAULT_PATTERNS,
+         n_workers=DEFAULT_WORKERS, dry_run=False, verify_all=False):
+    """Copy new and changed files from one directory tree to another.
+
+    Args:
+        source_dir (str): The directory to search for files to copy.
+        target_dir (str): The directory to copy them to.  A file is copied
+            over the file with the same name anywhere in this tree, or to
+            its top level if there isn't one.
+        patterns (iterable): ``fnmatch`` patterns of the names of files to
+            copy.
+        n_workers (int): The number of threads to check and copy files with.
+        dry_run (bool): Whether to only log what would be copied.
+        verify_all (bool): Whether to compare the checksums of every file,
+            rather than trusting the sizes and modification times of files
+            that match the manifest.
+
+    Returns:
+        list: The target paths of the files that were (or, on a dry run,
+            would be) copied.
+
+    Raises:
+        ValueError: When several source files have the same name, so it
+            isn't clear which of them to copy.
+        OSError: When a copy's checksum doesn't match its source's.
+    """
+    target_dir = os.path.realpath(target_dir)
+    if not os.path.isdir(target_dir):
+        raise ValueError(f'{target_dir} is not a directory')
+    source_paths = _find_files(source_dir, patterns, target_dir)
+
+    source_paths_by_name = {}
+    for source_path in source_paths:
+        source_paths_by_name.setdefault(
+            os.path.basename(source_path), []).append(source_path)
+    duplicates = [paths for paths in source_paths_by_name.values()
+                  if len(paths) > 1]
+    if duplicates:
+        raise ValueError(
+            'Several files to sync have the same name: ' + '; '.join(
+                ', '.join(paths) for paths in duplicates))
+
+    # Index the target by file name once, rather than searching it for
+    # every source file.
+    target_paths_by_name = {}
+    for target_path in _find_files(target_dir, patterns):
+        target_paths_by_name.setdefault(
+            os.path.basename(target_path), target_path)
+
+    if not dry_run:
+        for temporary_path in _remove_temporary_copies(target_dir):
+            LOGGER.info(f'Removed the unfinished copy {temporary_path}')
+
+    records = _load_manifest(target_dir)
+    jobs = {}
+    for name, (source_path,) in source_paths_by_name.items():
+        target_path = target_paths_by_name.get(
+            name, os.path.join(target_dir, name))
+        relative_path = os.path.relpath(target_path, target_dir)
+        jobs[relative_path] = (source_path, target_path)
+    LOGGER.info(f'Syncing {len(jobs)} files from {source_dir} to '
+                f'{target_dir}')
+
+    copied_paths = []
+    n_unchanged = 0
+    try:
+        with concurrent.futures.ThreadPoolExecutor(n_workers) as executor:
+            futures = {
+                executor.submit(
+                    _sync_file, source_path, target_path,
+                    records.get(relative_path), dry_run,
+                    verify_all): relative_path
+                for relative_path, (source_path, target_path)
+                in jobs.items()}
+            for future in concurrent.futures.as_completed(futures):
+                relative_path = futures[future]
+                action, record = future.result()
+                if action == 'unchanged':
+                    n_unchanged += 1
+                else:
+                    LOGGER.info(f'{action.capitalize()} {relative_path}')
+                    copied_paths.append(jobs[relative_path][1])
+                if record is not None:
+                    records[relative_path] = record
+    finally:
+        # Record whatever was synced, even if a copy failed, so that a rerun
+        # picks up where this one stopped.
+        if not dry_run:
+            _save_manifest(target_dir, records)
+    LOGGER.info(
+        f"{'Would copy' if dry_run else 'Copied'} {len(copied_paths)} "
+        f"files, {n_unchanged} unchanged")
+    return sorted(copied_paths)
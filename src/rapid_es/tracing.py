@@ -0,0 +1,236 @@
+"""Spans, counters and profiling shared by every processing module.
+
+Tracing is off unless it is started, either with ``rapid-es --trace PATH`` or
+by setting the ``RAPID_ES_TRACE`` environment variable to a path.  While it
+is off, ``span`` and ``count`` do next to nothing, so the processing modules
+call them unconditionally around their reads, computation and writes::
+
+    with tracing.span('read', category='io', band_count=n_bands):
+        array = band.ReadAsArray()
+    tracing.count('bytes_read', array.nbytes)
+
+The trace is written in the Chrome trace event format (the JSON array form,
+one event per line), so it opens in ``chrome://tracing`` or Perfetto and is
+easy to load for comparisons between runs or nodes.  Spans are complete
+(``"ph": "X"``) events and counter totals are counter (``"ph": "C"``) events
+that are written whenever a span ends.  Every process appends its own
+events to the same file, so the worker processes of a run are traced too.
+
+``RAPID_ES_PROFILE=1`` (or ``--profile``) also runs ``cProfile`` in the
+process that started tracing and writes its stats to ``PATH.prof``, and
+``RAPID_ES_TRACEMALLOC=1`` (or ``--trace-memory``) adds the current and peak
+traced memory to the arguments of every span.
+
+This module only uses the standard library, so importing it is cheap.
+"""
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+
+TRACE_ENV = 'RAPID_ES_TRACE'
+PROFILE_ENV = 'RAPID_ES_PROFILE'
+TRACEMALLOC_ENV = 'RAPID_ES_TRACEMALLOC'
+# Set by the process that starts tracing, so that the processes it starts
+# append to its trace instead of starting over.
+_STARTED_BY_ENV = 'RAPID_ES_TRACE_STARTED_BY'
+
+_state = {
+    'path': None,
+    'trace_memory': False,
+    'profiler': None,
+    'counters': {},
+    'changed_counters': set(),
+}
+_lock = threading.Lock()
+
+
+def is_enabled():
+    """Whether tracing has been started in this process."""
+    return _state['path'] is not None
+
+
+def _now_us():
+    """The current time in microseconds, as Chrome trace timestamps are."""
+    return time.time_ns() / 1000
+
+
+def _write_event(event):
+    """Append an event to the trace as a line of the JSON array."""
+    line = json.dumps(event, default=str) + ',\n'
+    with _lock:
+        # Opened for every event so that every process appends whole lines.
+        with open(_state['path'], 'a') as trace_file:
+            trace_file.write(line)
+
+
+def start(trace_path, profile=False, trace_memory=False):
+    """Start tracing to a file, replacing any trace already there.
+
+    Args:
+        trace_path (str): The path to write the trace to.
+        profile (bool): Whether to run ``cProfile`` in this process and write
+            its stats to ``trace_path + '.prof'`` when tracing stops.
+        trace_memory (bool): Whether to trace memory allocations with
+            ``tracemalloc``.
+
+    Returns:
+        None
+    """
+    trace_path = os.path.abspath(trace_path)
+    with open(trace_path, 'w') as trace_file:
+        trace_file.write('[\n')
+    os.environ[TRACE_ENV] = trace_path
+    os.environ[_STARTED_BY_ENV] = str(os.getpid())
+    if profile:
+        os.environ[PROFILE_ENV] = '1'
+    if trace_memory:
+        os.environ[TRACEMALLOC_ENV] = '1'
+    _enable(trace_path, trace_memory)
+
+    _write_event({
+        'name': 'process_name', 'ph': 'M', 'pid': os.getpid(),
+        'args': {'name': f'{platform.node()}: {" ".join(sys.argv)}'}})
+    if profile:
+        _state['profiler'] = cProfile.Profile()
+        _state['profiler'].enable()
+    atexit.register(stop)
+
+
+def _enable(trace_path, trace_memory):
+    """Enable tracing in this process, appending to ``trace_path``."""
+    _state['path'] = trace_path
+    _state['trace_memory'] = trace_memory
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def stop():
+    """Stop tracing, writing the final counters and any profile.
+
+    Returns:
+        None
+    """
+    if not is_enabled():
+        return
+    _write_counters(force=True)
+    profiler = _state['profiler']
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(f"{_state['path']}.prof")
+        _state['profiler'] = None
+    if _state['trace_memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state['path'] = None
+
+
+@contextlib.contextmanager
+def span(name, category='compute', **args):
+    """Time a block of code as a named span of the trace.
+
+    Args:
+        name (str): The name of the span, such as ``'read'``.
+        category (str): The category of the span, such as ``'io'`` or
+            ``'compute'``.
+        **args: Anything else to record with the span, such as a path.
+
+    Yields:
+        None
+    """
+    if not is_enabled():
+        yield
+        return
+    start_us = _now_us()
+    try:
+        yield
+    finally:
+        end_us = _now_us()
+        if _state['trace_memory']:
+            args['memory_bytes'], args['peak_memory_bytes'] = (
+                tracemalloc.get_traced_memory())
+        _write_event({
+            'name': name, 'cat': category, 'ph': 'X', 'ts': start_us,
+            'dur': end_us - start_us, 'pid': os.getpid(),
+            'tid': threading.get_ident(), 'args': args})
+        _write_counters()
+
+
+def traced(name=None, category='compute'):
+    """Decorate a function so that every call is a span.
+
+    Args:
+        name (str): The name of the span.  Defaults to the function's name.
+        category (str): The category of the span.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*func_args, **func_kwargs):
+            with span(name or func.__name__, category):
+                return func(*func_args, **func_kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """Add to a counter, such as ``'bytes_read'`` or ``'pixels'``.
+
+    Args:
+        name (str): The name of the counter.
+        value (number): The amount to add.
+
+    Returns:
+        None
+    """
+    if not is_enabled():
+        return
+    with _lock:
+        _state['counters'][name] = _state['counters'].get(name, 0) + value
+        _state['changed_counters'].add(name)
+
+
+def _write_counters(force=False):
+    """Write the totals of the counters that changed since last written."""
+    with _lock:
+        names = (set(_state['counters']) if force
+                 else _state['changed_counters'])
+        totals = {name: _state['counters'][name] for name in names}
+        _state['changed_counters'] = set()
+    if totals:
+        _write_event({
+            'name': 'counters', 'ph': 'C', 'ts': _now_us(),
+            'pid': os.getpid(), 'args': totals})
+
+
+def _start_from_environment():
+    """Start or join a trace if the environment asks for one."""
+    trace_path = os.environ.get(TRACE_ENV)
+    if not trace_path:
+        return
+    trace_memory = os.environ.get(TRACEMALLOC_ENV) == '1'
+    if os.environ.get(_STARTED_BY_ENV):
+        # A process started by a traced process appends to its trace.
+        _enable(trace_path, trace_memory)
+    else:
+        start(trace_path, os.environ.get(PROFILE_ENV) == '1', trace_memory)
+
+
+def _reset_counters_in_child():
+    """Start a forked process's counters from zero, as its own."""
+    _state['counters'] = {}
+    _state['changed_counters'] = set()
+    _state['profiler'] = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_counters_in_child)
+_start_from_environment()
@@ -0,0 +1,101 @@
+"""Helpers shared by the processing modules."""
+import logging
+
+import numpy
+import pygeoprocessing
+from osgeo import gdal
+
+from . import tracing
+
+LOGGER = logging.getLogger(__name__)
+
+
+def array_equals_nodata(array, nodata):
+    """Check for the presence of ``nodata`` values in ``array``.
+
+    The comparison supports ``numpy.nan`` and unset (``None``) nodata values.
+
+    Args:
+        array (numpy array): the array to mask for nodata values.
+        nodata (number): the nodata value to check for. Supports ``numpy.nan``.
+
+    Returns:
+        A boolean numpy array with values of 1 where ``array`` is equal to
+        ``nodata`` and 0 otherwise.
+    """
+    # If nodata is undefined, nothing matches nodata.
+    if nodata is None:
+        return numpy.zeros(array.shape, dtype=bool)
+
+    # comparing an integer array against numpy.nan works correctly and is
+    # faster than using numpy.isclose().
+    if numpy.issubdtype(array.dtype, numpy.integer):
+        return array == nodata
+    return numpy.isclose(array, nodata, equal_nan=True)
+
+
+def pixels_within_memory(max_memory, bytes_per_pixel):
+    """The number of pixels that can be processed at once within a budget.
+
+    Args:
+        max_memory (int): The memory budget in bytes, or ``None`` for no
+            budget.
+        bytes_per_pixel (number): The approximate working memory needed per
+            pixel processed.
+
+    Returns:
+        int: The number of pixels (at least 1), or ``None`` if there is no
+            budget.
+    """
+    if max_memory is None:
+        return None
+    n_pixels = int(max_memory // bytes_per_pixel)
+    if n_pixels < 1:
+        LOGGER.warning(
+            f'{max_memory} bytes of the memory budget are available, too '
+            f'few for even a single pixel of {bytes_per_pixel} bytes')
+        return 1
+    return n_pixels
+
+
+def iterblocks_aligned(base_raster_path_band, other_raster_paths,
+                       largest_block=None):
+    """Iterate over the blocks of a raster and the same windows of others.
+
+    The other rasters must be on the same grid as the base raster, such as
+    the outputs of ``pygeoprocessing.align_and_resize_raster_stack``.  Blocks
+    follow the block layout of the base raster.
+
+    Args:
+        base_raster_path_band (tuple): A ``(path, band_index)`` tuple of the
+            raster whose blocks are iterated over.
+        other_raster_paths (list): The paths to rasters to read the same
+            window of (from band 1).
+        largest_block (int): The number of pixels that neighboring blocks
+            are merged up to, as in ``pygeoprocessing.iterblocks``.  Use
+            ``pixels_within_memory`` to size blocks to a memory budget.
+            Defaults to that of ``pygeoprocessing.iterblocks``.
+
+    Yields:
+        tuple: The block's offsets (as from ``pygeoprocessing.iterblocks``),
+            the base raster's block and a list of the other rasters' blocks.
+    """
+    other_rasters = [
+        gdal.OpenEx(path, gdal.OF_RASTER) for path in other_raster_paths]
+    other_bands = [raster.GetRasterBand(1) for raster in other_rasters]
+    iterblocks_kwargs = {}
+    if largest_block is not None:
+        iterblocks_kwargs['largest_block'] = largest_block
+    try:
+        for offsets, base_block in pygeoprocessing.iterblocks(
+                base_raster_path_band, **iterblocks_kwargs):
+            with tracing.span('read block', 'io', **offsets):
+                other_blocks = [
+                    band.ReadAsArray(**offsets) for band in other_bands]
+            tracing.count('pixels', base_block.size)
+            tracing.count('bytes_read', base_block.nbytes + sum(
+                block.nbytes for block in other_blocks))
+            yield offsets, base_block, other_blocks
+    finally:
+        other_bands = None
+        other_rasters = None
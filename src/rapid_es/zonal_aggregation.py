@@ -0,0 +1,575 @@
+"""Aggregate monthly rain events rasters by climate zone.
+
+See ``rapid-es zonal-agg --help`` for more information.
+"""
+import calendar
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy
+import pygeoprocessing
+from osgeo import gdal
+
+from . import tracing
+from .utils import array_equals_nodata
+from .utils import iterblocks_aligned
+from .utils import pixels_within_memory
+
+LOGGER = logging.getLogger(__name__)
+gdal.UseExceptions()
+
+MONTH_NAMES = [calendar.month_name[i][:3].lower() for i in range(1, 13)]
+
+# Percentiles are estimated from per-zone histograms with this many bins
+# for each month.  The bins start out spanning the values of the first block
+# read, and double in width whenever a later block has values outside them.
+DEFAULT_HISTOGRAM_BINS = 1000
+
+# The nodata value of rasterized zone vectors.
+RASTERIZED_ZONES_NODATA = -1
+
+# The environment variable that overrides where aligned rasters are cached.
+CACHE_DIR_ENV = 'RAPID_ES_CACHE_DIR'
+
+
+def get_default_cache_dir():
+    """Get the default directory for cached aligned rasters.
+
+    The cache is kept out of the output workspace, so it is never synced or
+    shared with the outputs.  It is ``$RAPID_ES_CACHE_DIR`` if that is set,
+    and otherwise ``rapid-es/zonal-aggregation`` in the user's cache
+    directory (``$XDG_CACHE_HOME``, or ``~/.cache``).  Nothing is ever
+    removed from it automatically, but any of it may be deleted at any
+    time; deleted entries are recreated when they are next needed.
+
+    Returns:
+        str: The path to the cache directory, which may not exist yet.
+    """
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    user_cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(user_cache_dir, 'rapid-es', 'zonal-aggregation')
+
+
+def _fit_histogram_range(zone_histograms, month_index, histogram_range,
+                         values, n_bins):
+    """Make the histogram bins of a month cover a block's values.
+
+    The first values of the month set the bins to span them exactly.  After
+    that, whenever values fall outside the bins, the bins double in width
+    toward them, and every zone's histogram of the month is rebinned by
+    adding pairs of adjacent bins.  This needs no pass over the rasters
+    before the histograms are built, and keeps the bins no more than about
+    four times as wide as the range of all of the values needs.
+
+    Args:
+        zone_histograms (dict): Maps climate zone IDs to ``(12, n_bins)``
+            histograms.  The month's histograms are rebinned in place.
+        month_index (int): The index of the month, 0 for January.
+        histogram_range (dict): The month's ``origin`` (the lower edge of
+            the first bin), bin ``width`` and the ``min`` and ``max`` of its
+            values so far, or empty before any values.  Updated in place.
+        values (numpy.ndarray): The valid values of the block, which must
+            not be empty.
+        n_bins (int): The number of bins.
+
+    Returns:
+        None
+    """
+    min_value = float(values.min())
+    max_value = float(values.max())
+    if not histogram_range:
+        width = (max_value - min_value) / n_bins
+        if width == 0:
+            # Start a month whose values are all equal with narrow bins,
+            # which grow if later values differ.
+            width = max(abs(min_value), 1.0) * 2**-20 / n_bins
+        histogram_range.update(
+            origin=min_value, width=width, min=min_value, max=max_value)
+        return
+
+    histogram_range['min'] = min(histogram_range['min'], min_value)
+    histogram_range['max'] = max(histogram_range['max'], max_value)
+    old_bin_index = numpy.arange(n_bins)
+    while (min_value < histogram_range['origin'] or
+           max_value > histogram_range['origin'] +
+           histogram_range['width'] * n_bins):
+        # Grow down by the width of every bin if values are below the
+        # bins, otherwise grow up.  Either way, each old bin falls within a
+        # single new bin.
+        shift = n_bins if min_value < histogram_range['origin'] else 0
+        new_bin_index = (old_bin_index + shift) // 2
+        for histograms in zone_histograms.values():
+            rebinned = numpy.zeros(n_bins, dtype=histograms.dtype)
+            numpy.add.at(rebinned, new_bin_index, histograms[month_index])
+            histograms[month_index] = rebinned
+        histogram_range['origin'] -= shift * histogram_range['width']
+        histogram_range['width'] *= 2
+
+
+def _get_bin_edges(histogram_range, n_bins):
+    """Get the ``n_bins + 1`` bin edges of a month's histogram range."""
+    if not histogram_range:
+        return numpy.zeros(n_bins + 1)
+    return (histogram_range['origin'] +
+            histogram_range['width'] * numpy.arange(n_bins + 1))
+
+
+@tracing.traced('accumulate zonal sums')
+def _accumulate_zonal_sums(zone_sums, zone_counts, cz_array, cz_nodata,
+                           monthly_arrays, monthly_nodata,
+                           zone_histograms=None, histogram_ranges=None,
+                           n_bins=DEFAULT_HISTOGRAM_BINS):
+    """Add up the monthly values and their counts in each climate zone.
+
+    Each month is a single grouped reduction over the pixels of every zone,
+    rather than one masked read per zone.  Histograms of the values are
+    reduced the same way, so percentiles never need the values of a zone to
+    be gathered together.
+
+    Args:
+        zone_sums (dict): Maps climate zone IDs to arrays of the sum of each
+            month's values in the zone.  Updated in place.
+        zone_counts (dict): Maps climate zone IDs to arrays of the number of
+            each month's valid pixels in the zone.  Updated in place.
+        cz_array (numpy.ndarray): The climate zone of each pixel.
+        cz_nodata (number): The nodata value of ``cz_array``, or ``None``.
+        monthly_arrays (list): 12 arrays of monthly values, aligned with
+            ``cz_array``.
+        monthly_nodata (list): The nodata value of each monthly array, or
+            ``None``.
+        zone_histograms (dict): Maps climate zone IDs to ``(12, n_bins)``
+            arrays of the number of each month's values in each bin.  Updated
+            in place.  If ``None``, histograms are not computed.
+        histogram_ranges (list): The histogram range of each month, as
+            described in ``_fit_histogram_range``.  Required with
+            ``zone_histograms``, and updated in place.
+        n_bins (int): The number of histogram bins.
+
+    Returns:
+        None
+    """
+    valid_mask = ~array_equals_nodata(cz_array, cz_nodata)
+    cz_ids, zone_index = numpy.unique(
+        cz_array[valid_mask], return_inverse=True)
+    block_sums = numpy.zeros((len(cz_ids), 12), dtype=numpy.float64)
+    block_counts = numpy.zeros((len(cz_ids), 12), dtype=numpy.int64)
+    if zone_histograms is not None:
+        block_histograms = numpy.zeros(
+            (len(cz_ids), 12, n_bins), dtype=numpy.int64)
+    for month_index, (array, nodata) in enumerate(
+            zip(monthly_arrays, monthly_nodata)):
+        values = array[valid_mask]
+        month_zone_index = zone_index
+        if nodata is not None:
+            valid_values = ~array_equals_nodata(
+                values, nodata)
+            values = values[valid_values]
+            month_zone_index = zone_index[valid_values]
+        block_sums[:, month_index] = numpy.bincount(
+            month_zone_index, weights=values, minlength=len(cz_ids))
+        block_counts[:, month_index] = numpy.bincount(
+            month_zone_index, minlength=len(cz_ids))
+        if zone_histograms is not None and values.size:
+            histogram_range = histogram_ranges[month_index]
+            _fit_histogram_range(
+                zone_histograms, month_index, histogram_range, values,
+                n_bins)
+            # The last bin includes the largest value.
+            bin_index = numpy.clip(
+                numpy.floor(
+                    (values - histogram_range['origin']) /
+                    histogram_range['width']).astype(numpy.int64),
+                0, n_bins - 1)
+            block_histograms[:, month_index] = numpy.bincount(
+                month_zone_index * n_bins + bin_index,
+                minlength=len(cz_ids) * n_bins).reshape(len(cz_ids), n_bins)
+
+    for block_zone_index, cz_id in enumerate(cz_ids):
+        if cz_id in zone_sums:
+            zone_sums[cz_id] += block_sums[block_zone_index]
+            zone_counts[cz_id] += block_counts[block_zone_index]
+        else:
+            zone_sums[cz_id] = block_sums[block_zone_index]
+            zone_counts[cz_id] = block_counts[block_zone_index]
+        if zone_histograms is not None:
+            if cz_id in zone_histograms:
+                zone_histograms[cz_id] += block_histograms[block_zone_index]
+            else:
+                zone_histograms[cz_id] = block_histograms[block_zone_index]
+
+
+def _histogram_percentile(histogram, bin_edges, percentile):
+    """Estimate a percentile of values from their histogram.
+
+    The value is interpolated linearly within the bin the percentile falls
+    in, so it is accurate to within the width of a bin.
+
+    Args:
+        histogram (numpy.ndarray): The number of values in each bin.
+        bin_edges (numpy.ndarray): The ``len(histogram) + 1`` bin edges.
+        percentile (float): The percentile (0-100) to estimate.
+
+    Returns:
+        float: The estimated percentile, or 0 if there are no values.
+    """
+    cumulative_counts = numpy.cumsum(histogram)
+    n_values = cumulative_counts[-1]
+    if n_values == 0:
+        return 0
+    rank = percentile / 100 * n_values
+    # The 0th percentile is in the first bin with any values.
+    bin_index = min(
+        int(numpy.searchsorted(
+            cumulative_counts, rank, side='left' if rank else 'right')),
+        len(histogram) - 1)
+    n_values_below = cumulative_counts[bin_index] - histogram[bin_index]
+    fraction = 0
+    if histogram[bin_index]:
+        fraction = (rank - n_values_below) / histogram[bin_index]
+    return float(bin_edges[bin_index] + fraction * (
+        bin_edges[bin_index+1] - bin_edges[bin_index]))
+
+
+def _hash_files(path, open_flags=gdal.OF_VECTOR):
+    """Hash the contents of every file of a vector or raster.
+
+    Args:
+        path (str): The path to the vector or raster.
+        open_flags (int): The GDAL flags to open ``path`` with.
+
+    Returns:
+        str: The hex digest of the dataset's files.
+    """
+    dataset = gdal.OpenEx(path, open_flags)
+    file_list = sorted(dataset.GetFileList())
+    dataset = None
+    digest = hashlib.sha256()
+    for path in file_list:
+        with open(path, 'rb') as vector_file:
+            for chunk in iter(lambda: vector_file.read(2**20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def _temporary_path(target_path):
+    """Get a unique path to write a cached raster to before moving it.
+
+    The path is in a new temporary directory next to ``target_path``, so
+    several processes filling the same cache at once never write to the
+    same file.  When the block exits without an error, the file is moved to
+    ``target_path``, replacing any copy another process moved there first.
+
+    Args:
+        target_path (str): The path the raster is cached at.
+
+    Yields:
+        str: The path to write the raster to.
+    """
+    cache_dir = os.path.dirname(target_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_dir = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+    try:
+        temporary_path = os.path.join(
+            temporary_dir, os.path.basename(target_path))
+        yield temporary_path
+        os.replace(temporary_path, target_path)
+    finally:
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+
+
+@tracing.traced('rasterize zones')
+def _rasterize_zones(zones_vector, zone_field, base_raster, cache_dir):
+    """Rasterize a vector of zones onto the grid of a raster, once.
+
+    The rasterized zones are cached under a name derived from the contents
+    of the vector, the zone field and the target grid, so later runs with
+    the same vector and grid reuse them.
+
+    Args:
+        zones_vector (str): The path to a vector of zones.
+        zone_field (str): The integer field of the vector with zone IDs.
+        base_raster (str): The path to a raster with the target grid.
+        cache_dir (str): The directory to cache rasterized zones in.
+
+    Returns:
+        str: The path to the rasterized zones.
+    """
+    base_info = pygeoprocessing.get_raster_info(base_raster)
+    digest = hashlib.sha256()
+    for item in (_hash_files(zones_vector), zone_field,
+                 base_info['geotransform'], base_info['raster_size'],
+                 base_info['projection_wkt']):
+        digest.update(repr(item).encode('utf-8'))
+    vector_basename = os.path.splitext(os.path.basename(zones_vector))[0]
+    target_path = os.path.join(
+        cache_dir, f'{vector_basename}-{digest.hexdigest()[:16]}.tif')
+    if os.path.exists(target_path):
+        LOGGER.info(f'Using cached rasterized zones {target_path}')
+        return target_path
+
+    LOGGER.info(f'Rasterizing {zones_vector} to {target_path}')
+    with _temporary_path(target_path) as temporary_path:
+        pygeoprocessing.new_raster_from_base(
+            base_raster, temporary_path, gdal.GDT_Int32,
+            [RASTERIZED_ZONES_NODATA])
+        pygeoprocessing.rasterize(
+            zones_vector, temporary_path,
+            option_list=[f'ATTRIBUTE={zone_field}'])
+    return target_path
+
+
+@tracing.traced('align raster')
+def _align_raster(base_raster, resample_method, target_pixel_size,
+                  target_bb, target_projection_wkt, cache_dir,
+                  working_dir=None):
+    """Warp a raster onto a target grid, reusing an earlier warp if any.
+
+    Aligned rasters are cached under a name derived from the contents of the
+    base raster, the target grid and the resampling method, so identical
+    inputs are only warped once, no matter how many calls use them.
+
+    Args:
+        base_raster (str): The path to the raster to warp.
+        resample_method (str): The GDAL resampling method to use.
+        target_pixel_size (tuple): The target pixel size.
+        target_bb (list): The target bounding box.
+        target_projection_wkt (str): The target projection.
+        cache_dir (str): The directory to cache aligned rasters in.
+        working_dir (str): A directory for temporary files.
+
+    Returns:
+        str: The path to the aligned raster.
+    """
+    digest = hashlib.sha256()
+    for item in (_hash_files(base_raster, gdal.OF_RASTER), resample_method,
+                 tuple(target_pixel_size), tuple(target_bb),
+                 target_projection_wkt):
+        digest.update(repr(item).encode('utf-8'))
+    raster_basename = os.path.splitext(os.path.basename(base_raster))[0]
+    target_path = os.path.join(
+        cache_dir, f'{raster_basename}-{digest.hexdigest()[:16]}.tif')
+    if os.path.exists(target_path):
+        LOGGER.info(f'Using cached aligned raster {target_path}')
+        return target_path
+
+    with _temporary_path(target_path) as temporary_path:
+        pygeoprocessing.warp_raster(
+            base_raster, target_pixel_size, temporary_path, resample_method,
+            target_bb=target_bb, target_projection_wkt=target_projection_wkt,
+            working_dir=working_dir)
+    return target_path
+
+
+def _is_vector(path):
+    """Check whether a path is a vector GDAL can open."""
+    try:
+        return gdal.OpenEx(path, gdal.OF_VECTOR) is not None
+    except RuntimeError:
+        return False
+
+
+def aggregate_by_zone(target_csv, climate_zones_raster,
+                      monthly_rain_events_rasters, temp_workspace=None,
+                      remove_workspace=True, blockwise=False,
+                      zone_field=None, percentiles=(),
+                      n_bins=DEFAULT_HISTOGRAM_BINS, cache_dir=None,
+                      max_memory=None):
+    """Write the mean monthly rain events of each climate zone to a CSV.
+
+    The zones may also be a vector, such as admin boundaries or watersheds,
+    which is rasterized onto the grid of the rain events rasters rather than
+    aligning the rasters to the zones.
+
+    Args:
+        target_csv (str): The path to the CSV to write.  A table of each of
+            ``percentiles`` is written next to it, with a suffix like
+            ``-p50``.
+        climate_zones_raster (str): The path to a raster of climate zone IDs,
+            or to a vector of zones.
+        monthly_rain_events_rasters (list): The paths to the 12 monthly rain
+            events rasters, which sort in month order.
+        temp_workspace (str): A directory for temporary files.  Defaults to
+            a new temporary directory.
+        remove_workspace (bool): Whether to remove ``temp_workspace`` when
+            done.
+        blockwise (bool): Whether to read the aligned rasters one block at a
+            time, so that large rasters never need to fit in memory.
+        zone_field (str): The integer field with the zone IDs, when the
+            zones are a vector.
+        percentiles (iterable): Percentiles (0-100) of each zone's monthly
+            values to write, estimated from per-zone histograms.
+        n_bins (int): The number of histogram bins for the percentiles.
+        cache_dir (str): Where aligned rasters and rasterized zone vectors
+            are cached, so that later calls with the same inputs reuse them.
+            Defaults to ``get_default_cache_dir()``, outside of the
+            directory of ``target_csv``.
+        max_memory (int): The approximate memory budget in bytes.  If the
+            aligned rasters don't fit in it, they are read blockwise even if
+            ``blockwise`` is ``False``, with blocks as large as the budget
+            allows.
+
+    Returns:
+        None
+    """
+    # create temp workspace in usual place
+    if temp_workspace is None:
+        temp_workspace = tempfile.mkdtemp(prefix="rain-events-agg-by-cz")
+    else:
+        if not os.path.exists(temp_workspace):
+            os.makedirs(temp_workspace)
+
+    assert len(monthly_rain_events_rasters) == 12, (
+        "Must have 12 monthly rain events rasters, not %s. Check the glob." %
+        len(monthly_rain_events_rasters))
+
+    if cache_dir is None:
+        cache_dir = get_default_cache_dir()
+
+    if _is_vector(climate_zones_raster):
+        if not zone_field:
+            raise ValueError('A zone field is required for vector zones.')
+        # The rain events rasters share a grid, so use them as they are.
+        aligned_rain_events = sorted(monthly_rain_events_rasters)
+        base_info = pygeoprocessing.get_raster_info(aligned_rain_events[0])
+        for raster_path in aligned_rain_events[1:]:
+            raster_info = pygeoprocessing.get_raster_info(raster_path)
+            if (raster_info['raster_size'] != base_info['raster_size'] or
+                    raster_info['geotransform'] !=
+                    base_info['geotransform']):
+                raise ValueError(
+                    f'{raster_path} is not on the same grid as '
+                    f'{aligned_rain_events[0]}')
+        aligned_climate_zones_raster = _rasterize_zones(
+            climate_zones_raster, zone_field, aligned_rain_events[0],
+            cache_dir)
+    else:
+        # Assume we're using the climate zones raster pixel size, and the
+        # intersection of all of the rasters.
+        cz_raster_info = pygeoprocessing.get_raster_info(climate_zones_raster)
+        target_pixel_size = cz_raster_info['pixel_size']
+        target_projection_wkt = cz_raster_info['projection_wkt']
+        # because our month numbers are zero-padded, this works as you expect.
+        base_raster_paths = (
+            [climate_zones_raster] + sorted(monthly_rain_events_rasters))
+        bounding_boxes = []
+        for raster_path in base_raster_paths:
+            raster_info = pygeoprocessing.get_raster_info(raster_path)
+            bounding_box = raster_info['bounding_box']
+            if raster_info['projection_wkt'] != target_projection_wkt:
+                bounding_box = pygeoprocessing.transform_bounding_box(
+                    bounding_box, raster_info['projection_wkt'],
+                    target_projection_wkt)
+            bounding_boxes.append(bounding_box)
+        target_bb = pygeoprocessing.merge_bounding_box_list(
+            bounding_boxes, 'intersection')
+
+        aligned_climate_zones_raster, *aligned_rain_events = [
+            _align_raster(
+                raster_path, resample_method, target_pixel_size, target_bb,
+                target_projection_wkt, cache_dir, temp_workspace)
+            for raster_path, resample_method in zip(
+                base_raster_paths,
+                ['near'] + ['bilinear'] * len(monthly_rain_events_rasters))]
+
+    cz_nodata = pygeoprocessing.get_raster_info(
+        aligned_climate_zones_raster)['nodata'][0]
+    monthly_nodata = [
+        pygeoprocessing.get_raster_info(path)['nodata'][0]
+        for path in aligned_rain_events]
+
+    # Every pixel of every raster is held at once, along with the sorted
+    # zone IDs and their indexes, and the masked values, zone indexes and
+    # (with percentiles) bin indexes of the month being reduced.
+    cz_info = pygeoprocessing.get_raster_info(aligned_climate_zones_raster)
+    itemsizes = [
+        numpy.dtype(pygeoprocessing.get_raster_info(path)['numpy_type'])
+        .itemsize for path in aligned_rain_events]
+    bytes_per_pixel = (
+        3 * numpy.dtype(cz_info['numpy_type']).itemsize + 9 +
+        sum(itemsizes) + max(itemsizes) + 17 + (24 if percentiles else 0))
+    largest_block = pixels_within_memory(max_memory, bytes_per_pixel)
+    n_cols, n_rows = cz_info['raster_size']
+    if (not blockwise and largest_block is not None and
+            n_cols * n_rows > largest_block):
+        LOGGER.info(
+            f'{n_cols} x {n_rows} pixels do not fit in {max_memory} bytes, '
+            'reading blockwise')
+        blockwise = True
+    zone_sums = {}
+    zone_counts = {}
+    zone_histograms = None
+    histogram_ranges = None
+    if percentiles:
+        # The histogram bins are fit to the values as they are read, so the
+        # rasters are only read once.
+        zone_histograms = {}
+        histogram_ranges = [{} for _ in aligned_rain_events]
+    if blockwise:
+        # The aligned rasters all share a grid, so the blocks of the climate
+        # zones raster are windows into every one of them.
+        for _, cz_block, monthly_blocks in iterblocks_aligned(
+                (aligned_climate_zones_raster, 1), aligned_rain_events,
+                largest_block):
+            _accumulate_zonal_sums(
+                zone_sums, zone_counts, cz_block, cz_nodata, monthly_blocks,
+                monthly_nodata, zone_histograms, histogram_ranges, n_bins)
+    else:
+        with tracing.span('read rasters', 'io'):
+            cz_array = pygeoprocessing.raster_to_numpy_array(
+                aligned_climate_zones_raster)
+            monthly_arrays = [
+                pygeoprocessing.raster_to_numpy_array(path)
+                for path in aligned_rain_events]
+        tracing.count('pixels', cz_array.size)
+        tracing.count('bytes_read', cz_array.nbytes + sum(
+            array.nbytes for array in monthly_arrays))
+        _accumulate_zonal_sums(
+            zone_sums, zone_counts, cz_array, cz_nodata, monthly_arrays,
+            monthly_nodata, zone_histograms, histogram_ranges, n_bins)
+
+    with tracing.span('write zone tables', 'io', path=target_csv), \
+            open(target_csv, 'w') as target_file:
+        target_file.write(f'cz_id,{",".join(MONTH_NAMES)}\n')
+        for cz_id in sorted(zone_sums):
+            row_data = [str(cz_id)]
+            for sums, counts in zip(zone_sums[cz_id], zone_counts[cz_id]):
+                # Zones without any valid values in a month get a 0.
+                row_data.append(str(sums / counts if counts else 0))
+            target_file.write(f'{",".join(row_data)}\n')
+    LOGGER.info(f"Wrote climate zones table to {target_csv}")
+
+    target_csv_base, target_csv_extension = os.path.splitext(target_csv)
+    if percentiles:
+        bin_edges = [_get_bin_edges(histogram_range, n_bins)
+                     for histogram_range in histogram_ranges]
+    for percentile in percentiles:
+        percentile_csv = (
+            f'{target_csv_base}-p{float(percentile):g}{target_csv_extension}')
+        with open(percentile_csv, 'w') as target_file:
+            target_file.write(f'cz_id,{",".join(MONTH_NAMES)}\n')
+            for cz_id in sorted(zone_histograms):
+                row_data = [str(cz_id)]
+                for histogram, month_bin_edges, histogram_range in zip(
+                        zone_histograms[cz_id], bin_edges, histogram_ranges):
+                    value = _histogram_percentile(
+                        histogram, month_bin_edges, float(percentile))
+                    if histogram_range and histogram.any():
+                        # Interpolating within a bin can overshoot the
+                        # values, such as when they are all equal.
+                        value = min(max(value, histogram_range['min']),
+                                    histogram_range['max'])
+                    row_data.append(str(value))
+                target_file.write(f'{",".join(row_data)}\n')
+        LOGGER.info(f"Wrote climate zones table to {percentile_csv}")
+
+    if remove_workspace:
+        shutil.rmtree(
+            temp_workspace,
+            onerror=lambda *args: LOGGER.exception("Error during rmtree"))
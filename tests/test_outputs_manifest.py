@@ -0,0 +1,81 @@
+"""Tests for the outputs manifests that let runs skip rewriting outputs."""
+import json
+import os
+
+import pytest
+
+from rapid_es import outputs_manifest
+
+
+def _write(path, contents):
+    with open(path, 'w') as file:
+        file.write(contents)
+    return str(path)
+
+
+def test_missing_manifest_is_not_current(tmp_path):
+    """A run without a manifest has to run."""
+    assert not outputs_manifest.outputs_are_current(str(tmp_path), 'key')
+
+
+def test_recorded_outputs_are_current(tmp_path):
+    """Unchanged outputs of a recorded run are current."""
+    manifest_dir = str(tmp_path / 'manifests')
+    output_paths = [_write(tmp_path / 'a.tif', 'a'),
+                    _write(tmp_path / 'b.csv', 'bb')]
+    outputs_manifest.record_outputs(manifest_dir, 'key', output_paths)
+
+    assert outputs_manifest.outputs_are_current(manifest_dir, 'key')
+    assert not outputs_manifest.outputs_are_current(manifest_dir, 'other')
+    with open(outputs_manifest.get_manifest_path(
+            manifest_dir, 'key')) as manifest_file:
+        assert sorted(json.load(manifest_file)) == sorted(output_paths)
+    # Only the manifest is left, with no temporary files.
+    assert os.listdir(manifest_dir) == ['key.json']
+
+
+def test_removed_output_is_not_current(tmp_path):
+    """A run is rerun once one of its outputs is removed."""
+    output_path = _write(tmp_path / 'a.tif', 'a')
+    outputs_manifest.record_outputs(str(tmp_path), 'key', [output_path])
+    os.remove(output_path)
+
+    assert not outputs_manifest.outputs_are_current(str(tmp_path), 'key')
+
+
+def test_changed_output_is_not_current(tmp_path):
+    """A run is rerun once one of its outputs changes size or mtime."""
+    output_path = _write(tmp_path / 'a.tif', 'a')
+    outputs_manifest.record_outputs(str(tmp_path), 'key', [output_path])
+
+    _write(output_path, 'changed')
+    assert not outputs_manifest.outputs_are_current(str(tmp_path), 'key')
+
+    outputs_manifest.record_outputs(str(tmp_path), 'key', [output_path])
+    assert outputs_manifest.outputs_are_current(str(tmp_path), 'key')
+    file_stat = os.stat(output_path)
+    os.utime(output_path, ns=(file_stat.st_atime_ns,
+                              file_stat.st_mtime_ns + 1_000_000_000))
+    assert not outputs_manifest.outputs_are_current(str(tmp_path), 'key')
+
+
+def test_runs_keep_their_own_manifests(tmp_path):
+    """Recording one run doesn't touch the manifest of another."""
+    a_path = _write(tmp_path / 'a.tif', 'a')
+    b_path = _write(tmp_path / 'b.tif', 'b')
+    outputs_manifest.record_outputs(str(tmp_path), 'a', [a_path])
+    outputs_manifest.record_outputs(str(tmp_path), 'b', [b_path])
+    os.remove(b_path)
+
+    assert outputs_manifest.outputs_are_current(str(tmp_path), 'a')
+    assert not outputs_manifest.outputs_are_current(str(tmp_path), 'b')
+
+
+def test_failed_record_leaves_no_manifest(tmp_path):
+    """A run whose outputs can't be recorded stays not current."""
+    missing_path = str(tmp_path / 'missing.tif')
+    with pytest.raises(FileNotFoundError):
+        outputs_manifest.record_outputs(
+            str(tmp_path / 'manifests'), 'key', [missing_path])
+    assert not outputs_manifest.outputs_are_current(
+        str(tmp_path / 'manifests'), 'key')
@@ -0,0 +1,167 @@
+"""Tests for summing the weights of overlapping servicesheds onto a grid."""
+import numpy
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+pytest.importorskip('pygeoprocessing')
+
+from osgeo import ogr  # noqa: E402
+from osgeo import osr  # noqa: E402
+
+from rapid_es import serviceshed_overlay  # noqa: E402
+
+# A grid that spans several 256x256 tiles, with partial tiles at its edges.
+N_COLS, N_ROWS = 600, 500
+GEOTRANSFORM = (440000.0, 1.0, 0.0, 4480000.0, 0.0, -1.0)
+EPSG = 32638  # UTM zone 38N
+
+
+def _get_srs():
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(EPSG)
+    return srs
+
+
+def _random_rectangles(n_rectangles, seed=0):
+    """Random rectangles in pixel coordinates, some off the grid.
+
+    Their edges are a quarter pixel off the pixel edges, so no pixel center
+    is ever on one.
+    """
+    random = numpy.random.default_rng(seed)
+    col_min = random.integers(-50, N_COLS, n_rectangles) + 0.25
+    row_min = random.integers(-50, N_ROWS, n_rectangles) + 0.25
+    return numpy.stack([
+        col_min, col_min + random.integers(1, 300, n_rectangles),
+        row_min, row_min + random.integers(1, 300, n_rectangles)], axis=1)
+
+
+def _expected(rectangles, weights):
+    """The sum of the weights of the rectangles with each pixel center."""
+    col_centers = numpy.arange(N_COLS) + 0.5
+    row_centers = numpy.arange(N_ROWS) + 0.5
+    expected_weights = numpy.zeros((N_ROWS, N_COLS))
+    coverage = numpy.zeros((N_ROWS, N_COLS), dtype=int)
+    for (col_min, col_max, row_min, row_max), weight in zip(
+            rectangles, weights):
+        inside = (
+            ((row_centers > row_min) & (row_centers < row_max))[:, None] &
+            ((col_centers > col_min) & (col_centers < col_max))[None, :])
+        expected_weights[inside] += weight
+        coverage[inside] += 1
+    return numpy.where(
+        coverage > 0, expected_weights, serviceshed_overlay.TARGET_NODATA)
+
+
+@pytest.fixture
+def base_raster_path(tmp_path):
+    path = str(tmp_path / 'base.tif')
+    raster = gdal.GetDriverByName('GTiff').Create(
+        path, N_COLS, N_ROWS, 1, gdal.GDT_Float32)
+    raster.SetGeoTransform(GEOTRANSFORM)
+    raster.SetProjection(_get_srs().ExportToWkt())
+    raster = None
+    return path
+
+
+def _write_servicesheds(path, rectangles, weights, types):
+    """Write rectangles in pixel coordinates as serviceshed polygons."""
+    x_origin, x_size, _, y_origin, _, y_size = GEOTRANSFORM
+    vector = ogr.GetDriverByName('GPKG').CreateDataSource(path)
+    layer = vector.CreateLayer('servicesheds', _get_srs(), ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn('weight', ogr.OFTReal))
+    layer.CreateField(ogr.FieldDefn('type', ogr.OFTString))
+    for (col_min, col_max, row_min, row_max), weight, serviceshed_type in (
+            zip(rectangles, weights, types)):
+        minx, maxx = [x_origin + col * x_size for col in (col_min, col_max)]
+        maxy, miny = [y_origin + row * y_size for row in (row_min, row_max)]
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(ogr.CreateGeometryFromWkt(
+            f'POLYGON (({minx} {miny}, {maxx} {miny}, {maxx} {maxy}, '
+            f'{minx} {maxy}, {minx} {miny}))'))
+        feature.SetField('weight', float(weight))
+        feature.SetField('type', serviceshed_type)
+        layer.CreateFeature(feature)
+    layer = None
+    vector = None
+    return path
+
+
+def _read(path):
+    raster = gdal.OpenEx(path, gdal.OF_RASTER)
+    array = raster.GetRasterBand(1).ReadAsArray()
+    raster = None
+    return array
+
+
+def test_overlapping_weights_are_summed(tmp_path, base_raster_path):
+    """Positive weights are summed, rasterizing each block once."""
+    rectangles = _random_rectangles(60)
+    weights = numpy.random.default_rng(1).uniform(1, 100, len(rectangles))
+    vector_path = _write_servicesheds(
+        str(tmp_path / 'servicesheds.gpkg'), rectangles, weights,
+        ['Hydropower'] * len(rectangles))
+    target_path = str(tmp_path / 'total.tif')
+
+    assert serviceshed_overlay.overlay_servicesheds(
+        base_raster_path, vector_path, 'weight', target_path) == [
+            target_path]
+    numpy.testing.assert_allclose(
+        _read(target_path), _expected(rectangles, weights), rtol=1e-6)
+
+
+def test_zero_and_negative_weights(tmp_path, base_raster_path):
+    """Pixels covered by weights that sum to zero aren't nodata."""
+    rectangles = _random_rectangles(60, seed=2)
+    weights = numpy.random.default_rng(3).uniform(-10, 10, len(rectangles))
+    weights[::5] = 0
+    types = ['Irrigation', 'Fish Farm'] * (len(rectangles) // 2)
+    vector_path = _write_servicesheds(
+        str(tmp_path / 'servicesheds.gpkg'), rectangles, weights, types)
+    target_path = str(tmp_path / 'total.tif')
+
+    target_paths = serviceshed_overlay.overlay_servicesheds(
+        base_raster_path, vector_path, 'weight', target_path,
+        type_field='type')
+
+    assert target_paths == [
+        target_path, str(tmp_path / 'total-fish-farm.tif'),
+        str(tmp_path / 'total-irrigation.tif')]
+    numpy.testing.assert_allclose(
+        _read(target_path), _expected(rectangles, weights),
+        rtol=1e-6, atol=1e-4)
+    for serviceshed_type, path in zip(
+            ['Fish Farm', 'Irrigation'], target_paths[1:]):
+        is_type = numpy.array(types) == serviceshed_type
+        numpy.testing.assert_allclose(
+            _read(path), _expected(rectangles[is_type], weights[is_type]),
+            rtol=1e-6, atol=1e-4)
+
+
+def test_bucket_by_block():
+    """Every serviceshed is bucketed with every block its envelope touches."""
+    x_origin, x_size, _, y_origin, _, y_size = GEOTRANSFORM
+    rectangles = _random_rectangles(200, seed=4)
+    envelopes = numpy.stack([
+        x_origin + rectangles[:, 0] * x_size,
+        x_origin + rectangles[:, 1] * x_size,
+        y_origin + rectangles[:, 3] * y_size,
+        y_origin + rectangles[:, 2] * y_size], axis=1)
+    side = 37  # Not a divisor of either side of the grid.
+    blocks = [
+        {'xoff': xoff, 'yoff': yoff, 'win_xsize': min(side, N_COLS - xoff),
+         'win_ysize': min(side, N_ROWS - yoff)}
+        for yoff in range(0, N_ROWS, side) for xoff in range(0, N_COLS, side)]
+
+    buckets = serviceshed_overlay._bucket_by_block(
+        envelopes, GEOTRANSFORM, (N_COLS, N_ROWS), blocks)
+
+    for offsets in blocks:
+        touching = numpy.flatnonzero(
+            (rectangles[:, 0] < offsets['xoff'] + offsets['win_xsize']) &
+            (rectangles[:, 1] > offsets['xoff']) &
+            (rectangles[:, 2] < offsets['yoff'] + offsets['win_ysize']) &
+            (rectangles[:, 3] > offsets['yoff']))
+        indices = buckets.get(
+            (offsets['yoff'], offsets['xoff']), numpy.array([], dtype=int))
+        numpy.testing.assert_array_equal(indices, touching)
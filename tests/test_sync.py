@@ -0,0 +1,201 @@
+"""Tests for copying new and changed outputs with ``rapid-es sync``."""
+import json
+import os
+
+import pytest
+
+from rapid_es import sync
+
+
+def _write(path, contents):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(contents)
+    return path
+
+
+def _read(path):
+    with open(path) as file:
+        return file.read()
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    """A source workspace with two outputs and an empty target."""
+    source_dir = str(tmp_path / 'workspace')
+    target_dir = str(tmp_path / 'drive')
+    os.makedirs(target_dir)
+    _write(os.path.join(source_dir, 'a.tif'), 'a')
+    _write(os.path.join(source_dir, 'tables', 'b.csv'), 'b')
+    return source_dir, os.path.realpath(target_dir)
+
+
+@pytest.fixture
+def checksums(monkeypatch):
+    """Count the files that are checksummed, by name."""
+    checksummed = []
+    checksum = sync._checksum
+
+    def _counting_checksum(path):
+        checksummed.append(os.path.basename(path))
+        return checksum(path)
+
+    monkeypatch.setattr(sync, '_checksum', _counting_checksum)
+    return checksummed
+
+
+def test_first_sync_copies_everything(dirs):
+    """Every matching file is copied to the top of an empty target."""
+    source_dir, target_dir = dirs
+    _write(os.path.join(source_dir, 'notes.txt'), 'not an output')
+
+    copied_paths = sync.sync(source_dir, target_dir)
+
+    assert copied_paths == [os.path.join(target_dir, 'a.tif'),
+                            os.path.join(target_dir, 'b.csv')]
+    assert _read(os.path.join(target_dir, 'a.tif')) == 'a'
+    assert _read(os.path.join(target_dir, 'b.csv')) == 'b'
+    assert sorted(os.listdir(target_dir)) == [
+        sync.MANIFEST_NAME, 'a.tif', 'b.csv']
+    with open(os.path.join(target_dir, sync.MANIFEST_NAME)) as manifest:
+        assert sorted(json.load(manifest)['files']) == ['a.tif', 'b.csv']
+
+
+def test_copies_over_file_anywhere_in_target(dirs):
+    """A file is copied over the file of the same name in a subdirectory."""
+    source_dir, target_dir = dirs
+    existing_path = _write(os.path.join(target_dir, 'rasters', 'a.tif'), 'x')
+
+    copied_paths = sync.sync(source_dir, target_dir)
+
+    assert existing_path in copied_paths
+    assert _read(existing_path) == 'a'
+    assert not os.path.exists(os.path.join(target_dir, 'a.tif'))
+
+
+def test_resync_uses_manifest(dirs, checksums):
+    """Unchanged files are skipped without being read again."""
+    source_dir, target_dir = dirs
+    sync.sync(source_dir, target_dir)
+    del checksums[:]
+
+    assert sync.sync(source_dir, target_dir) == []
+    assert checksums == []
+
+    # Unless every checksum is verified.
+    assert sync.sync(source_dir, target_dir, verify_all=True) == []
+    assert sorted(checksums) == ['a.tif', 'a.tif', 'b.csv', 'b.csv']
+
+
+def test_changed_size_is_copied(dirs):
+    """A source file that was rewritten with new contents is copied."""
+    source_dir, target_dir = dirs
+    sync.sync(source_dir, target_dir)
+    _write(os.path.join(source_dir, 'a.tif'), 'changed')
+
+    assert sync.sync(source_dir, target_dir) == [
+        os.path.join(target_dir, 'a.tif')]
+    assert _read(os.path.join(target_dir, 'a.tif')) == 'changed'
+
+
+def test_changed_mtime_is_checked(dirs, checksums):
+    """A touched source file is checksummed, and copied if it differs."""
+    source_dir, target_dir = dirs
+    sync.sync(source_dir, target_dir)
+    source_path = os.path.join(source_dir, 'a.tif')
+    source_stat = os.stat(source_path)
+    os.utime(source_path, ns=(source_stat.st_atime_ns,
+                              source_stat.st_mtime_ns + 1_000_000_000))
+    del checksums[:]
+
+    # The same contents aren't copied again, and only the source is read.
+    assert sync.sync(source_dir, target_dir) == []
+    assert checksums == ['a.tif']
+
+    # The same size with different contents is copied.
+    _write(source_path, 'z')
+    assert sync.sync(source_dir, target_dir) == [
+        os.path.join(target_dir, 'a.tif')]
+    assert _read(os.path.join(target_dir, 'a.tif')) == 'z'
+
+
+def test_changed_target_is_copied(dirs):
+    """A target copy that was changed since the last sync is replaced."""
+    source_dir, target_dir = dirs
+    sync.sync(source_dir, target_dir)
+    _write(os.path.join(target_dir, 'b.csv'), 'edited')
+
+    assert sync.sync(source_dir, target_dir) == [
+        os.path.join(target_dir, 'b.csv')]
+    assert _read(os.path.join(target_dir, 'b.csv')) == 'b'
+
+
+def test_checksum_mismatch_keeps_target(dirs, monkeypatch):
+    """A copy whose checksum doesn't match is discarded, with an error."""
+    source_dir, target_dir = dirs
+    target_path = _write(os.path.join(target_dir, 'a.tif'), 'old')
+    checksum = sync._checksum
+
+    def _corrupt_checksum(path):
+        if path.endswith(sync.TEMPORARY_SUFFIX):
+            return 'corrupt'
+        return checksum(path)
+
+    monkeypatch.setattr(sync, '_checksum', _corrupt_checksum)
+    with pytest.raises(OSError, match='checksum'):
+        sync.sync(source_dir, target_dir, n_workers=1)
+
+    assert _read(target_path) == 'old'
+    assert not any(filename.endswith(sync.TEMPORARY_SUFFIX)
+                   for filename in os.listdir(target_dir))
+    # The file that failed isn't recorded, so the next sync retries it.
+    monkeypatch.setattr(sync, '_checksum', checksum)
+    assert target_path in sync.sync(source_dir, target_dir)
+    assert _read(target_path) == 'a'
+
+
+def test_removes_temporary_copies(dirs):
+    """The unfinished copies of an interrupted sync are removed."""
+    source_dir, target_dir = dirs
+    temporary_paths = [
+        _write(os.path.join(target_dir, f'a.tif{sync.TEMPORARY_SUFFIX}'),
+               'partial'),
+        _write(os.path.join(
+            target_dir, 'rasters', f'c.tif{sync.TEMPORARY_SUFFIX}'), 'c')]
+
+    # Not on a dry run.
+    sync.sync(source_dir, target_dir, dry_run=True)
+    assert all(os.path.exists(path) for path in temporary_paths)
+
+    sync.sync(source_dir, target_dir)
+    assert not any(os.path.exists(path) for path in temporary_paths)
+    assert _read(os.path.join(target_dir, 'a.tif')) == 'a'
+
+
+def test_dry_run_copies_nothing(dirs):
+    """A dry run lists the files it would copy and writes nothing."""
+    source_dir, target_dir = dirs
+
+    assert sync.sync(source_dir, target_dir, dry_run=True) == [
+        os.path.join(target_dir, 'a.tif'), os.path.join(target_dir, 'b.csv')]
+    assert os.listdir(target_dir) == []
+
+
+def test_skips_caches(dirs):
+    """Files in cache directories are never synced."""
+    source_dir, target_dir = dirs
+    for dirname in sync.EXCLUDED_DIRNAMES:
+        _write(os.path.join(source_dir, dirname, 'cached.tif'), 'cached')
+
+    sync.sync(source_dir, target_dir)
+    assert not os.path.exists(os.path.join(target_dir, 'cached.tif'))
+
+
+def test_duplicate_names_fail(dirs):
+    """Several source files with the same name are an error."""
+    source_dir, target_dir = dirs
+    _write(os.path.join(source_dir, 'other', 'a.tif'), 'other a')
+
+    with pytest.raises(ValueError, match='same name'):
+        sync.sync(source_dir, target_dir)
+    assert os.listdir(target_dir) == []
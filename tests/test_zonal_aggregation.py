@@ -0,0 +1,151 @@
+"""Tests for the single-pass zonal percentiles of ``zonal_aggregation``."""
+import numpy
+import pytest
+
+pytest.importorskip('osgeo.gdal')
+pytest.importorskip('pygeoprocessing')
+
+from rapid_es import zonal_aggregation  # noqa: E402
+
+CZ_NODATA = 255
+MONTH_NODATA = -9999.0
+N_BINS = 200
+PERCENTILES = (0, 1, 10, 25, 50, 75, 90, 99, 100)
+
+
+def _month_values(random, month_index, strip_index, n_values):
+    """The values of one month in one strip, or ``None`` for nodata.
+
+    Months 0 and 1 get ranges that widen in both directions from strip to
+    strip, month 2 has no values, month 3 is constant and month 4 is
+    constant until its range widens in the last strips.  Month 5 has no
+    values until its last strip, and the rest are drifting normals.
+    """
+    scale = 10.0 ** strip_index
+    if month_index == 0:
+        return random.uniform(-scale, 2 * scale, n_values)
+    if month_index == 1:
+        # Alternately below and above everything so far.
+        if strip_index % 2:
+            return random.uniform(-3 * scale, -scale, n_values)
+        return random.uniform(scale, 3 * scale, n_values)
+    if month_index == 2:
+        return None
+    if month_index == 3:
+        return numpy.full(n_values, 7.5)
+    if month_index == 4:
+        if strip_index < 2:
+            return numpy.full(n_values, -2.0)
+        return random.normal(-2, scale, n_values)
+    if month_index == 5:
+        if strip_index < 3:
+            return None
+        return random.exponential(5, n_values)
+    return random.normal(month_index * strip_index, month_index, n_values)
+
+
+def _accumulate_strips(n_strips=4, strip_shape=(20, 50)):
+    """Accumulate strips of random zones and values, like blocks of rasters.
+
+    Returns:
+        tuple: The zone histograms, the histogram ranges and a dict that
+            maps each zone ID to a list of each month's valid values.
+    """
+    random = numpy.random.default_rng(0)
+    zone_sums = {}
+    zone_counts = {}
+    zone_histograms = {}
+    histogram_ranges = [{} for _ in range(12)]
+    zone_values = {}
+    for strip_index in range(n_strips):
+        cz_array = random.choice([1, 2, 3, CZ_NODATA], size=strip_shape)
+        monthly_arrays = []
+        for month_index in range(12):
+            values = _month_values(
+                random, month_index, strip_index, cz_array.size)
+            if values is None:
+                array = numpy.full(strip_shape, MONTH_NODATA)
+            else:
+                array = values.reshape(strip_shape)
+                # Some pixels of every month are nodata.
+                array[random.random(strip_shape) < 0.1] = MONTH_NODATA
+            monthly_arrays.append(array)
+            for cz_id in (1, 2, 3):
+                month_values = array[
+                    (cz_array == cz_id) & (array != MONTH_NODATA)]
+                zone_values.setdefault(cz_id, [[] for _ in range(12)])[
+                    month_index].extend(month_values)
+        zonal_aggregation._accumulate_zonal_sums(
+            zone_sums, zone_counts, cz_array, CZ_NODATA, monthly_arrays,
+            [MONTH_NODATA] * 12, zone_histograms, histogram_ranges, N_BINS)
+    return zone_histograms, histogram_ranges, zone_values
+
+
+def _estimate(histogram, histogram_range, percentile):
+    """Estimate a percentile as the percentile tables do."""
+    value = zonal_aggregation._histogram_percentile(
+        histogram, zonal_aggregation._get_bin_edges(histogram_range, N_BINS),
+        percentile)
+    if histogram_range and histogram.any():
+        value = min(max(value, histogram_range['min']),
+                    histogram_range['max'])
+    return value
+
+
+def test_percentiles_within_a_bin():
+    """Every estimated percentile is within one bin width of numpy's.
+
+    The histogram finds the bin of the value at rank ``percentile / 100 * n``
+    rather than interpolating between the two values around it, which is
+    numpy's ``inverted_cdf`` method.  Where values are sparse, such as in a
+    tail, numpy's default interpolation can be more than a bin away.
+    """
+    zone_histograms, histogram_ranges, zone_values = _accumulate_strips()
+
+    assert sorted(zone_histograms) == [1, 2, 3]
+    for cz_id, monthly_values in zone_values.items():
+        for month_index, values in enumerate(monthly_values):
+            histogram = zone_histograms[cz_id][month_index]
+            histogram_range = histogram_ranges[month_index]
+            assert histogram.sum() == len(values)
+            for percentile in PERCENTILES:
+                value = _estimate(histogram, histogram_range, percentile)
+                if not values:
+                    assert value == 0
+                    continue
+                expected = numpy.percentile(
+                    values, percentile, method='inverted_cdf')
+                assert abs(value - expected) <= histogram_range['width'], (
+                    f'zone {cz_id}, month {month_index}, p{percentile}')
+
+
+def test_bins_cover_every_value():
+    """The bins grow to cover every value, but no more than needed."""
+    _, histogram_ranges, zone_values = _accumulate_strips()
+
+    for month_index, histogram_range in enumerate(histogram_ranges):
+        values = numpy.concatenate([
+            monthly_values[month_index]
+            for monthly_values in zone_values.values()])
+        if month_index == 2:
+            # A month without any values never gets bins.
+            assert histogram_range == {}
+            continue
+        assert histogram_range['min'] == values.min()
+        assert histogram_range['max'] == values.max()
+        bin_edges = zonal_aggregation._get_bin_edges(histogram_range, N_BINS)
+        assert bin_edges[0] <= values.min()
+        assert bin_edges[-1] >= values.max()
+        if values.min() < values.max():
+            assert histogram_range['width'] * N_BINS <= 4 * (
+                values.max() - values.min())
+
+
+def test_constant_month_is_exact():
+    """A month whose values are all equal gets that value back."""
+    zone_histograms, histogram_ranges, _ = _accumulate_strips()
+
+    for histograms in zone_histograms.values():
+        for percentile in PERCENTILES:
+            assert _estimate(
+                histograms[3], histogram_ranges[3], percentile) == 7.5